@@ -1,11 +1,10 @@
 # prompt_manager.py
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+import time
+START_TIME = time.perf_counter()  # Reference point for the SIAMESE_STARTUP timings
+import json
 import pystray
 from pystray import MenuItem as item, Menu
 from PIL import Image as PILImage, ImageDraw
-import pyperclip
-import json
 import os
 import sys  # For executable detection in AutoStartManager
 import threading
@@ -14,11 +13,24 @@ import winreg
 from ctypes import windll, byref, sizeof, c_int
 from pathlib import Path
 
-# Configuration file paths - Updated for AppData persistence
-APPDATA_DIR = Path(os.getenv('APPDATA', Path.home() / 'AppData' / 'Roaming')) / 'PromptManager'
-CONFIG_PATH = APPDATA_DIR / 'prompts.json'
+from siamese_core import ConfigManager, SearchWorker, ClipboardService, Prompt, LazyModule, SessionProfiler, perf, APPDATA_DIR
+
+# Only needed once a window opens or a prompt is copied, after the tray icon is up
+tk = LazyModule('tkinter')
+ttk = LazyModule('tkinter.ttk')
+messagebox = LazyModule('tkinter.messagebox')
+filedialog = LazyModule('tkinter.filedialog')
+pyperclip = LazyModule('pyperclip')
+sqlite3 = LazyModule('sqlite3')
+
 ICON_PATH = Path(__file__).parent / 'icon.png'  # Keep icons local to script
 ICON_ICO_PATH = Path(__file__).parent / 'icon.ico'
+EXPORT_FILETYPES = [("JSON files", "*.json"), ("Compressed JSON", "*.json.gz *.json.xz"),
+                    ("NDJSON (one prompt per line)", "*.ndjson *.jsonl *.ndjson.gz *.ndjson.xz *.jsonl.gz *.jsonl.xz"),
+                    ("All files", "*.*")]
+MEMORY_BUDGETS_MB = (0, 16, 64, 256)  # Choices for the settings button; 0 keeps every body uncompressed
+TRAY_STATE_PATH = APPDATA_DIR / 'tray.json'  # Language, theme and pinned titles for a fast first menu
+STARTUP_MODE = os.getenv('SIAMESE_STARTUP', '')  # 1: print startup timings, exit: also quit once started
 
 class Localization:
     """Localization manager for multi-language support."""
@@ -40,15 +52,26 @@ class Localization:
                 'save_failed_msg': '无法保存配置文件', 'language_switch': '切换语言',
                 'theme_switch': '切换主题', 'switch_to_english': 'English', 'switch_to_chinese': '中文',
                 'switch_to_dark': '深色模式', 'switch_to_light': '浅色模式', 'language': '语言',
-                'theme': '主题', 'search': '搜索', 'search_placeholder': '输入关键词搜索...',
+                'theme': '主题', 'search': '搜索', 'search_placeholder': '输入关键词搜索...', 'fuzzy_search': '模糊搜索',
                 'pin': '置顶', 'unpin': '取消置顶', 'pinned': '已置顶', 'pin_limit_title': '置顶限制',
                 'pin_limit_message': '您最多只能置顶5个提示词。请选择要替换的：', 'replace': '替换',
-                'pin_limit_select': '请选择一个提示词进行替换', 'import_prompts': '导入提示词',
+                'pin_limit_select': '请选择一个提示词进行替换', 'import_prompts': '导入提示词', 'importing': '正在导入...',
                 'export_prompts': '导出提示词', 'import_success': '导入成功', 'import_failed': '导入失败',
                 'export_success': '导出成功', 'export_failed': '导出失败', 'invalid_format': '格式错误',
-                'file_too_large': '文件过大', 'prompt_too_large': '提示词过大 (最大 1 MB)',
+                'file_too_large': '文件过大', 'library_too_large': '提示词库已满', 'prompt_too_large': '提示词过大 (最大 1 MB)',
                 'auto_start': '开机自启动', 'auto_start_enabled': '已启用开机自启动',
-                'auto_start_disabled': '已禁用开机自启动'
+                'auto_start_disabled': '已禁用开机自启动', 'storage': '存储方式', 'storage_json': 'JSON 文件',
+                'storage_sqlite': 'SQLite 数据库', 'storage_switched': '存储方式已切换，提示词已迁移',
+                'storage_failed': '切换存储方式失败', 'duplicates': '重复的提示词:', 'dup_skip': '跳过',
+                'dup_merge': '合并', 'dup_keep': '保留两者', 'import_start': '导入',
+                'import_summary': '新增 {added} 个，跳过 {skipped} 个重复，合并 {merged} 个重复',
+                'duplicate_title': '重复的提示词', 'duplicate_msg': '已存在相同的提示词。仍要添加吗？',
+                'import_folder': '导入文件夹', 'folder_summary': '{files} 个文件，用时 {seconds:.1f} 秒（{rate:.0f} 个/秒）',
+                'failed_files': '未导入的文件:',
+                'tray_most_used': '托盘显示常用提示词', 'ipc_server': '脚本本地接口',
+                'ipc_failed': '无法启动本地接口',
+                'memory_budget': '内存预算', 'memory_off': '不限制', 'memory_stats': '搜索内存',
+                'perf_stats': '性能统计', 'perf_disabled': '性能统计未开启。请设置环境变量 SIAMESE_PERF=1 后启动程序。'
             },
             'en': {
                 'settings': 'Settings', 'app_title': 'Prompt Manager', 'tray_title': 'Prompt Manager',
@@ -65,15 +88,28 @@ class Localization:
                 'language_switch': 'Switch Language', 'theme_switch': 'Switch Theme',
                 'switch_to_english': 'English', 'switch_to_chinese': '中文', 'switch_to_dark': 'Dark Mode',
                 'switch_to_light': 'Light Mode', 'language': 'Language', 'theme': 'Theme', 'search': 'Search',
-                'search_placeholder': 'Search prompts...', 'pin': 'Pin', 'unpin': 'Unpin', 'pinned': 'Pinned',
+                'search_placeholder': 'Search prompts...', 'fuzzy_search': 'Fuzzy', 'pin': 'Pin', 'unpin': 'Unpin', 'pinned': 'Pinned',
                 'pin_limit_title': 'Pin Limit Reached', 'pin_limit_message': 'You can only pin 5 prompts. Select one to replace:',
                 'replace': 'Replace', 'pin_limit_select': 'Please select a prompt to replace',
-                'import_prompts': 'Import Prompts', 'export_prompts': 'Export Prompts',
+                'import_prompts': 'Import Prompts', 'export_prompts': 'Export Prompts', 'importing': 'Importing...',
                 'import_success': 'Import Successful', 'import_failed': 'Import Failed',
                 'export_success': 'Export Successful', 'export_failed': 'Export Failed',
-                'invalid_format': 'Invalid Format', 'file_too_large': 'File Too Large',
+                'invalid_format': 'Invalid Format', 'file_too_large': 'File Too Large', 'library_too_large': 'Library Full',
                 'prompt_too_large': 'Prompt too large (max 1 MB)', 'auto_start': 'Auto Start with Windows',
-                'auto_start_enabled': 'Auto-start enabled', 'auto_start_disabled': 'Auto-start disabled'
+                'auto_start_enabled': 'Auto-start enabled', 'auto_start_disabled': 'Auto-start disabled',
+                'storage': 'Storage', 'storage_json': 'JSON file', 'storage_sqlite': 'SQLite database',
+                'storage_switched': 'Storage switched and prompts migrated', 'storage_failed': 'Failed to switch storage',
+                'duplicates': 'Duplicates:', 'dup_skip': 'Skip', 'dup_merge': 'Merge', 'dup_keep': 'Keep both',
+                'import_start': 'Import',
+                'import_summary': '{added} added, {skipped} duplicates skipped, {merged} duplicates merged',
+                'duplicate_title': 'Duplicate Prompt', 'duplicate_msg': 'An identical prompt already exists. Add it anyway?',
+                'import_folder': 'Import Folder', 'folder_summary': '{files} files in {seconds:.1f} s ({rate:.0f} files/s)',
+                'failed_files': 'Files not imported:',
+                'tray_most_used': 'Most used prompts in tray', 'ipc_server': 'Local API for scripts',
+                'ipc_failed': 'Failed to start the local API',
+                'memory_budget': 'Memory budget', 'memory_off': 'Off', 'memory_stats': 'Search memory',
+                'perf_stats': 'Performance Stats',
+                'perf_disabled': 'Performance stats are off. Start the app with SIAMESE_PERF=1 to collect them.'
             }
         }
 
@@ -124,6 +160,24 @@ def set_window_icon(window, icon_path: Path) -> None:
     except Exception as e:
         print(f"Could not set window icon: {e}")
 
+def load_tray_state() -> dict:
+    """Read the tray cache written by the last run, or {} on first run."""
+    try:
+        with open(TRAY_STATE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_tray_state(state: dict) -> None:
+    try:
+        TRAY_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = TRAY_STATE_PATH.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, TRAY_STATE_PATH)
+    except OSError as e:
+        print(f"Tray state save error: {e}")
+
 def set_dpi_awareness() -> None:
     """Enable DPI awareness for sharper text on high-DPI displays."""
     try:
@@ -189,128 +243,64 @@ class AutoStartManager:
     def toggle(cls) -> bool:
         return cls.disable() if cls.is_enabled() else cls.enable()
 
-class ConfigManager:
-    """Configuration manager for prompts and settings."""
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB total limit
-    MAX_PROMPT_SIZE = 1 * 1024 * 1024  # 1 MB per prompt
-
-    def __init__(self):
-        self.config_path = CONFIG_PATH
-        self.settings = {'language': 'en', 'theme': 'dark'}
-        self.prompts = []
-        self._ensure_dir()
-        self.load_config()
-
-    def _ensure_dir(self) -> None:
-        """Ensure config directory exists."""
-        self.config_path.parent.mkdir(parents=True, exist_ok=True)
-
-    def load_config(self) -> None:
-        if self.config_path.exists():
-            try:
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                self.settings = data.get('settings', self.settings)
-                self.prompts = []
-                for p in data.get('prompts', []):
-                    if isinstance(p, dict) and len(p.get('content', '')) <= self.MAX_PROMPT_SIZE:
-                        p['pinned'] = p.get('pinned', False)
-                        self.prompts.append(p)
-            except Exception as e:
-                print(f"Config load error: {e}")
-                messagebox.showerror("Load Error", f"Failed to load config: {e}")
-
-    def save_config(self) -> None:
-        try:
-            total_size = sum(len(p.get('content', '')) for p in self.prompts)
-            if total_size > self.MAX_FILE_SIZE:
-                raise ValueError(f"file_too_large (Total: {total_size // (1024*1024)} MB exceeds {self.MAX_FILE_SIZE // (1024*1024)} MB)")
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump({'settings': self.settings, 'prompts': self.prompts}, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Save error: {e}")
-            messagebox.showerror("Save Error", f"Failed to save config: {e}")
-
-    def import_prompts(self, file_path: str) -> tuple[bool, str]:
-        """Import prompts from JSON file with validation."""
+class GuiDispatcher:
+    """Hands (func, args, kwargs) callbacks from any thread to the Tk thread.
+
+    Other threads never call into Tk: such a call waits until the Tk thread takes it, so a
+    worker the Tk thread is itself waiting for (the writer, during a flush) would deadlock.
+    put() from another thread only queues the item, and the Tk thread polls the queue every
+    POLL_MS with after(), running everything queued in one pass. A put() on the Tk thread
+    schedules a drain with after_idle() instead. Queue depth and queue-to-run wait are
+    recorded in the perf stats.
+    """
+    POLL_MS = 15  # Longest a callback from another thread waits while the Tk thread is idle
+
+    def __init__(self, root):
+        self.root = root
+        self._items = queue.Queue()
+        self._tk_thread = threading.get_ident()
+        self._drain_pending = False  # An after_idle() drain is scheduled; Tk thread only
+        root.after_idle(self._poll)  # Anything queued before mainloop started, then every POLL_MS
+
+    def put(self, item: tuple) -> None:
+        self._items.put((time.perf_counter(), item))
+        if threading.get_ident() != self._tk_thread or self._drain_pending:
+            return  # The next poll, or the drain already scheduled, runs it
+        self._drain_pending = True
         try:
-            if os.path.getsize(file_path) > self.MAX_FILE_SIZE:
-                raise ValueError("file_too_large")
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            if not isinstance(data, dict) or 'prompts' not in data or not isinstance(data['prompts'], list):
-                raise ValueError("invalid_format")
-            for prompt in data['prompts']:
-                if not isinstance(prompt, dict) or 'title' not in prompt or 'content' not in prompt or not isinstance(prompt['title'], str) or not isinstance(prompt['content'], str):
-                    raise ValueError("invalid_format")
-                if len(prompt['content']) > self.MAX_PROMPT_SIZE:
-                    raise ValueError("prompt_too_large")
-                prompt['pinned'] = prompt.get('pinned', False)
-                self.prompts.append(prompt)
-            self.save_config()
-            return True, "import_success"
-        except ValueError as e:
-            return False, str(e)
-        except json.JSONDecodeError:
-            return False, "invalid_format"
-        except Exception as e:
-            print(f"Import error: {e}")
-            return False, "import_failed"
-
-    def export_prompts(self, file_path: str) -> tuple[bool, str]:
-        """Export prompts to JSON file."""
+            self.root.after_idle(self._drain)
+        except tk.TclError as e:
+            self._drain_pending = False
+            print(f"GUI wakeup error: {e}")
+
+    def _poll(self):
+        if not self._items.empty():
+            self._drain()
         try:
-            export_data = {'settings': self.settings, 'prompts': self.prompts}
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, ensure_ascii=False, indent=2)
-            return True, "export_success"
-        except Exception as e:
-            print(f"Export error: {e}")
-            return False, "export_failed"
-
-    def add_prompt(self, title: str, content: str, pinned: bool = False) -> None:
-        if len(content) > self.MAX_PROMPT_SIZE:
-            raise ValueError("prompt_too_large")
-        self.prompts.append({'title': title, 'content': content, 'pinned': pinned})
-        self.save_config()
-
-    def update_prompt(self, index: int, title: str, content: str, pinned: bool = None) -> None:
-        if 0 <= index < len(self.prompts):
-            if len(content) > self.MAX_PROMPT_SIZE:
-                raise ValueError("prompt_too_large")
-            self.prompts[index]['title'] = title
-            self.prompts[index]['content'] = content
-            if pinned is not None:
-                self.prompts[index]['pinned'] = pinned
-            self.save_config()
-
-    def delete_prompt(self, index: int) -> None:
-        if 0 <= index < len(self.prompts):
-            del self.prompts[index]
-            self.save_config()
-
-    def get_prompt(self, index: int):
-        if 0 <= index < len(self.prompts):
-            return self.prompts[index]
-        return None
-
-    def toggle_pin(self, index: int) -> bool:
-        if 0 <= index < len(self.prompts):
-            self.prompts[index]['pinned'] = not self.prompts[index].get('pinned', False)
-            self.save_config()
-            return self.prompts[index]['pinned']
-        return False
-
-    def switch_language(self) -> None:
-        self.settings['language'] = 'en' if self.settings['language'] == 'zh' else 'zh'
-        self.save_config()
-
-    def switch_theme(self) -> None:
-        self.settings['theme'] = 'dark' if self.settings['theme'] == 'light' else 'light'
-        self.save_config()
+            self.root.after(self.POLL_MS, self._poll)
+        except tk.TclError as e:
+            print(f"GUI poll error: {e}")  # Root destroyed; the app is exiting
+
+    def _drain(self):
+        self._drain_pending = False  # Items queued from here on schedule a new drain
+        perf.record('gui_queue_depth', self._items.qsize(), unit='items')
+        while True:
+            try:
+                queued, (func, args, kwargs) = self._items.get_nowait()
+            except queue.Empty:
+                return
+            perf.record('gui_queue_wait', time.perf_counter() - queued)
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                print(f"GUI callback error: {e}")
 
 class PromptManagerWindow:
     """Unified window for managing prompts."""
+    ROW_HEIGHT = 28
+    VIRTUAL_THRESHOLD = 500  # Above this many results only the visible rows are materialized
+    OVERSCAN = 20  # Rows kept above and below the visible window in virtual mode
+
     def __init__(self, app):
         self.app = app
         self.loc = app.loc
@@ -337,9 +327,12 @@ class PromptManagerWindow:
         main_frame.columnconfigure(0, weight=1)  # For search expand
         ttk.Label(search_frame, text=self.loc.get('search'), font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(0, 8))
         self.search_var = tk.StringVar()
-        self.search_var.trace('w', lambda *args: self.refresh_prompts())
+        self.search_var.trace('w', lambda *args: self.on_query_changed())
         search_entry = ttk.Entry(search_frame, textvariable=self.search_var, font=('Segoe UI', 10))
         search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.fuzzy_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_frame, text=self.loc.get('fuzzy_search'), variable=self.fuzzy_var,
+                        command=self.refresh_prompts).pack(side=tk.LEFT, padx=(8, 0))
 
         # Treeview with larger font and columns
         columns = (self.loc.get('title'), self.loc.get('content_preview'), self.loc.get('pinned'))
@@ -353,13 +346,15 @@ class PromptManagerWindow:
 
         # Apply theme and row alternation setup
         style = ttk.Style()
-        style.configure("Treeview", font=('Segoe UI', 10), rowheight=28)
+        style.configure("Treeview", font=('Segoe UI', 10), rowheight=self.ROW_HEIGHT)
         style.configure("Treeview.Heading", font=('Segoe UI', 10, 'bold'))
         self.app.apply_theme_to_treeview(self.tree)
 
-        # Scrollbar
-        scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscroll=scrollbar.set)
+        # Scrollbar, proxied so virtual mode can map it onto the full result list
+        self.scrollbar = scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.tree.configure(yscroll=self.on_tree_scroll)
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<Configure>', lambda event: self._schedule_render())
         self.tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
 
@@ -372,41 +367,123 @@ class PromptManagerWindow:
             (self.loc.get('delete'), self.delete_selected),
             (self.loc.get('pin'), self.toggle_pin_selected),
             (self.loc.get('import_prompts'), self.import_prompts),
+            (self.loc.get('import_folder'), self.import_folder),
             (self.loc.get('export_prompts'), self.export_prompts),
             (self.loc.get('settings'), self.open_settings)
         ]
         for i, (text, cmd) in enumerate(buttons):
             ttk.Button(btn_frame, text=text, command=cmd).grid(row=i//4, column=i%4, padx=6, pady=5)  # 4 per row
 
+        self._rendered = None  # (config version, query) currently shown in the tree
+        self._results = []  # Prompt indices matching the current query, in display order
+        self._cells = {}  # iid -> (values, tags) of each materialized row
+        self._order = []  # Materialized iids, top to bottom
+        self._top = 0  # Result row shown at the top of the tree in virtual mode
+        self._window_start = 0  # Result row of the first materialized item
+        self._selected = None  # Last selected iid, kept across virtual scrolling
+        self._render_pending = False
+        self._requested = None  # Key of the search most recently handed to the worker
+        self._debounce = None
         self.refresh_prompts()
+        self.window.bind('<FocusIn>', self.on_focus_in)
         self.window.protocol("WM_DELETE_WINDOW", self.on_close)
 
+    def error_text(self, key: str) -> str:
+        """Localized text for an error key from siamese_core, with the limit a size error hit."""
+        text = self.loc.get(key)
+        limit = {'file_too_large': ConfigManager.MAX_IMPORT_SIZE, 'library_too_large': ConfigManager.MAX_FILE_SIZE}.get(key)
+        return f"{text} (Max: {limit // (1024 * 1024)} MB)" if limit else text  # prompt_too_large names its own
+
+    def on_focus_in(self, event=None):
+        if event is not None and event.widget is not self.window:
+            return  # <FocusIn> on the toplevel also fires for every child widget that takes focus
+        # Pick up edits made by another instance or by hand while the window was in the background
+        if self.app.config.reload_if_changed():
+            self.refresh_prompts()
+            self.app.update_tray_menu()
+
     def import_prompts(self):
         file_path = filedialog.askopenfilename(
             parent=self.window,
             title=self.loc.get('import_prompts'),
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=[("All supported", "*.json *.ndjson *.jsonl *.gz *.xz")] + EXPORT_FILETYPES
         )
-        if file_path:
-            success, message_key = self.app.config.import_prompts(file_path)
+        if not file_path:
+            return
+        self._run_import(self.loc.get('import_prompts'), os.path.basename(file_path),
+                         lambda mode, progress: self.app.config.import_prompts(file_path, progress=progress, duplicates=mode))
+
+    def import_folder(self):
+        folder = filedialog.askdirectory(parent=self.window, title=self.loc.get('import_folder'))
+        if not folder:
+            return
+        self._run_import(self.loc.get('import_folder'), os.path.basename(folder) or folder,
+                         lambda mode, progress: self.app.config.import_folder(folder, progress=progress, duplicates=mode))
+
+    def _run_import(self, title, source, do_import):
+        """Ask for the duplicate mode, then run `do_import(mode, progress)` off the Tk thread."""
+        dialog = tk.Toplevel(self.window)
+        dialog.title(title)
+        dialog.geometry('420x170')
+        dialog.transient(self.window)
+        dialog.grab_set()
+        set_window_icon(dialog, ICON_PATH)
+        self.app.apply_theme_to_window(dialog)
+        dialog.update()
+        set_window_titlebar_color(dialog, self.app.theme.get('titlebar'))
+        options = ttk.Frame(dialog)
+        options.pack(pady=(20, 8), padx=15, fill=tk.X)
+        ttk.Label(options, text=self.loc.get('duplicates'), font=('Segoe UI', 10)).pack(side=tk.LEFT)
+        mode_var = tk.StringVar(value='skip')
+        for mode in ('skip', 'merge', 'keep'):
+            ttk.Radiobutton(options, text=self.loc.get(f'dup_{mode}'), variable=mode_var, value=mode).pack(side=tk.LEFT, padx=(10, 0))
+        status = ttk.Label(dialog, text='', font=('Segoe UI', 10))
+        status.pack(pady=(0, 8), padx=15, anchor=tk.W)
+        bar = ttk.Progressbar(dialog, mode='determinate', maximum=1.0)
+        bar.pack(padx=15, fill=tk.X)
+
+        def on_progress(count, fraction):
+            if dialog.winfo_exists():
+                bar['value'] = fraction
+                status.config(text=f"{self.loc.get('importing')} {count}")
+
+        def on_done(success, message_key, summary):
+            dialog.destroy()
             if success:
-                messagebox.showinfo(self.loc.get('import_success'), f"{self.loc.get('import_success')}! Imported from {os.path.basename(file_path)}")
+                message = f"{self.loc.get('import_success')}! Imported from {source}\n" + self.loc.get('import_summary').format(**summary)
+                if 'files' in summary:  # Folder import
+                    message += '\n' + self.loc.get('folder_summary').format(
+                        files=summary['files'], seconds=summary['seconds'], rate=summary['files'] / max(summary['seconds'], 1e-6))
+                    if summary['failed']:
+                        failed = [f"{name}: {self.loc.get(key)}" for name, key in summary['failed'][:10]]
+                        if len(summary['failed']) > 10:
+                            failed.append(f"... +{len(summary['failed']) - 10}")
+                        message += f"\n\n{self.loc.get('failed_files')}\n" + '\n'.join(failed)
+                messagebox.showinfo(self.loc.get('import_success'), message)
                 self.refresh_prompts()
                 self.app.update_tray_menu()
             else:
-                error_msg = self.loc.get(message_key)
-                if message_key == "file_too_large":
-                    error_msg += f" (Max: {ConfigManager.MAX_FILE_SIZE // (1024*1024)} MB)"
-                elif message_key == "prompt_too_large":
-                    error_msg += f" (Max: {ConfigManager.MAX_PROMPT_SIZE // (1024*1024)} MB)"
-                messagebox.showerror(self.loc.get('import_failed'), error_msg)
+                messagebox.showerror(self.loc.get('import_failed'), self.error_text(message_key))
+
+        def run(mode):
+            result = do_import(mode, lambda count, fraction: self.app.gui_queue.put((on_progress, (count, fraction), {})))
+            self.app.gui_queue.put((on_done, result, {}))
+
+        def start():
+            start_btn.config(state=tk.DISABLED)
+            status.config(text=self.loc.get('importing'))
+            dialog.protocol("WM_DELETE_WINDOW", lambda: None)  # Runs to completion; the import is all-or-nothing
+            threading.Thread(target=run, args=(mode_var.get(),), daemon=True).start()
+
+        start_btn = ttk.Button(dialog, text=self.loc.get('import_start'), command=start)
+        start_btn.pack(pady=10, padx=15, anchor=tk.E)
 
     def export_prompts(self):
         file_path = filedialog.asksaveasfilename(
             parent=self.window,
             title=self.loc.get('export_prompts'),
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=EXPORT_FILETYPES
         )
         if file_path:
             success, message_key = self.app.config.export_prompts(file_path)
@@ -428,10 +505,10 @@ class PromptManagerWindow:
         set_window_titlebar_color(dialog, self.app.theme.get('titlebar'))
 
         ttk.Label(dialog, text=self.loc.get('pin_limit_message'), wraplength=560, font=('Segoe UI', 10)).pack(pady=15, padx=15)
-        pinned_prompts = [(i, p) for i, p in enumerate(self.app.config.prompts) if p.get('pinned', False)]
+        pinned_prompts = self.app.config.pinned_prompts()
         selected_idx = tk.StringVar(value="-1")
-        for idx, prompt in pinned_prompts:
-            rb = ttk.Radiobutton(dialog, text=prompt['title'], variable=selected_idx, value=str(idx))
+        for prompt in pinned_prompts:
+            rb = ttk.Radiobutton(dialog, text=prompt.title, variable=selected_idx, value=str(prompt.id))
             rb.pack(anchor=tk.W, padx=25, pady=3)
 
         btn_frame = ttk.Frame(dialog)
@@ -457,72 +534,197 @@ class PromptManagerWindow:
         dialog.wait_window()
         return result
 
+    def on_query_changed(self):
+        # Debounce keystrokes; the search itself runs on the app's SearchWorker
+        if self._debounce is not None:
+            self.window.after_cancel(self._debounce)
+        delay = self.app.config.settings.get('search_debounce_ms', 150)
+        self._debounce = self.window.after(delay, self.refresh_prompts)
+
+    @perf.timed('refresh_prompts')
     def refresh_prompts(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        self.app.config.load_config()  # Reload to ensure persistence
-        query = self.search_var.get().lower()
+        self._debounce = None
+        requested = (self.app.config.version, self.search_var.get(), self.fuzzy_var.get())
+        if requested == self._requested:
+            return
+        self._requested = requested
+        self.app.search_worker.submit(requested[1], requested[2], lambda results: self.show_results(requested, results))
+
+    @perf.timed('show_results')
+    def show_results(self, rendered, results):
+        if not self.window.winfo_exists() or rendered != self._requested:
+            return  # Window closed or a newer search is on its way
+        if rendered[0] != self.app.config.version:
+            self.refresh_prompts()  # The library changed under the search; results may be stale
+            return
+        if self._rendered is None or rendered[1:] != self._rendered[1:]:
+            self._top = 0  # New query: start from the top; edits keep the scroll position
+        self._rendered = rendered
         colors = self.app.theme.colors[self.app.theme.theme]
         even_color = colors['row_alt_bg']
         odd_color = colors['tree_bg']
         self.tree.tag_configure('evenrow', background=even_color)
         self.tree.tag_configure('oddrow', background=odd_color)
-        for idx, prompt in enumerate(self.app.config.prompts):
-            if query and query not in prompt['title'].lower() and query not in prompt['content'].lower():
+        self._results = results
+        self._render_rows()
+
+    def _virtual(self) -> bool:
+        return len(self._results) > self.VIRTUAL_THRESHOLD
+
+    def _visible_rows(self) -> int:
+        height = self.tree.winfo_height()
+        return max(1, height // self.ROW_HEIGHT - 1) if height > 1 else int(self.tree.cget('height'))
+
+    def _row(self, row: int, prompt: Prompt) -> tuple:
+        preview = prompt.preview_text()
+        if prompt.content_length() > ConfigManager.PREVIEW_CHARS:
+            preview += '...'  # Longer truncation
+        pinned_status = "✓" if prompt.pinned else ""
+        tags = ('evenrow',) if row % 2 == 0 else ('oddrow',)
+        return str(prompt.id), (prompt.title, preview, pinned_status), tags
+
+    def _render_rows(self):
+        """Materialize the rows to show: all results, or the visible window plus overscan."""
+        self._render_pending = False
+        results = self._results
+        if self._virtual():
+            visible = self._visible_rows()
+            self._top = max(0, min(self._top, len(results) - visible))
+            start = max(0, self._top - self.OVERSCAN)
+            window = results[start:self._top + visible + self.OVERSCAN]
+        else:
+            start, window = 0, results
+        self._window_start = start
+        prompts = self.app.config.prompts
+        self._apply_rows([self._row(start + i, prompts[prompt_id]) for i, prompt_id in enumerate(window)
+                          if prompt_id in prompts])  # Skip rows deleted before fresh results arrive
+        if self._virtual():
+            self.tree.yview_moveto((self._top - start) / len(window))
+        else:
+            self.scrollbar.set(*self.tree.yview())
+
+    def _apply_rows(self, desired: list):
+        """Turn the tree into `desired` with the fewest inserts, deletes, moves and updates."""
+        wanted = {iid for iid, _, _ in desired}
+        stale = [iid for iid in self._order if iid not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+            for iid in stale:
+                del self._cells[iid]
+        current = [iid for iid in self._order if iid in wanted]
+        moved = set()
+        j = 0
+        for pos, (iid, values, tags) in enumerate(desired):
+            while j < len(current) and current[j] in moved:
+                j += 1
+            if j < len(current) and current[j] == iid:
+                j += 1
+            elif iid in self._cells:
+                self.tree.move(iid, '', pos)
+                moved.add(iid)
+            else:
+                self.tree.insert('', pos, iid=iid, values=values, tags=tags)
+                self._cells[iid] = (values, tags)
                 continue
-            preview = prompt['content'][:100] + '...' if len(prompt['content']) > 100 else prompt['content']  # Longer truncation
-            pinned_status = "✓" if prompt.get('pinned', False) else ""
-            tags = ('evenrow',) if idx % 2 == 0 else ('oddrow',)
-            self.tree.insert('', tk.END, values=(prompt['title'], preview, pinned_status), iid=str(idx), tags=tags)
+            if self._cells[iid] != (values, tags):
+                self.tree.item(iid, values=values, tags=tags)
+                self._cells[iid] = (values, tags)
+        self._order = [iid for iid, _, _ in desired]
+        if self._selected in self._cells and self._selected not in self.tree.selection():
+            self.tree.selection_set(self._selected)
+
+    def _schedule_render(self):
+        if self._virtual() and not self._render_pending:
+            self._render_pending = True
+            self.window.after_idle(self._render_rows)
+
+    def on_tree_scroll(self, first, last):
+        if not self._virtual():
+            self.scrollbar.set(first, last)
+            return
+        # Translate the materialized window's view back onto the full result list
+        count, total = len(self._order), len(self._results)
+        top = self._window_start + round(float(first) * count)
+        bottom = self._window_start + float(last) * count
+        self._top = top
+        self.scrollbar.set(top / total, bottom / total)
+        near_top = self._window_start > 0 and top - self._window_start < self.OVERSCAN // 2
+        near_bottom = self._window_start + count < total and self._window_start + count - bottom < self.OVERSCAN // 2
+        if near_top or near_bottom:
+            self._schedule_render()  # Slide the window before native scrolling runs out of rows
+
+    def on_scrollbar(self, *args):
+        if not self._virtual():
+            self.tree.yview(*args)
+            return
+        visible = self._visible_rows()
+        if args[0] == 'moveto':
+            self._top = int(float(args[1]) * len(self._results))
+        elif args[0] == 'scroll':
+            self._top += int(args[1]) * (visible if args[2] == 'pages' else 1)
+        self._render_rows()
+
+    def on_select(self, event=None):
+        selection = self.tree.selection()
+        if selection:
+            self._selected = selection[0]
+
+    def _selected_id(self):
+        """Id of the selected prompt, even if virtual scrolling unmaterialized its row."""
+        selection = self.tree.selection()
+        if selection:
+            return int(selection[0])
+        if self._selected is not None and int(self._selected) in self.app.config.prompts:
+            return int(self._selected)
+        return None
 
     def add_prompt(self):
         self.create_edit_dialog()
 
     def edit_selected(self):
-        selection = self.tree.selection()
-        if not selection:
+        prompt_id = self._selected_id()
+        if prompt_id is None:
             messagebox.showwarning(self.loc.get('no_selection'), self.loc.get('select_edit'))
             return
-        idx = int(selection[0])
-        prompt = self.app.config.prompts[idx]
-        self.create_edit_dialog(idx, prompt['title'], prompt['content'])
+        prompt = self.app.config.get_prompt(prompt_id)
+        self.app.config.record_use(prompt_id)
+        self.create_edit_dialog(prompt_id, prompt['title'], prompt['content'])
 
     def delete_selected(self):
-        selection = self.tree.selection()
-        if not selection:
+        prompt_id = self._selected_id()
+        if prompt_id is None:
             messagebox.showwarning(self.loc.get('no_selection'), self.loc.get('select_delete'))
             return
         if messagebox.askyesno(self.loc.get('confirm_delete'), self.loc.get('delete_confirm_msg')):
-            idx = int(selection[0])
-            self.app.config.delete_prompt(idx)
+            self._selected = None
+            self.tree.selection_remove(*self.tree.selection())
+            self.app.config.delete_prompt(prompt_id)
             self.refresh_prompts()
             self.app.update_tray_menu()
 
     def toggle_pin_selected(self):
-        selection = self.tree.selection()
-        if not selection:
+        prompt_id = self._selected_id()
+        if prompt_id is None:
             messagebox.showwarning(self.loc.get('no_selection'), "Please select a prompt to pin/unpin")
             return
-        idx = int(selection[0])
-        prompt = self.app.config.prompts[idx]
-        if prompt.get('pinned', False):
-            self.app.config.toggle_pin(idx)
+        prompt = self.app.config.prompts[prompt_id]
+        if prompt.pinned:
+            self.app.config.toggle_pin(prompt_id)
         else:
-            pinned_count = sum(1 for p in self.app.config.prompts if p.get('pinned', False))
-            if pinned_count >= 5:
-                replace_idx = self.show_pin_limit_dialog()
-                if replace_idx is not None:
-                    self.app.config.toggle_pin(replace_idx)
-                    self.app.config.toggle_pin(idx)
+            if self.app.config.pinned_count() >= ConfigManager.MAX_PINNED:
+                replace_id = self.show_pin_limit_dialog()
+                if replace_id is not None:
+                    self.app.config.toggle_pin(replace_id)
+                    self.app.config.toggle_pin(prompt_id)
                 return
-            self.app.config.toggle_pin(idx)
+            self.app.config.toggle_pin(prompt_id)
         self.refresh_prompts()
         self.app.update_tray_menu()
 
     def open_settings(self):
         dialog = tk.Toplevel(self.window)
         dialog.title(self.loc.get('settings'))
-        dialog.geometry('450x300')  # Increased height
+        dialog.geometry('450x600')  # Increased height
         dialog.resizable(True, True)  # Made resizable
         dialog.transient(self.window)
         dialog.grab_set()
@@ -546,6 +748,17 @@ class PromptManagerWindow:
             set_window_titlebar_color(self.window, self.app.theme.get('titlebar'))
             dialog.destroy()
 
+        def on_storage_toggle():
+            storage = 'json' if self.app.config.settings.get('storage', 'json') == 'sqlite' else 'sqlite'
+            try:
+                self.app.config.set_storage(storage)
+            except (sqlite3.Error, OSError) as e:
+                messagebox.showerror(self.loc.get('settings'), f"{self.loc.get('storage_failed')}: {e}")
+                return
+            messagebox.showinfo(self.loc.get('settings'), self.loc.get('storage_switched'))
+            update_storage_btn()
+            self.refresh_prompts()
+
         def on_auto_start_toggle():
             success = AutoStartManager.toggle()
             if success:
@@ -567,16 +780,88 @@ class PromptManagerWindow:
         auto_start_btn = ttk.Button(dialog, text="", command=on_auto_start_toggle)
         auto_start_btn.pack(pady=12, padx=25, fill=tk.X)
 
+        storage_btn = ttk.Button(dialog, text="", command=on_storage_toggle)
+        storage_btn.pack(pady=12, padx=25, fill=tk.X)
+
+        def on_memory_budget():
+            current = self.app.config.settings.get('memory_budget_mb', 0)
+            choices = MEMORY_BUDGETS_MB
+            self.app.config.set_memory_budget(choices[(choices.index(current) + 1) % len(choices)] if current in choices else 0)
+            update_memory_btn()
+
+        def on_most_used_toggle():
+            self.app.config.set_setting('tray_most_used', not self.app.config.settings.get('tray_most_used', False))
+            self.app.update_tray_menu()
+            update_most_used_btn()
+
+        most_used_btn = ttk.Button(dialog, text="", command=on_most_used_toggle)
+        most_used_btn.pack(pady=12, padx=25, fill=tk.X)
+
+        def update_most_used_btn():
+            status = "✓" if self.app.config.settings.get('tray_most_used', False) else "✗"
+            most_used_btn.config(text=f"{self.loc.get('tray_most_used')} [{status}]")
+
+        def on_ipc_toggle():
+            enabled = not self.app.config.settings.get('ipc_server', False)
+            try:
+                self.app.start_ipc_server() if enabled else self.app.stop_ipc_server()
+            except OSError as e:
+                messagebox.showerror(self.loc.get('settings'), f"{self.loc.get('ipc_failed')}: {e}")
+                return
+            self.app.config.set_setting('ipc_server', enabled)
+            update_ipc_btn()
+
+        ipc_btn = ttk.Button(dialog, text="", command=on_ipc_toggle)
+        ipc_btn.pack(pady=12, padx=25, fill=tk.X)
+
+        def update_ipc_btn():
+            status = "✓" if self.app.config.settings.get('ipc_server', False) else "✗"
+            ipc_btn.config(text=f"{self.loc.get('ipc_server')} [{status}]")
+
+        memory_btn = ttk.Button(dialog, text="", command=on_memory_budget)
+        memory_btn.pack(pady=12, padx=25, fill=tk.X)
+
+        def update_memory_btn():
+            budget = self.app.config.settings.get('memory_budget_mb', 0)
+            memory_btn.config(text=f"{self.loc.get('memory_budget')}: {f'{budget} MB' if budget else self.loc.get('memory_off')}")
+
+        def update_storage_btn():
+            storage = self.app.config.settings.get('storage', 'json')
+            storage_btn.config(text=f"{self.loc.get('storage')}: {self.loc.get('storage_' + storage)}")
+
         def update_auto_start_btn():
             is_enabled = AutoStartManager.is_enabled()
             status = "✓" if is_enabled else "✗"
             auto_start_btn.config(text=f"{self.loc.get('auto_start')} [{status}]")
 
         update_auto_start_btn()
+        update_storage_btn()
+        update_memory_btn()
+        update_most_used_btn()
+        update_ipc_btn()
+
+        ttk.Button(dialog, text=self.loc.get('perf_stats'), command=self.show_perf_stats).pack(pady=12, padx=25, fill=tk.X)
 
-    def create_edit_dialog(self, index=None, default_title='', default_content=''):
+    def show_perf_stats(self):
+        dialog = tk.Toplevel(self.window)
+        dialog.title(self.loc.get('perf_stats'))
+        dialog.geometry('640x420')
+        dialog.transient(self.window)
+        set_window_icon(dialog, ICON_PATH)
+        self.app.apply_theme_to_window(dialog)
+        dialog.update()
+        set_window_titlebar_color(dialog, self.app.theme.get('titlebar'))
+        text = tk.Text(dialog, font=('Consolas', 10), wrap=tk.NONE)
+        text.insert('1.0', perf.report() if perf.enabled else self.loc.get('perf_disabled'))
+        memory = self.app.config.memory_stats()
+        text.insert(tk.END, f"\n\n{self.loc.get('memory_stats')}\n" + '\n'.join(f"{key:<22}{value:>12}" for key, value in memory.items()))
+        text.config(state=tk.DISABLED)
+        text.pack(fill=tk.BOTH, expand=True, padx=15, pady=15)
+        self.app.apply_theme_to_text(text)
+
+    def create_edit_dialog(self, prompt_id=None, default_title='', default_content=''):
         dialog = tk.Toplevel(self.window)
-        dialog.title(self.loc.get('edit_prompt') if index is not None else self.loc.get('add_prompt'))
+        dialog.title(self.loc.get('edit_prompt') if prompt_id is not None else self.loc.get('add_prompt'))
         dialog.geometry('700x500')  # Increased size
         dialog.resizable(True, True)  # Made resizable
         dialog.transient(self.window)
@@ -603,14 +888,15 @@ class PromptManagerWindow:
             new_content = content_text.get('1.0', tk.END).strip()
             if new_title or new_content:  # Save if any content (even incomplete)
                 try:
-                    if index is not None:
-                        self.app.config.update_prompt(index, new_title, new_content)
-                    else:
+                    if prompt_id is not None:
+                        self.app.config.update_prompt(prompt_id, new_title, new_content)
+                    elif self.app.config.find_duplicate(new_title, new_content) is None or \
+                            messagebox.askyesno(self.loc.get('duplicate_title'), self.loc.get('duplicate_msg'), parent=dialog):
                         self.app.config.add_prompt(new_title, new_content)
                     self.app.update_tray_menu()
                     self.refresh_prompts()
                 except ValueError as e:
-                    messagebox.showerror("Input Error", self.loc.get(str(e)) if str(e) in self.loc.translations[self.loc.language] else str(e))
+                    messagebox.showerror("Input Error", self.error_text(str(e)))
                     return  # Prevent close on error
             dialog.destroy()  # Cancel if empty
 
@@ -623,31 +909,92 @@ class PromptManagerWindow:
         self.app.manager_window = None
 
 class SystemTrayApp:
-    """Main application class."""
+    """Main application class.
+
+    Startup shows the tray icon first, built from the small tray cache; tkinter, the Tk root
+    and the prompt library load after it. Anything that needs the library waits on `config`.
+    """
     def __init__(self):
-        self.config = ConfigManager()
-        self.loc = Localization(self.config.settings['language'])
-        self.theme = ThemeManager(self.config.settings['theme'])
-        self.gui_root = tk.Tk()
-        self.gui_root.withdraw()
-        self.gui_queue = queue.Queue()
-        self.gui_root.after(100, self.process_gui_queue)
+        state = load_tray_state()
+        self._config = None
+        self._library_ready = threading.Event()
+        self._gui_ready = threading.Event()
+        self._cached_pinned = [tuple(entry) for entry in state.get('pinned', [])]
+        self._cached_frequent = [tuple(entry) for entry in state.get('frequent', [])]
+        self._tray_state = None  # Last state written to the tray cache
+        self._startup_pending = {'tray_icon', 'library'}
+        self.loc = Localization(state.get('language', 'en'))
+        self.theme = ThemeManager(state.get('theme', 'dark'))
         self.manager_window = None
-        self.clipboard_timer = None
+        self.clipboard = ClipboardService(self.clear_clipboard, pyperclip)
+        self.ipc_server = None  # Local API for scripts, when enabled in settings
+        self._menu_signature = None  # What the current tray menu was built from
         self.load_icon()
         self.setup_tray()
         self.tray_thread = threading.Thread(target=self.run_tray, daemon=True)
         self.tray_thread.start()
+        self.gui_root = tk.Tk()
+        self.gui_root.withdraw()
+        self.gui_queue = GuiDispatcher(self.gui_root)  # Callbacks from the tray and worker threads
+        self._gui_ready.set()
+        threading.Thread(target=self._load_library, daemon=True).start()
         self.gui_root.mainloop()
 
-    def process_gui_queue(self):
+    @property
+    def config(self) -> ConfigManager:
+        """The prompt library; waits for the startup load if it is still running."""
+        self._library_ready.wait()
+        return self._config
+
+    def _load_library(self):
         try:
-            while True:
-                func, args, kwargs = self.gui_queue.get_nowait()
-                func(*args, **kwargs)
-        except queue.Empty:
-            pass
-        self.gui_root.after(100, self.process_gui_queue)
+            config = ConfigManager(on_load_error=lambda e: self.gui_queue.put(
+                (messagebox.showerror, ("Load Error", f"Failed to load config: {e}"), {})))
+            config.on_save_error = self.report_save_error
+            self.search_worker = SearchWorker(config, self.gui_queue)
+            self._config = config
+        finally:
+            self._library_ready.set()
+        self.gui_queue.put((self._on_library_loaded, (), {}))
+
+    def _on_library_loaded(self):
+        settings = self.config.settings
+        if settings['language'] != self.loc.language:
+            self.loc = Localization(settings['language'])
+        if settings['theme'] != self.theme.theme:
+            self.theme = ThemeManager(settings['theme'])
+        self.update_tray_menu()  # Replaces the cached entries if the library disagrees
+        if settings.get('ipc_server'):
+            try:
+                self.start_ipc_server()
+            except OSError as e:
+                print(f"Local API error: {e}")
+        self._startup_stage('library')
+
+    def start_ipc_server(self):
+        if self.ipc_server is None:
+            import siamese_ipc  # Only loaded when the local API is turned on
+            self.ipc_server = siamese_ipc.IpcServer(self.config, on_copy=self.copy_to_clipboard)
+            self.ipc_server.start()
+
+    def stop_ipc_server(self):
+        if self.ipc_server is not None:
+            self.ipc_server.stop()
+            self.ipc_server = None
+
+    def _startup_stage(self, stage: str):
+        elapsed = time.perf_counter() - START_TIME
+        perf.record(f'startup_{stage}', elapsed)
+        if STARTUP_MODE not in ('', '0'):
+            print(f"Startup: {stage} after {elapsed * 1000:.1f} ms")
+        self._startup_pending.discard(stage)
+        if STARTUP_MODE == 'exit' and not self._startup_pending:
+            self._gui_ready.wait()
+            self.gui_queue.put((self.exit_app, (), {}))
+
+    def report_save_error(self, error):
+        # Called from the write-behind thread; show the dialog on the Tk thread
+        self.gui_queue.put((messagebox.showerror, ("Save Error", f"Failed to save config: {error}"), {}))
 
     def load_icon(self):
         try:
@@ -664,23 +1011,23 @@ class SystemTrayApp:
             draw.rectangle([16, 16, 48, 48], fill='white')
             self.app_icon = image
 
+    @perf.timed('create_menu')
     def create_menu(self):
         menu_items = []
 
-        def make_copy_handler(index):
+        def make_copy_handler(prompt_id):
             def handler(icon, item):
-                self.copy_to_clipboard(index)
+                self.copy_to_clipboard(prompt_id)
             return handler
 
-        pinned_count = 0
-        for idx, prompt in enumerate(self.config.prompts):
-            if prompt.get('pinned', False) and pinned_count < 5:
-                title = prompt['title'][:30] + '...' if len(prompt['title']) > 30 else prompt['title']
-                menu_items.append(item(title, make_copy_handler(idx)))
-                pinned_count += 1
-
-        if pinned_count > 0:
-            menu_items.append(Menu.SEPARATOR)
+        pinned, frequent = self._pinned_entries(), self._frequent_entries()
+        self._menu_signature = self._tray_signature(pinned, frequent)
+        for section in (pinned, frequent):
+            for prompt_id, title in section:
+                title = title[:30] + '...' if len(title) > 30 else title
+                menu_items.append(item(title, make_copy_handler(prompt_id)))
+            if section:
+                menu_items.append(Menu.SEPARATOR)
 
         menu_items.append(item(self.loc.get('manage_prompts'), lambda icon, item: self.show_manager(), default=True))
         menu_items.append(item(self.loc.get('exit'), lambda icon, item: self.exit_app()))
@@ -690,9 +1037,14 @@ class SystemTrayApp:
         self.icon = pystray.Icon('PromptManager', self.app_icon, self.loc.get('tray_title'), menu=self.create_menu())
 
     def run_tray(self):
-        self.icon.run()
+        self.icon.run(setup=self._on_tray_ready)
+
+    def _on_tray_ready(self, icon):
+        icon.visible = True  # Passing setup= leaves showing the icon to us
+        self._startup_stage('tray_icon')
 
     def show_manager(self):
+        self._gui_ready.wait()
         self.gui_queue.put((self._show_manager, (), {}))
 
     def _show_manager(self):
@@ -701,25 +1053,25 @@ class SystemTrayApp:
             return
         self.manager_window = PromptManagerWindow(self)
 
-    def copy_to_clipboard(self, index: int):
-        prompt = self.config.get_prompt(index)
+    def copy_to_clipboard(self, prompt_id: int):
+        """Hand the copy to the clipboard thread, so the tray menu returns at once."""
+        self.clipboard.run_soon(self._copy_prompt, prompt_id)
+
+    @perf.timed('copy_to_clipboard')
+    def _copy_prompt(self, prompt_id: int):
+        prompt = self.config.get_prompt(prompt_id)
         if prompt:
             try:
-                pyperclip.copy(prompt['content'])
+                self.clipboard.copy(prompt['content'])
+                self.config.record_use(prompt_id)
+                if self.config.settings.get('tray_most_used'):
+                    self.gui_queue.put((self.update_tray_menu, (), {}))  # The most used section may reorder
                 self.icon.notify(f"{self.loc.get('copied_notify')}: {prompt['title']}", self.loc.get('app_title'))
-                if self.clipboard_timer and self.clipboard_timer.is_alive():
-                    self.clipboard_timer.cancel()
-                self.clipboard_timer = threading.Timer(30.0, self.clear_clipboard)
-                self.clipboard_timer.start()
             except Exception as e:
                 self.icon.notify(f"{self.loc.get('copy_failed')}: {e}", self.loc.get('app_title'))
 
     def clear_clipboard(self):
-        try:
-            pyperclip.copy('')
-            self.icon.notify(self.loc.get('clear_clipboard'), self.loc.get('app_title'))
-        except:
-            pass
+        self.icon.notify(self.loc.get('clear_clipboard'), self.loc.get('app_title'))
 
     def switch_language(self):
         self.config.switch_language()
@@ -731,6 +1083,7 @@ class SystemTrayApp:
     def switch_theme(self):
         self.config.switch_theme()
         self.theme = ThemeManager(self.config.settings['theme'])
+        self.save_tray_state()
         theme_text = self.loc.get('switch_to_light') if self.config.settings['theme'] == 'light' else self.loc.get('switch_to_dark')
         self.icon.notify(f"{self.loc.get('theme_switch')}: {theme_text}", self.loc.get('app_title'))
 
@@ -748,6 +1101,8 @@ class SystemTrayApp:
                         borderwidth=1, relief='flat')
         style.configure('TRadiobutton', background=colors['bg'], foreground=colors['fg'], font=('Segoe UI', 9))
         style.map('TRadiobutton', background=[('active', colors['bg'])])
+        style.configure('TCheckbutton', background=colors['bg'], foreground=colors['fg'], font=('Segoe UI', 9))
+        style.map('TCheckbutton', background=[('active', colors['bg'])])
 
     def apply_theme_to_treeview(self, tree):
         colors = self.theme.colors[self.theme.theme]
@@ -764,28 +1119,78 @@ class SystemTrayApp:
         text_widget.configure(bg=colors['entry_bg'], fg=colors['entry_fg'],
                               insertbackground=colors['fg'], relief='flat', borderwidth=2)
 
+    def _pinned_entries(self) -> list:
+        """(id, title) of the tray menu prompts, from the tray cache until the library has loaded."""
+        if self._config is None:
+            return self._cached_pinned
+        return [(p.id, p.title) for p in self._config.pinned_prompts()[:ConfigManager.MAX_PINNED]]
+
+    def _frequent_entries(self) -> list:
+        """(id, title) of the most used unpinned prompts, if that tray section is enabled."""
+        if self._config is None:
+            return self._cached_frequent
+        if not self._config.settings.get('tray_most_used'):
+            return []
+        return [(p.id, p.title) for p in self._config.most_used(ConfigManager.MAX_PINNED)]
+
+    def _tray_signature(self, pinned: list, frequent: list) -> tuple:
+        return self.loc.language, tuple(pinned), tuple(frequent)
+
+    def save_tray_state(self):
+        """Write the tray cache if the menu entries, language or theme changed."""
+        if self._config is None:
+            return
+        state = {'language': self.loc.language, 'theme': self.theme.theme, 'pinned': self._pinned_entries(),
+                 'frequent': self._frequent_entries()}
+        if state != self._tray_state:
+            save_tray_state(state)
+            self._tray_state = state
+
+    @perf.timed('update_tray_menu')
     def update_tray_menu(self):
-        if self.icon:
+        """Rebuild the tray menu, but only if its pinned or most used entries or language changed."""
+        signature = self._tray_signature(self._pinned_entries(), self._frequent_entries())
+        if self.icon and signature != self._menu_signature:
             self.icon.menu = self.create_menu()
             try:
                 self.icon.update_menu()
             except:
                 pass
+        self.save_tray_state()
 
     def exit_app(self, icon=None):
-        if self.clipboard_timer and self.clipboard_timer.is_alive():
-            self.clipboard_timer.cancel()
+        self.clipboard.stop()
+        self.stop_ipc_server()
+        config = self.config  # Lets a startup load still in flight finish first
+        self.search_worker.stop()
+        if perf.enabled:
+            print(perf.report())
+        config.close()
         self.icon.stop()
+        self._gui_ready.wait()
         self.gui_root.quit()
 
 def main():
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()  # Folder imports start worker processes from the exe
     set_dpi_awareness()
+    if not (perf.enabled or STARTUP_MODE):  # Keep the console for reports
+        try:
+            import ctypes
+            ctypes.windll.user32.ShowWindow(ctypes.windll.kernel32.GetConsoleWindow(), 0)
+        except:
+            pass
+    profile_path = os.getenv('SIAMESE_PROFILE')  # Write cProfile stats of every thread here
+    profiler = None
+    if profile_path:
+        profiler = SessionProfiler()
+        profiler.enable()
     try:
-        import ctypes
-        ctypes.windll.user32.ShowWindow(ctypes.windll.kernel32.GetConsoleWindow(), 0)
-    except:
-        pass
-    app = SystemTrayApp()
+        app = SystemTrayApp()
+    finally:
+        if profiler:
+            profiler.dump(profile_path)
 
 if __name__ == '__main__':
     main()
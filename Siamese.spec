@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('icon.png', '.'), ('icon.ico', '.')],
-    hiddenimports=[],
+    hiddenimports=['tkinter', 'tkinter.ttk', 'tkinter.messagebox', 'tkinter.filedialog', 'pyperclip', 'sqlite3'],  # Imported lazily by Siamese.py
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
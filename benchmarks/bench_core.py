@@ -0,0 +1,171 @@
+# benchmarks/bench_core.py
+"""Benchmarks for siamese_core at library scale.
+
+Measures import, save, load, single mutations, search, export and peak memory for each
+library size and storage backend. Each case runs in a fresh subprocess so peak memory is per
+case. Results print as a table and are written as JSON; pass --baseline with an earlier
+results file to flag regressions (exit status 1).
+
+    python benchmarks/bench_core.py --sizes 1000 10000 100000 --output bench.json
+    python benchmarks/bench_core.py --sizes 1000 --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from siamese_core import ConfigManager
+import corpus
+
+QUERIES = ['prompt', 'review the', 'code function', '数据模型', 'qqqq']
+FUZZY_QUERIES = ['promtp', 'refacotr']
+REGRESSION_THRESHOLD = 1.25  # A metric this much slower than the baseline is a regression
+
+
+def timed(func, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(size: int, backend: str, seed: int) -> dict:
+    """Benchmark one library in this process; returns metric name -> seconds (or MB)."""
+    # The 10 MB library cap protects the JSON file in normal use; lift it to time the engine at scale
+    ConfigManager.MAX_FILE_SIZE = float('inf')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        results['corpus_mb'] = corpus.write(tmp / 'corpus.json', size, seed) / (1024 * 1024)
+        library = tmp / 'library'
+        library.mkdir()
+        config = ConfigManager(config_dir=library)
+        if backend == 'sqlite':
+            config.set_storage('sqlite')
+
+        def import_all():
+            ok, message, _ = config.import_prompts(str(tmp / 'corpus.json'), duplicates='keep')
+            if not ok:
+                raise RuntimeError(f"import failed: {message}")
+            config.flush()
+        results['import_s'] = timed(import_all)
+        results['save_s'] = timed(config.save_config)
+        config.close()
+
+        holder = []
+        results['load_s'] = timed(lambda: holder.append(ConfigManager(config_dir=library)))
+        config = holder[0]
+
+        results['search_first_s'] = timed(config.search, QUERIES[0])  # Includes loading the text to scan
+        if backend == 'json':  # Postings are built in the background; later searches use them
+            results['index_build_s'] = results['search_first_s'] + timed(config.wait_for_index)
+        for name, queries, fuzzy in (('search', QUERIES, False), ('fuzzy_search', FUZZY_QUERIES, True)):
+            samples = [timed(config.search, q, fuzzy=fuzzy) for _ in range(5) for q in queries]
+            results[f'{name}_median_s'] = statistics.median(samples)
+            results[f'{name}_max_s'] = max(samples)
+
+        prompt_id = None
+
+        def add():
+            nonlocal prompt_id
+            prompt_id = config.add_prompt('benchmark prompt', 'benchmark body ' * 20)
+        results['add_s'] = timed(add)
+        results['add_durable_s'] = results['add_s'] + timed(config.flush)
+        results['update_s'] = timed(config.update_prompt, prompt_id, 'benchmark prompt', 'changed body')
+        results['delete_s'] = timed(config.delete_prompt, prompt_id)
+        results['mutations_flush_s'] = timed(config.flush)
+
+        results['export_s'] = timed(config.export_prompts, str(tmp / 'export.json'))
+        config.close()
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def run_all(sizes: list, backends: list, seed: int) -> list:
+    cases = []
+    for size in sizes:
+        for backend in backends:
+            proc = subprocess.run([sys.executable, __file__, '--case', str(size), backend, '--seed', str(seed)],
+                                  capture_output=True, text=True, encoding='utf-8')
+            if proc.returncode != 0:
+                print(f"{size} {backend}: failed\n{proc.stderr}", file=sys.stderr)
+                continue
+            metrics = json.loads(proc.stdout.strip().splitlines()[-1])
+            cases.append({'size': size, 'backend': backend, 'metrics': metrics})
+            print_case(cases[-1])
+    return cases
+
+
+def print_case(case: dict) -> None:
+    print(f"\n{case['size']} prompts, {case['backend']}")
+    for name, value in case['metrics'].items():
+        if value is None:
+            continue
+        unit = 'ms' if name.endswith('_s') else 'MB'
+        print(f"  {name:<22}{value * 1000 if unit == 'ms' else value:>12.2f} {unit}")
+
+
+def compare(cases: list, baseline_path: str) -> list:
+    """Return (case, metric, baseline, current) for every metric past REGRESSION_THRESHOLD."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(c['size'], c['backend']): c['metrics'] for c in json.load(f)['cases']}
+    regressions = []
+    for case in cases:
+        old = baseline.get((case['size'], case['backend']), {})
+        for name, value in case['metrics'].items():
+            if name.endswith('_s') and old.get(name) and value > old[name] * REGRESSION_THRESHOLD:
+                regressions.append((f"{case['size']} {case['backend']}", name, old[name], value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--backends', nargs='+', default=['json', 'sqlite'], choices=['json', 'sqlite'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='earlier --output file to check for regressions')
+    parser.add_argument('--case', nargs=2, metavar=('SIZE', 'BACKEND'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(int(args.case[0]), args.case[1], args.seed)))
+        return
+
+    cases = run_all(args.sizes, args.backends, args.seed)
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'cases': cases,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        regressions = compare(cases, args.baseline)
+        for case, name, old, new in regressions:
+            print(f"REGRESSION {case} {name}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
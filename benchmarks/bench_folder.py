@@ -0,0 +1,61 @@
+# benchmarks/bench_folder.py
+"""Folder import throughput against the number of worker processes.
+
+Writes a folder of one-prompt files (.md, .txt and .json) from the synthetic corpus, then
+times ConfigManager.import_folder into a fresh library for each worker count.
+
+    python benchmarks/bench_folder.py --files 10000 --workers 1 2 4 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from siamese_core import ConfigManager
+import corpus
+
+
+def write_folder(folder: Path, count: int, seed: int) -> None:
+    for i, prompt in enumerate(corpus.generate(count, seed)):
+        subdir = folder / f'{i // 1000:03d}'
+        subdir.mkdir(exist_ok=True)
+        kind = i % 3
+        if kind == 2:
+            (subdir / f'prompt{i}.json').write_text(json.dumps(prompt, ensure_ascii=False), encoding='utf-8')
+        else:
+            (subdir / f'prompt{i}.{"md" if kind else "txt"}').write_text(prompt['content'], encoding='utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    ConfigManager.MAX_FILE_SIZE = float('inf')  # Time the import, not the library size cap
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        folder = tmp / 'prompts'
+        folder.mkdir()
+        write_folder(folder, args.files, args.seed)
+        print(f"{args.files} files, {os.cpu_count()} CPUs")
+        for workers in args.workers:
+            config = ConfigManager(config_dir=tmp / f'library{workers}')
+            start = time.perf_counter()
+            ok, message, summary = config.import_folder(str(folder), duplicates='keep', workers=workers)
+            config.flush()
+            elapsed = time.perf_counter() - start
+            config.close()
+            if not ok:
+                raise RuntimeError(f"import failed: {message}")
+            print(f"  workers {workers:>3}: {elapsed:7.2f} s  {summary['files'] / elapsed:8.0f} files/s"
+                  f"  ({len(summary['failed'])} failed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_ipc.py
+"""Latency and throughput of the local API (siamese_ipc) against a synthetic library.
+
+Serves a library from this process, as the tray app would, then times requests from one
+client connection: one request at a time (round-trip latency) and in pipelined batches.
+
+    python benchmarks/bench_ipc.py --size 10000 --requests 5000 --batch 1 16 128
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from siamese_core import ConfigManager
+from siamese_ipc import IpcClient, IpcServer
+import corpus
+
+QUERIES = ['prompt', 'review the', 'code function', '数据模型', 'qqqq']
+
+
+def requests_for(op: str, titles: list, count: int) -> list:
+    if op == 'ping':
+        return [{'op': 'ping'}] * count
+    if op == 'get':
+        return [{'op': 'get', 'title': titles[i % len(titles)]} for i in range(count)]
+    return [{'op': 'search', 'query': QUERIES[i % len(QUERIES)], 'limit': 20} for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 16, 128])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    ConfigManager.MAX_FILE_SIZE = float('inf')  # Time the API, not the library size cap
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        corpus.write(tmp / 'corpus.json', args.size, args.seed)
+        config = ConfigManager(config_dir=tmp / 'library')
+        ok, message, _ = config.import_prompts(str(tmp / 'corpus.json'), duplicates='keep')
+        if not ok:
+            raise RuntimeError(f"import failed: {message}")
+        config.flush()
+        config.search('warm')  # Build the index before timing, as the running app would have
+        titles = [p.title for p in list(config.prompts.values())[:1000]]
+        server = IpcServer(config, info_path=tmp / 'ipc.json')
+        server.start()
+        try:
+            with IpcClient(tmp / 'ipc.json') as client:
+                print(f"{args.size} prompts, {args.requests} requests per run")
+                for op in ('ping', 'get', 'search'):
+                    requests = requests_for(op, titles, args.requests)
+                    latencies = []
+                    for request in requests[:min(len(requests), 1000)]:
+                        start = time.perf_counter()
+                        client.pipeline([request])
+                        latencies.append(time.perf_counter() - start)
+                    latencies.sort()
+                    print(f"  {op:<7} latency  p50 {statistics.median(latencies) * 1e6:8.0f} us"
+                          f"  p99 {latencies[int(0.99 * (len(latencies) - 1))] * 1e6:8.0f} us")
+                    for batch in args.batch:
+                        start = time.perf_counter()
+                        for i in range(0, len(requests), batch):
+                            client.pipeline(requests[i:i + batch])
+                        elapsed = time.perf_counter() - start
+                        print(f"  {op:<7} batch {batch:>4}: {len(requests) / elapsed:9.0f} requests/s")
+        finally:
+            server.stop()
+            config.close()
+
+
+if __name__ == '__main__':
+    main()
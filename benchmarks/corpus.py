@@ -0,0 +1,67 @@
+# benchmarks/corpus.py
+"""Synthetic prompt corpus for the benchmarks.
+
+Prompts mix English and Chinese text. Most are a few hundred characters, some run to tens of
+thousands, and a rare few approach MAX_PROMPT_SIZE. The same seed always gives the same corpus.
+"""
+import json
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from siamese_core import ConfigManager
+
+EN_WORDS = (
+    'prompt review summarize explain refactor the code function data model user request answer '
+    'write test report email draft translate improve style concise detailed list steps example '
+    'context system assistant analysis design api query error bug fix performance memory index '
+    'search result table chart meeting notes plan goal task project release version'
+).split()
+ZH_CHARS = '的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经数据模型提示总结翻译代码测试'
+POOL_SIZE = 1 << 20  # Characters of random text per language; prompt bodies are slices of it
+
+
+def _pools(rng: random.Random) -> dict:
+    en = ' '.join(rng.choice(EN_WORDS) for _ in range(POOL_SIZE // 6))
+    zh = ''.join(rng.choice(ZH_CHARS) for _ in range(POOL_SIZE))
+    return {'en': en, 'zh': zh}
+
+
+def _length(rng: random.Random) -> int:
+    roll = rng.random()
+    if roll < 0.001:
+        return rng.randint(100_000, ConfigManager.MAX_PROMPT_SIZE)
+    if roll < 0.05:
+        return rng.randint(2_000, 20_000)
+    return max(20, min(2_000, int(rng.lognormvariate(6, 0.8))))
+
+
+def _text(rng: random.Random, pool: str, length: int) -> str:
+    parts = []
+    while length > 0:
+        take = min(length, len(pool) // 2)
+        start = rng.randrange(len(pool) - take)
+        parts.append(pool[start:start + take])
+        length -= take
+    return ''.join(parts)
+
+
+def generate(count: int, seed: int = 0):
+    """Yield `count` prompt dicts in export format."""
+    rng = random.Random(seed)
+    pools = _pools(rng)
+    for i in range(count):
+        lang = 'zh' if rng.random() < 0.3 else 'en'
+        title = _text(rng, pools[lang], rng.randint(8, 40)).strip() + f' #{i}'
+        yield {'title': title, 'content': _text(rng, pools[lang], _length(rng)), 'pinned': rng.random() < 0.001}
+
+
+def write(path: Path, count: int, seed: int = 0) -> int:
+    """Write a corpus as an export file, one prompt at a time; returns the file size in bytes."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"settings": {"language": "en", "theme": "dark"}, "prompts": [')
+        for i, prompt in enumerate(generate(count, seed)):
+            f.write((',\n' if i else '\n') + json.dumps(prompt, ensure_ascii=False))
+        f.write('\n]}\n')
+    return path.stat().st_size
@@ -0,0 +1,2935 @@
+# siamese_core.py
+"""Prompt storage, indexing and search for Siamese.
+
+Nothing here imports tkinter, pystray or Windows-only modules, so the library engine can be
+imported, tested and benchmarked on any platform. Siamese.py builds the tray app on top.
+"""
+import array
+import json
+import codecs
+import collections
+import functools
+import hashlib
+import importlib
+import re
+import bisect
+import itertools
+import heapq
+import math
+import mmap
+import os
+import threading
+import time
+import queue
+import struct
+import sys
+import zlib
+from pathlib import Path
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access, off the startup path."""
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# Only needed for SQLite storage, compression, imports and folder scans, not to show the tray icon
+sqlite3 = LazyModule('sqlite3')
+lzma = LazyModule('lzma')
+gzip = LazyModule('gzip')
+pickle = LazyModule('pickle')
+tempfile = LazyModule('tempfile')
+futures = LazyModule('concurrent.futures')
+cProfile = LazyModule('cProfile')
+pstats = LazyModule('pstats')
+
+# Configuration file paths - Updated for AppData persistence
+APPDATA_DIR = Path(os.getenv('APPDATA', Path.home() / 'AppData' / 'Roaming')) / 'PromptManager'
+CONFIG_PATH = APPDATA_DIR / 'prompts.json'
+JOURNAL_PATH = APPDATA_DIR / 'prompts.journal'
+DB_PATH = APPDATA_DIR / 'prompts.db'
+
+class PerfStats:
+    """Call counts, latency percentiles and byte counters for the hot paths.
+
+    Enabled by the SIAMESE_PERF environment variable (SIAMESE_PERF=log also prints every
+    sample). When disabled, timed() hands back the undecorated function and record()/add()
+    return at once, so instrumented code runs as before.
+    """
+    SAMPLES = 1024  # Most recent samples kept per series for percentiles
+
+    def __init__(self, mode: str = ''):
+        self.enabled = mode not in ('', '0')
+        self.log = mode == 'log'
+        self._series = {}  # name -> [count, max, recent samples, unit]
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def timed(self, name: str):
+        """Decorator recording the wall time of each call under `name`."""
+        def decorate(func):
+            if not self.enabled:
+                return func
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def record(self, name: str, value: float, unit: str = 's') -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = [0, value, collections.deque(maxlen=self.SAMPLES), unit]
+            series[0] += 1
+            series[1] = max(series[1], value)
+            series[2].append(value)
+        if self.log:
+            print(f"perf {name}: " + (f"{value * 1000:.2f} ms" if unit == 's' else f"{value} {unit}"))
+
+    def add(self, name: str, amount: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self) -> dict:
+        """Series as {count, p50, p95, max, unit} (seconds for timings) plus raw counters."""
+        with self._lock:
+            series = {name: (count, peak, sorted(samples), unit) for name, (count, peak, samples, unit) in self._series.items()}
+            counters = dict(self._counters)
+        stats = {}
+        for name, (count, peak, samples, unit) in series.items():
+            pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+            stats[name] = {'count': count, 'p50': pick(0.5), 'p95': pick(0.95), 'max': peak, 'unit': unit}
+        return {'series': stats, 'counters': counters}
+
+    def report(self) -> str:
+        snapshot = self.snapshot()
+        lines = [f"{'':<22}{'count':>8}{'p50':>11}{'p95':>11}{'max':>11}"]
+        for name, st in sorted(snapshot['series'].items()):
+            scale, unit = (1000, 'ms') if st['unit'] == 's' else (1, st['unit'])
+            lines.append(f"{name:<22}{st['count']:>8}" + ''.join(f"{st[k] * scale:>11.2f}" for k in ('p50', 'p95', 'max'))
+                         + f" {unit}")
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"{name:<22}{value:>8}")
+        return '\n'.join(lines)
+
+perf = PerfStats(os.getenv('SIAMESE_PERF', ''))
+
+class SessionProfiler:
+    """cProfile for every thread of a session, merged into one stats file by dump().
+
+    cProfile only sees the thread that enabled it, so threading.setprofile() gives each
+    thread started after enable() a profiler of its own. Where a second profiler cannot be
+    enabled (Python 3.12+), other threads are covered only as far as the first one reaches.
+    """
+    def __init__(self):
+        self._profilers = []
+        self._lock = threading.Lock()
+        self._enabled = False
+
+    def enable(self) -> None:
+        self._enabled = True
+        threading.setprofile(self._start_thread)
+        self._start()
+
+    def _start(self) -> None:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            print(f"Thread profiling unavailable: {e}")
+            return
+        with self._lock:
+            self._profilers.append(profiler)
+
+    def _start_thread(self, frame, event, arg):
+        sys.setprofile(None)  # The thread's own profiler takes over from this hook
+        if self._enabled:
+            self._start()
+
+    def dump(self, path: str) -> None:
+        """Stop profiling and write the merged stats of every thread to `path`."""
+        self._enabled = False
+        threading.setprofile(None)
+        with self._lock:
+            profilers = list(self._profilers)
+        for profiler in profilers:
+            profiler.disable()  # Only stops the calling thread's; the others are read as they stand
+        stats = pstats.Stats(*profilers)
+        stats.dump_stats(path)
+
+class Prompt:
+    """One prompt record, addressed by a stable random id rather than its list position.
+
+    The body is either resident in `content` (new or edited since the last compaction) or on
+    disk: at `body` = [offset, length] in the blob file, or in the database row with this id.
+    """
+    __slots__ = ('id', 'title', 'pinned', 'content', 'body', 'preview', 'length', 'order')
+
+    def __init__(self, id: int, title: str, content: str = None, pinned: bool = False,
+                 body: list = None, preview: str = '', length: int = 0):
+        self.id = id
+        self.title = title
+        self.pinned = pinned
+        self.content = content
+        self.body = body
+        self.preview = preview
+        self.length = length
+        self.order = 0  # Position in the library, assigned by ConfigManager
+
+    @staticmethod
+    def new_id() -> int:
+        # 52 random bits: unique across libraries being merged and exact as a JSON number anywhere
+        return int.from_bytes(os.urandom(7), 'big') >> 4
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Prompt':
+        return cls(data.get('id') or cls.new_id(), data['title'], data.get('content'), bool(data.get('pinned', False)),
+                   data.get('body'), data.get('preview', ''), data.get('length', 0))
+
+    def to_dict(self) -> dict:
+        """Snapshot form: metadata plus either the body itself or where to find it."""
+        data = {'id': self.id, 'title': self.title, 'pinned': self.pinned}
+        if self.content is not None:
+            data['content'] = self.content
+        elif self.body is not None:
+            data.update(body=self.body, preview=self.preview, length=self.length)
+        return data
+
+    def preview_text(self) -> str:
+        return self.content[:ConfigManager.PREVIEW_CHARS] if self.content is not None else self.preview
+
+    def content_length(self) -> int:
+        return len(self.content) if self.content is not None else self.length
+
+class BinarySnapshot:
+    """Compact binary copy of the JSON snapshot, read back through mmap at startup.
+
+    prompts.json stays the file of record; this copy only saves parsing and validating it.
+    The header records the size and mtime of the JSON file it was written after, plus the
+    payload length and a CRC-32 of the other header fields and the payload, so a missing,
+    stale, torn or corrupt copy is ignored and the JSON is parsed instead.
+
+    Layout (little endian): header, a length-prefixed JSON block with everything but the
+    prompts, a fixed-size record per prompt, then two length-prefixed UTF-8 blocks holding all
+    titles and all previews (or contents, if resident). Records give character counts, so each
+    block is decoded with one call and sliced.
+    """
+    MAGIC = b'SIAMSNAP'
+    VERSION = 2
+    FIELDS = struct.Struct('<8sHHqqIQ')  # magic, version, reserved, JSON size, JSON mtime_ns, prompts, payload bytes
+    HEADER = struct.Struct(FIELDS.format + 'I')  # ... then the crc32 of the fields and the payload
+    BLOCK = struct.Struct('<Q')
+    RECORD = struct.Struct('<QBIQQII')  # id, flags, title chars, body offset, body bytes, length, text chars
+    PINNED, RESIDENT, ON_DISK = 1, 2, 4
+
+    def __init__(self, path: Path, json_path: Path):
+        self.path = path
+        self.json_path = json_path
+
+    def write(self, data: dict) -> None:
+        """Write the copy for `data`, which must just have been written to the JSON snapshot."""
+        prompts = data.get('prompts', [])
+        records, titles, texts = [], [], []
+        for p in prompts:
+            flags = self.PINNED if p.get('pinned') else 0
+            offset = size = 0
+            if 'content' in p:
+                flags |= self.RESIDENT
+                text = p['content']
+                length = len(text)
+            else:
+                if p.get('body') is not None:
+                    flags |= self.ON_DISK
+                    offset, size = p['body']
+                text = p.get('preview', '')
+                length = p.get('length', 0)
+            records.append(self.RECORD.pack(p['id'], flags, len(p['title']), offset, size, length, len(text)))
+            titles.append(p['title'])
+            texts.append(text)
+        blocks = [json.dumps({k: v for k, v in data.items() if k != 'prompts'}, ensure_ascii=False).encode('utf-8'),
+                  b''.join(records), ''.join(titles).encode('utf-8'), ''.join(texts).encode('utf-8')]
+        payload = b''.join(self.BLOCK.pack(len(block)) + block for block in blocks)
+        st = os.stat(self.json_path)
+        fields = self.FIELDS.pack(self.MAGIC, self.VERSION, 0, st.st_size, st.st_mtime_ns, len(prompts), len(payload))
+        header = fields + struct.pack('<I', zlib.crc32(payload, zlib.crc32(fields)))
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        replace_file(tmp_path, self.path)
+        perf.add('snapshot_bytes_written', len(header) + len(payload))
+
+    def read(self):
+        """Snapshot data with 'prompts' as Prompt objects, or None if the copy is unusable."""
+        try:
+            st = os.stat(self.json_path)
+            with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    data = self._decode(view, st)
+                    perf.add('snapshot_bytes_read', len(view))
+                    return data
+        except (OSError, ValueError, struct.error) as e:  # ValueError covers an empty file and bad UTF-8/JSON
+            if not isinstance(e, FileNotFoundError):
+                print(f"Binary snapshot unusable, reading JSON: {e}")
+            return None
+
+    def _decode(self, view, st):
+        magic, version, _, json_size, json_mtime, count, length, crc = self.HEADER.unpack_from(view, 0)
+        pos = self.HEADER.size
+        if magic != self.MAGIC or version != self.VERSION or (json_size, json_mtime) != (st.st_size, st.st_mtime_ns):
+            return None  # Another format, or prompts.json was rewritten without us
+        if len(view) != pos + length:
+            raise ValueError("length mismatch")
+        with view[:self.FIELDS.size] as fields, view[pos:] as payload:
+            if zlib.crc32(payload, zlib.crc32(fields)) != crc:
+                raise ValueError("checksum mismatch")
+        blocks = []
+        try:  # Every slice must be released before the mmap can close, on errors too
+            for _ in range(4):  # Settings JSON, records, titles, texts
+                block_len, = self.BLOCK.unpack_from(view, pos)
+                pos += self.BLOCK.size
+                blocks.append(view[pos:pos + block_len])
+                pos += block_len
+            data = json.loads(str(blocks[0], 'utf-8'))
+            if len(blocks[1]) != count * self.RECORD.size:
+                raise ValueError("record block size mismatch")
+            records = bytes(blocks[1])
+            titles, texts = str(blocks[2], 'utf-8'), str(blocks[3], 'utf-8')
+        finally:
+            for block in blocks:
+                block.release()
+        title_pos = text_pos = 0
+        prompts = []
+        for prompt_id, flags, title_len, offset, size, length, text_len in self.RECORD.iter_unpack(records):
+            title = titles[title_pos:title_pos + title_len]
+            title_pos += title_len
+            text = texts[text_pos:text_pos + text_len]
+            text_pos += text_len
+            pinned = bool(flags & self.PINNED)
+            if flags & self.RESIDENT:
+                prompts.append(Prompt(prompt_id, title, text, pinned))
+            else:
+                prompts.append(Prompt(prompt_id, title, None, pinned, [offset, size] if flags & self.ON_DISK else None,
+                                      text, length))
+        data['prompts'] = prompts
+        return data
+
+def replace_file(src: Path, dst: Path, attempts: int = 50) -> None:
+    """os.replace, retried while another process briefly has `dst` open (Windows refuses then)."""
+    for attempt in range(attempts):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.02)
+
+class FileLock:
+    """Advisory exclusive lock on a file, shared by every process that writes the library.
+
+    Reentrant within a process: the OS lock is taken by the outermost acquire and released by
+    the matching release, and other threads wait on an in-process lock first. Uses msvcrt
+    byte-range locking on Windows and flock elsewhere.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self) -> None:
+        self._lock.acquire()
+        try:
+            if self._depth == 0:
+                if self._file is None:
+                    self._file = open(self.path, 'a+b')
+                self._lock_os()
+        except BaseException:
+            self._lock.release()
+            raise
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        try:
+            if self._depth == 0:
+                self._unlock_os()
+        finally:
+            self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _lock_os(self) -> None:
+        start = time.perf_counter()
+        if sys.platform == 'win32':
+            import msvcrt
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)  # Gives up after ~10 s
+                    break
+                except OSError:
+                    pass
+        else:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        perf.record('file_lock_wait', time.perf_counter() - start)
+
+    def _unlock_os(self) -> None:
+        if sys.platform == 'win32':
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None and self._depth == 0:
+                self._file.close()
+                self._file = None
+
+class JournalStore:
+    """Snapshot file plus an append-only journal of mutation records.
+
+    Each mutation is appended to the journal as a single JSON line, so its cost depends on
+    the size of the change rather than the size of the library. Records carry a sequence
+    number and the snapshot remembers the last one it contains, which lets a crash at any
+    point (torn journal line, interrupted compaction) replay cleanly on the next start.
+
+    The sequence number is also the library's generation across processes. Appends and
+    compactions hold `lock` (prompts.lock) and first read whatever other instances appended,
+    so numbers keep increasing however many instances write. A compaction starts the new
+    journal with a marker record ({"op": "snapshot"}) naming the generation it folded in, which
+    lets other instances tell whether they can simply keep reading or must load again. Readers
+    take no lock: files are replaced by rename and a journal line without its newline is
+    ignored until it is complete.
+    """
+    COMPACT_RECORDS = 500  # Fold the journal into the snapshot after this many records
+    COMPACT_BYTES = 2 * 1024 * 1024  # ... or once it grows past this size
+    LOAD_ATTEMPTS = 3  # Unlocked loads that raced a compaction before loading under the lock
+
+    def __init__(self, snapshot_path: Path, journal_path: Path, binary_path: Path = None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.binary = BinarySnapshot(binary_path, snapshot_path) if binary_path else None  # Optional fast-load copy
+        self.lock = FileLock(journal_path.with_name(journal_path.stem + '.lock'))  # Held by writers
+        self._seq = 0  # Highest sequence number read or written: our generation
+        self._records = 0
+        self._bytes = 0  # Journal bytes read or written so far; where the next read starts
+        self._journal_id = None  # (st_dev, st_ino) of the journal those bytes belong to
+        self._foreign = []  # Records of other processes read while appending, not yet merged
+        self._stale = False  # Another process compacted records we never read
+        self._signature = None  # (mtime, size) of both files as of our last read or write
+        self._lock = threading.RLock()  # The write-behind thread appends while the model catches up
+        self.compacting = False
+
+    def _stat_signature(self) -> tuple:
+        signature = []
+        for path in (self.snapshot_path, self.journal_path):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def changed(self) -> bool:
+        """True if another writer touched the files since we last read or wrote them."""
+        with self._lock:
+            return not self.compacting and bool(self._foreign or self._stale or self._stat_signature() != self._signature)
+
+    def generation(self) -> int:
+        return self._seq
+
+    def load(self) -> tuple[dict, list]:
+        """Return the snapshot data and the journal records not yet folded into it."""
+        for _ in range(self.LOAD_ATTEMPTS):
+            with self._lock:
+                loaded = self._load()
+            if loaded is not None:
+                return loaded
+        with self.lock, self._lock:  # No compaction can run while we hold it
+            return self._load()
+
+    def _load(self):
+        """Read the snapshot, then the journal; None if a compaction replaced them in between."""
+        signature = self._stat_signature()
+        data = self.binary.read() if self.binary else None
+        if data is None:
+            data = {}
+            if self.snapshot_path.exists():
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    perf.add('snapshot_bytes_read', f.tell())
+        base_seq = data.get('journal_seq', 0) if isinstance(data, dict) else 0
+        self._seq = base_seq
+        self._records = 0
+        self._bytes = 0
+        self._journal_id = None
+        self._foreign = []
+        self._stale = False
+        records = self._read_journal()
+        if self._stale:
+            return None  # The journal is newer than the snapshot we read
+        self._signature = signature
+        return data, records
+
+    def _read_journal(self) -> list:
+        """Complete journal records past `_bytes`, following a journal another process replaced.
+
+        Records numbered at or below our generation are skipped; snapshot markers are always
+        returned, so the caller can check they match what it has loaded.
+        """
+        try:
+            f = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            return []
+        records = []
+        with f:
+            st = os.fstat(f.fileno())
+            if (st.st_dev, st.st_ino) != self._journal_id or st.st_size < self._bytes:
+                self._journal_id = (st.st_dev, st.st_ino)  # Compacted by someone else: start over
+                self._bytes = 0
+                self._records = 0
+            if st.st_size == self._bytes:
+                return records
+            f.seek(self._bytes)
+            start = self._bytes
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Torn write from a crash, or an append still in progress
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._bytes += len(line)
+                self._records += 1
+                seq = record.get('seq', 0)
+                if record.get('op') == 'snapshot':
+                    self._stale = self._stale or seq > self._seq
+                    records.append(record)
+                elif seq > self._seq:
+                    records.append(record)
+                if seq > self._seq:
+                    self._seq = seq
+            perf.add('journal_bytes_read', self._bytes - start)
+        return records
+
+    def catch_up(self):
+        """Records other processes appended since we last read or wrote the journal.
+
+        Returns None when the files changed in a way only a full load() can follow: another
+        process compacted records we never read, or prompts.json was written from outside.
+        """
+        with self._lock:
+            signature = self._stat_signature()
+            records, self._foreign = self._foreign + self._read_journal(), []
+            snapshot_followed = any(record.get('op') == 'snapshot' for record in records)
+            if self._stale or (signature[0] != self._signature[0] and not snapshot_followed):
+                return None
+            self._signature = signature
+            return records
+
+    @perf.timed('journal_append')
+    def append_many(self, records: list) -> None:
+        """Durably append a batch of mutation records with one write and one fsync."""
+        with self.lock, self._lock:
+            signature = self._signature
+            self._foreign += self._read_journal()  # Numbers ours after everything already written
+            lines = []
+            for record in records:
+                self._seq += 1
+                record['seq'] = self._seq  # Lets the model tell which of its edits a merged record predates
+                lines.append((json.dumps({'seq': self._seq, **record}, ensure_ascii=False) + '\n').encode('utf-8'))
+            # Opened per batch: an open handle would stop another instance replacing the journal on Windows
+            with open(self.journal_path, 'ab') as f:
+                st = os.fstat(f.fileno())
+                if (st.st_dev, st.st_ino) != self._journal_id:
+                    self._bytes = self._records = 0  # Created just now
+                if st.st_size > self._bytes:
+                    f.truncate(self._bytes)  # Torn tail: nobody else can be appending while we hold the lock
+                f.write(b''.join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+                self._journal_id = (st.st_dev, st.st_ino)
+            written = sum(len(line) for line in lines)
+            self._records += len(lines)
+            self._bytes += written
+            perf.add('journal_bytes_written', written)
+            journal_signature = self._stat_signature()[1]
+            self._signature = (signature[0] if signature else None, journal_signature)
+
+    def needs_compaction(self) -> bool:
+        return not self.compacting and (self._records >= self.COMPACT_RECORDS or self._bytes >= self.COMPACT_BYTES)
+
+    def has_records(self) -> bool:
+        return self._records > 0
+
+    def begin_compaction(self) -> None:
+        """Take the lock file until finish or abort, so no instance appends records the
+        snapshot would drop. Merge catch_up() into the model before reading generation()."""
+        self.lock.acquire()
+        with self._lock:
+            self.compacting = True
+
+    def write_snapshot(self, data: dict, seq: int) -> None:
+        """Atomically replace the snapshot (temp file, fsync, rename)."""
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({**data, 'journal_seq': seq}, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+            perf.add('snapshot_bytes_written', f.tell())
+        replace_file(tmp_path, self.snapshot_path)
+        if self.binary:
+            try:
+                self.binary.write({**data, 'journal_seq': seq})
+            except OSError as e:
+                print(f"Binary snapshot write error: {e}")  # The next load just parses the JSON
+
+    def finish_compaction(self, seq: int, blob: str = None) -> None:
+        """Start a new journal holding only the marker for the snapshot just written."""
+        try:
+            with self._lock:
+                marker = (json.dumps({'seq': seq, 'op': 'snapshot', 'blob': blob}) + '\n').encode('utf-8')
+                tmp_path = self.journal_path.with_name(self.journal_path.name + '.tmp')
+                with open(tmp_path, 'wb') as f:
+                    f.write(marker)
+                    f.flush()
+                    os.fsync(f.fileno())
+                replace_file(tmp_path, self.journal_path)
+                st = os.stat(self.journal_path)
+                self._journal_id = (st.st_dev, st.st_ino)
+                self._records = 0
+                self._bytes = len(marker)
+                self._signature = self._stat_signature()
+        finally:
+            self.abort_compaction()  # Records left in an old journal are skipped by their numbers
+
+    def abort_compaction(self) -> None:
+        try:
+            with self._lock:
+                self.compacting = False
+        finally:
+            self.lock.release()
+
+    def close(self) -> None:
+        self.lock.close()
+
+class BlobStore:
+    """Append-only file of prompt bodies, read back on demand through mmap.
+
+    The snapshot keeps only each prompt's title, preview and [offset, length] into this file,
+    so bodies stay on disk until a prompt is copied, edited or searched. Bodies are never
+    overwritten in place; compaction rewrites the file under a new generation name once most
+    of it is garbage, so a snapshot always points at a blob that matches it.
+
+    The file is opened for reading as soon as a snapshot names it and stays open until we move
+    to another generation. Another instance's compaction may delete a generation we still read:
+    POSIX keeps the unlinked file for our handle and Windows refuses the delete.
+    """
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.name = None
+        self.size = 0
+        self._reader = None
+        self._file = None
+        self._map = None
+        self._lock = threading.Lock()  # put() runs under the model lock, get() from any thread
+
+    def open(self, name: str) -> bool:
+        """Switch to the generation `name`; False if that file does not exist (yet)."""
+        with self._lock:
+            name = Path(name).name
+            if name == self.name:
+                return True
+            self._close()
+            self.name = name
+            try:
+                self._reader = open(self.directory / name, 'rb')
+            except FileNotFoundError:
+                self.size = 0
+                return False
+            self.size = os.fstat(self._reader.fileno()).st_size
+            return True
+
+    def put(self, text: str) -> list:
+        """Append a body and return its [offset, length]; call sync() before relying on it."""
+        data = text.encode('utf-8')
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.directory / self.name, 'ab')
+            offset = self._file.tell()
+            self._file.write(data)
+            self.size = offset + len(data)
+        perf.add('blob_bytes_written', len(data))
+        return [offset, len(data)]
+
+    def get(self, offset: int, length: int) -> str:
+        if length == 0:
+            return ''
+        perf.add('blob_bytes_read', length)
+        with self._lock:
+            if self._map is None or offset + length > len(self._map):
+                self._remap()  # The body was appended after we mapped the file
+            return self._map[offset:offset + length].decode('utf-8')
+
+    def sync(self) -> None:
+        """Make appended bodies durable. Also closes the append handle, so the next put()
+        starts from the real end of the file if another instance appended in between."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def rewrite(self, prompts: list) -> Path:
+        """Copy the live bodies of `prompts` into the next generation and repoint them.
+
+        Returns the path of the old generation, to delete once a snapshot points at the new one.
+        """
+        with self._lock:
+            old_path = self.directory / self.name
+            generation = int(self.name.split('.')[1]) + 1
+            name = f'prompts.{generation}.blob'
+            self._remap()
+            offset = 0
+            with open(self.directory / name, 'wb') as f:
+                for p in prompts:
+                    start, length = p.body
+                    f.write(self._map[start:start + length])
+                    p.body = [offset, length]
+                    offset += length
+                f.flush()
+                os.fsync(f.fileno())
+            self._close()
+            self.name = name
+            self.size = offset
+            return old_path
+
+    def _remap(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._reader is None:
+            self._reader = open(self.directory / self.name, 'rb')  # Created by our own first put()
+        self._map = mmap.mmap(self._reader.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+class SqliteStore:
+    """Prompts kept in a local SQLite database with an FTS5 index over title and content.
+
+    Settings stay in prompts.json; only prompt records are routed here. Rows are ordered by
+    rowid, which matches the in-memory order, and addressed by the prompt id kept in ``uid``.
+    Triggers log the uid of every changed row in ``changes``, so another instance can re-read
+    just those rows after a commit it did not make.
+
+    The FTS index holds the text lowercased with Python's str.lower (the lower_text function),
+    as SearchIndex does: FTS case folding alone disagrees with it on letters like 'İ', whose
+    lowercase is two characters, and on scripts it does not fold, so a match could be missed.
+    Folding the lowercased text again can only add hits (ς and σ fold alike), and search()
+    drops those with a substring test.
+    """
+    CHANGE_LOG_ROWS = 10000  # Changes kept for instances that have not caught up yet
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS prompts (
+            id INTEGER PRIMARY KEY, title TEXT NOT NULL, content TEXT NOT NULL, pinned INTEGER NOT NULL DEFAULT 0,
+            uid INTEGER
+        );
+    '''
+    CHANGES_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, uid INTEGER NOT NULL);
+        CREATE TRIGGER IF NOT EXISTS changes_ai AFTER INSERT ON prompts BEGIN
+            INSERT INTO changes(uid) VALUES (new.uid);
+        END;
+        CREATE TRIGGER IF NOT EXISTS changes_au AFTER UPDATE ON prompts BEGIN
+            INSERT INTO changes(uid) VALUES (new.uid);
+        END;
+        CREATE TRIGGER IF NOT EXISTS changes_ad AFTER DELETE ON prompts BEGIN
+            INSERT INTO changes(uid) VALUES (old.uid);
+        END;
+    '''
+    FTS_SCHEMA = '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(
+            title, content, content='prompts', content_rowid='id', tokenize='{tokenizer}'
+        );
+        CREATE TRIGGER IF NOT EXISTS prompts_ai AFTER INSERT ON prompts BEGIN
+            INSERT INTO prompts_fts(rowid, title, content) VALUES (new.id, lower_text(new.title), lower_text(new.content));
+        END;
+        CREATE TRIGGER IF NOT EXISTS prompts_ad AFTER DELETE ON prompts BEGIN
+            INSERT INTO prompts_fts(prompts_fts, rowid, title, content)
+                VALUES ('delete', old.id, lower_text(old.title), lower_text(old.content));
+        END;
+        CREATE TRIGGER IF NOT EXISTS prompts_au AFTER UPDATE OF title, content ON prompts BEGIN
+            INSERT INTO prompts_fts(prompts_fts, rowid, title, content)
+                VALUES ('delete', old.id, lower_text(old.title), lower_text(old.content));
+            INSERT INTO prompts_fts(rowid, title, content) VALUES (new.id, lower_text(new.title), lower_text(new.content));
+        END;
+    '''
+    FTS_LOWERCASE = '''
+        BEGIN;
+        DROP TRIGGER prompts_ai;
+        DROP TRIGGER prompts_ad;
+        DROP TRIGGER prompts_au;
+        INSERT INTO prompts_fts(prompts_fts) VALUES ('delete-all');
+        {schema}
+        INSERT INTO prompts_fts(rowid, title, content) SELECT id, lower_text(title), lower_text(content) FROM prompts;
+        COMMIT;
+    '''
+
+    WORDS_SCHEMA = '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS prompts_words USING fts5(
+            title, content, content='prompts', content_rowid='id', tokenize='unicode61 remove_diacritics 0'
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS prompts_words_vocab USING fts5vocab(prompts_words, 'row');
+        CREATE TRIGGER IF NOT EXISTS words_ai AFTER INSERT ON prompts BEGIN
+            INSERT INTO prompts_words(rowid, title, content) VALUES (new.id, new.title, new.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS words_ad AFTER DELETE ON prompts BEGIN
+            INSERT INTO prompts_words(prompts_words, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS words_au AFTER UPDATE OF title, content ON prompts BEGIN
+            INSERT INTO prompts_words(prompts_words, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO prompts_words(rowid, title, content) VALUES (new.id, new.title, new.content);
+        END;
+    '''
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)  # Guarded by ConfigManager._lock
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        if 'uid' not in [row[1] for row in self.conn.execute('PRAGMA table_info(prompts)')]:
+            self.conn.execute('ALTER TABLE prompts ADD COLUMN uid INTEGER')  # Databases from before prompt ids
+        with self.conn:
+            for rowid, in self.conn.execute('SELECT id FROM prompts WHERE uid IS NULL').fetchall():
+                self.conn.execute('UPDATE prompts SET uid = ? WHERE id = ?', (Prompt.new_id(), rowid))
+        self.conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS prompts_uid ON prompts(uid)')
+        self.conn.executescript(self.CHANGES_SCHEMA)
+        self._change_seq = 0  # Last change-log entry reflected in the model
+        # Python's case mapping and regexes, so searches here match what SearchIndex would find
+        self.conn.create_function('lower_text', 1, str.lower, deterministic=True)
+        self.conn.create_function('regexp', 2, lambda pattern, text: re.search(pattern, text) is not None,
+                                  deterministic=True)
+        self.tokenizer = None
+        # The trigram tokenizer (SQLite 3.34+) gives substring matches; unicode61 only matches tokens
+        for tokenizer in ('trigram', 'unicode61'):
+            try:
+                self.conn.executescript(self.FTS_SCHEMA.format(tokenizer=tokenizer))
+                self.tokenizer = tokenizer
+                break
+            except sqlite3.OperationalError as e:
+                print(f"FTS5 tokenizer {tokenizer} unavailable: {e}")
+        if self.tokenizer and 'lower_text' not in self.conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'prompts_ai'").fetchone()[0]:
+            # Indexed as stored, by an earlier version: lowercase it once
+            schema = self.FTS_SCHEMA.format(tokenizer=self.tokenizer)
+            self.conn.executescript(self.FTS_LOWERCASE.format(schema=schema))
+        if self.tokenizer == 'trigram':  # Word vocabulary for fuzzy search's typo pass
+            fresh = not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'prompts_words'").fetchone()
+            self.conn.executescript(self.WORDS_SCHEMA)
+            if fresh:
+                with self.conn:
+                    self.conn.execute("INSERT INTO prompts_words(prompts_words) VALUES ('rebuild')")
+        self._data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        self._lock = threading.RLock()  # Serializes the write-behind thread and searches
+
+    def changed(self) -> bool:
+        """True if another connection committed since we last loaded (our own commits don't count)."""
+        with self._lock:
+            return self.conn.execute('PRAGMA data_version').fetchone()[0] != self._data_version
+
+    def _last_change(self) -> int:
+        return self.conn.execute('SELECT coalesce(max(seq), 0) FROM changes').fetchone()[0]
+
+    def _rows(self, where: str = '', args: tuple = ()) -> list:
+        rows = self.conn.execute(f'SELECT uid, title, substr(content, 1, {ConfigManager.PREVIEW_CHARS}), '
+                                 f'length(content), pinned FROM prompts {where} ORDER BY id', args).fetchall()
+        return [Prompt(uid, title, pinned=bool(pinned), preview=preview, length=length)
+                for uid, title, preview, length, pinned in rows]
+
+    def load_prompts(self) -> list:
+        """Return Prompt records without bodies; get_content() fetches one when needed."""
+        with self._lock:
+            self._data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            self._change_seq = self._last_change()  # Read first: a commit after it is read again later
+            return self._rows()
+
+    def changed_rows(self):
+        """Rows changed since the model last caught up, as (uid, Prompt or None if deleted).
+
+        Present rows come in library order. Returns None when the change log no longer reaches
+        back that far, and the caller must load everything again.
+        """
+        with self._lock:
+            self._data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            oldest, last = self.conn.execute('SELECT min(seq), max(seq) FROM changes').fetchone()
+            if last is None or last <= self._change_seq:
+                return []
+            if oldest > self._change_seq + 1:
+                return None  # Pruned past us
+            uids = [uid for uid, in self.conn.execute('SELECT DISTINCT uid FROM changes WHERE seq > ? AND seq <= ?',
+                                                       (self._change_seq, last))]
+            present = []
+            for i in range(0, len(uids), 500):  # Stay under SQLite's bound-parameter limit
+                chunk = uids[i:i + 500]
+                present += self._rows(f'WHERE uid IN ({",".join("?" * len(chunk))})', tuple(chunk))
+            self._change_seq = last
+        found = {p.id for p in present}
+        return [(uid, None) for uid in uids if uid not in found] + [(p.id, p) for p in present]
+
+    def get_content(self, prompt_id: int) -> str:
+        with self._lock:
+            content = self.conn.execute('SELECT content FROM prompts WHERE uid = ?', (prompt_id,)).fetchone()[0]
+        perf.add('db_bytes_read', len(content))
+        return content
+
+    def migrate(self, prompts, replace: bool = False) -> None:
+        """Copy prompt dicts (id, title, content, pinned) into the database in one transaction."""
+        with self._lock, self.conn:
+            if replace:
+                self.conn.execute('DELETE FROM prompts')
+            self._insert(prompts)
+
+    def _insert(self, prompts) -> None:
+        for p in prompts:
+            self.conn.execute('INSERT INTO prompts (uid, title, content, pinned) VALUES (?, ?, ?, ?)',
+                              (p['id'], p['title'], p['content'], int(bool(p.get('pinned', False)))))
+
+    def append_many(self, records: list) -> None:
+        """Apply a batch of prompt mutation records as a single transaction."""
+        with self._lock, self.conn:
+            for record in records:
+                self._apply(record)
+            self.conn.execute('DELETE FROM changes WHERE seq <= (SELECT max(seq) FROM changes) - ?',
+                              (self.CHANGE_LOG_ROWS,))
+
+    def _apply(self, record: dict) -> None:
+        op = record['op']
+        if op == 'add':
+            self._insert([record['prompt']])
+        elif op == 'import':
+            self._insert(record['prompts'])
+        elif op == 'update':
+            fields = dict(record['fields'])
+            if 'pinned' in fields:
+                fields['pinned'] = int(bool(fields['pinned']))
+            assignments = ', '.join(f'{name} = ?' for name in fields)
+            self.conn.execute(f'UPDATE prompts SET {assignments} WHERE uid = ?', (*fields.values(), record['id']))
+        elif op == 'delete':
+            self.conn.execute('DELETE FROM prompts WHERE uid = ?', (record['id'],))
+
+    def _matching(self, match: str, table: str = 'prompts_fts') -> list:
+        rows = self.conn.execute(f'SELECT prompts.uid FROM {table} JOIN prompts ON prompts.id = {table}.rowid '
+                                 f'WHERE {table} MATCH ? ORDER BY prompts.id', (match,))
+        return [uid for uid, in rows]
+
+    def _words(self, candidates: list) -> list:
+        """The candidates that occur as words in some prompt."""
+        words = []
+        for i in range(0, len(candidates), 500):  # Stay under SQLite's bound-parameter limit
+            chunk = candidates[i:i + 500]
+            words += [term for term, in self.conn.execute(
+                f'SELECT term FROM prompts_words_vocab WHERE term IN ({",".join("?" * len(chunk))})', chunk)]
+        return words
+
+    @staticmethod
+    def _phrase(text: str) -> str:
+        return '"' + text.replace('"', '""') + '"'
+
+    def search(self, query: str) -> list:
+        """Ids of prompts whose title or content contains the (lowercased) query, in order."""
+        with self._lock:
+            if self.tokenizer == 'trigram' and len(query) >= 3:
+                rows = self.conn.execute('SELECT prompts.uid FROM prompts_fts JOIN prompts ON prompts.id = prompts_fts.rowid '
+                                         'WHERE prompts_fts MATCH ? AND (instr(lower_text(prompts.title), ?) '
+                                         'OR instr(lower_text(prompts.content), ?)) ORDER BY prompts.id',
+                                         (self._phrase(query), query, query))
+                return [uid for uid, in rows]
+            # Trigram MATCH needs 3+ characters, and unicode61 only matches whole tokens: scan
+            rows = self.conn.execute('SELECT uid FROM prompts WHERE instr(lower_text(title), ?) '
+                                     'OR instr(lower_text(content), ?) ORDER BY id', (query, query))
+            return [uid for uid, in rows]
+
+    def search_fuzzy(self, query: str, limit: int, cancel=None, boost: dict = None):
+        """SearchIndex.search_fuzzy answered from the FTS trigram postings; None without them."""
+        if self.tokenizer != 'trigram':
+            return None
+        with self._lock:
+            postings = []
+            for gram in SearchIndex.trigrams(query):
+                check_cancelled(cancel, 0)
+                phrase = self._phrase(gram)
+                postings.append((set(self._matching(phrase)), set(self._matching('title : ' + phrase))))
+            postings.sort(key=lambda pair: len(pair[0]))
+            scores = SearchIndex.shared_gram_scores(postings, cancel)
+            in_title = {uid for uid, in self.conn.execute('SELECT uid FROM prompts WHERE instr(lower_text(title), ?)',
+                                                          (query,))}
+            for uid in self.search(query):
+                scores[uid] = scores.get(uid, 0) + (2 if uid in in_title else 1)
+            for word in SearchIndex.correctable_words(query):
+                hits = {}
+                for term in self._words(list(SearchIndex.edits(word))):
+                    titled = set(self._matching('title : ' + self._phrase(term)))
+                    for uid in self._matching(self._phrase(term), 'prompts_words'):
+                        hits[uid] = hits.get(uid, False) or uid in titled
+                SearchIndex.add_corrections(scores, query, word, hits)
+            words = SearchIndex.TOKEN_RE.findall(query)
+            if words and not SearchIndex.CJK_RE.match(words[-1]):
+                pattern = SearchIndex.word_start_pattern(words[-1])
+                uids = list(scores)
+                for i in range(0, len(uids), 500):  # Stay under SQLite's bound-parameter limit
+                    chunk = uids[i:i + 500]
+                    rows = self.conn.execute(f'SELECT uid FROM prompts WHERE uid IN ({",".join("?" * len(chunk))}) AND '
+                                             '(lower_text(title) REGEXP ? OR lower_text(content) REGEXP ?)',
+                                             (*chunk, pattern, pattern))
+                    for uid, in rows:
+                        scores[uid] += 0.25  # The word being typed starts a word in the prompt
+        return SearchIndex.best(scores, limit, boost)
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+class WriteBehind:
+    """Background persistence that coalesces bursts of mutation records.
+
+    Records are queued with the store they belong to; the writer thread waits up to `delay`
+    seconds for more to arrive and then persists each store's run of records with a single
+    append_many() call. flush() is a barrier for callers that need durability now.
+    """
+    def __init__(self, delay: float, on_error, on_written):
+        self.delay = delay
+        self.on_error = on_error
+        self.on_written = on_written
+        self._cond = threading.Condition()
+        self._queue = []  # (store, record) in commit order
+        self._submitted = 0
+        self._written = 0
+        self._urgent = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, store, record: dict) -> None:
+        self.submit_many(store, [record])
+
+    def submit_many(self, store, records: list) -> None:
+        """Queue records together so they reach the store in one append_many() call."""
+        with self._cond:
+            self._queue.extend((store, record) for record in records)
+            self._submitted += len(records)
+            self._cond.notify_all()
+
+    def pending(self) -> bool:
+        with self._cond:
+            return self._written < self._submitted
+
+    def flush(self) -> None:
+        """Block until every record submitted so far has been written (or failed)."""
+        with self._cond:
+            target = self._submitted
+            if self._written >= target:
+                return
+            self._urgent = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._written >= target)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                deadline = time.monotonic() + self.delay
+                while not (self._urgent or self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._queue = self._queue, []
+                self._urgent = False
+            errors = []
+            for store, records in itertools.groupby(batch, key=lambda entry: entry[0]):
+                try:
+                    store.append_many([record for _, record in records])
+                except Exception as e:
+                    print(f"Save error: {e}")
+                    errors.append(e)
+            with self._cond:
+                self._written += len(batch)
+                self._cond.notify_all()
+            # Only now: on_error may wait for the GUI thread, which may be waiting in flush()
+            for e in errors:
+                self.on_error(e)
+            self.on_written()
+
+class SearchCancelled(Exception):
+    """Raised inside a search when a newer query has superseded it."""
+
+def check_cancelled(cancel, i: int) -> None:
+    """Poll a cancel event every 1024 iterations of a search loop."""
+    if cancel is not None and not i & 1023 and cancel.is_set():
+        raise SearchCancelled
+
+class BodyCache:
+    """Dict-like store of texts that keeps recently used ones as str and the rest compressed.
+
+    `budget` caps the bytes of the str entries (None: no cap, nothing is compressed). An
+    entry pushed out of the hot set is compressed the first time and the compressed copy is
+    kept, so it can be dropped again later at no cost. Reading a cold entry is a miss that
+    decompresses it and, unless peeking, makes it hot.
+    """
+    CODECS = {
+        'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+        'lzma': (lambda data: lzma.compress(data, preset=1), lambda data: lzma.decompress(data)),
+    }
+
+    def __init__(self, budget: int = None, codec: str = 'zlib'):
+        self.budget = budget
+        self.codec = codec if codec in self.CODECS else 'zlib'
+        self._compress, self._decompress = self.CODECS[self.codec]
+        self._hot = collections.OrderedDict()  # key -> str, least recently used first
+        self._cold = {}  # key -> compressed UTF-8, for every entry that has been evicted
+        self.hot_bytes = 0
+        self.cold_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __setitem__(self, key, text: str) -> None:
+        self._discard(key)
+        self._hot[key] = text
+        self.hot_bytes += sys.getsizeof(text)
+        self._evict()
+
+    def __delitem__(self, key) -> None:
+        self._discard(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._hot or key in self._cold
+
+    def get(self, key, promote: bool = True) -> str:
+        text = self._hot.get(key)
+        if text is not None:
+            self.hits += 1
+            if promote:
+                self._hot.move_to_end(key)
+            return text
+        self.misses += 1
+        text = self._decompress(self._cold[key]).decode('utf-8')
+        if promote:
+            self._promote(key, text)
+        return text
+
+    def touch(self, key, text: str = None) -> None:
+        """Mark an entry as just used; `text` saves decompressing it again after a peek."""
+        if key in self._hot:
+            self._hot.move_to_end(key)
+        elif key in self._cold:
+            self._promote(key, text if text is not None else self._decompress(self._cold[key]).decode('utf-8'))
+
+    def set_budget(self, budget: int = None) -> None:
+        self.budget = budget
+        self._evict()
+
+    def stats(self) -> dict:
+        return {'entries': len(self._hot.keys() | self._cold.keys()), 'hot_entries': len(self._hot),
+                'hot_bytes': self.hot_bytes, 'cold_bytes': self.cold_bytes, 'hits': self.hits, 'misses': self.misses}
+
+    def _promote(self, key, text: str) -> None:
+        self._hot[key] = text
+        self.hot_bytes += sys.getsizeof(text)
+        self._evict()
+
+    def _discard(self, key) -> None:
+        text = self._hot.pop(key, None)
+        if text is not None:
+            self.hot_bytes -= sys.getsizeof(text)
+        data = self._cold.pop(key, None)
+        if data is not None:
+            self.cold_bytes -= len(data)
+
+    def _evict(self) -> None:
+        while self.budget is not None and self.hot_bytes > self.budget and len(self._hot) > 1:
+            key, text = self._hot.popitem(last=False)
+            self.hot_bytes -= sys.getsizeof(text)
+            if key not in self._cold:
+                data = self._compress(text.encode('utf-8'))
+                self._cold[key] = data
+                self.cold_bytes += len(data)
+
+class SearchIndex:
+    """Case-insensitive substring and fuzzy search over prompts, by scan or through postings.
+
+    Prompts get dense document numbers in the order they are added. Their lowercased titles
+    and contents are always held, the contents in a BodyCache, so under a memory budget the
+    ones not used lately are kept compressed. Searches scan them until postings are ready.
+
+    Once the texts add up to INDEX_MIN_CHARS, a background thread builds the postings: each
+    trigram of a prompt's lowercased title and content maps to the sorted numbers of the
+    documents holding it, and each word outside CJK runs to those holding it as a word. The
+    trigrams are packed SEGMENT_CHARS of text at a time into segments of three arrays (sorted
+    trigram codes, where each one's documents start, the documents), so a trigram costs a few
+    bytes rather than a str and an array object. Prompts added later go to a small dict until
+    they fill a segment of their own. Removed prompts are only marked, and the postings are
+    rebuilt once those outnumber the live ones.
+
+    The memory budget, taken from the BodyCache, covers the whole index: the cache gets what
+    the titles and postings leave of it. Postings taking more than POSTINGS_SHARE of the
+    budget are dropped, and searches scan until the budget changes.
+
+    Queries of three or more characters intersect their trigram postings and confirm the
+    candidates with a substring test, so results are exactly those of a scan. Fuzzy queries
+    rank prompts by shared trigrams, weighting the title above the content; a short query word
+    also matches the words one typo away from it, which a transposition would otherwise leave
+    with too few trigrams in common. Every method takes the index's own lock, so searches run
+    without the model lock.
+    """
+    CJK_RANGES = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'  # Kana, CJK, Hangul
+    TOKEN_RE = re.compile(f'[{CJK_RANGES}]+|[^\\W_{CJK_RANGES}]+')
+    WORD_RE = re.compile(f'[^\\W_{CJK_RANGES}]+')  # The tokens outside CJK runs
+    CJK_RE = re.compile(f'[{CJK_RANGES}]')
+    FUZZY_MIN_SHARED = 0.4  # Fraction of the query's trigrams a fuzzy match must share
+    FUZZY_EDIT_LENGTHS = range(3, 9)  # Query words this long are also matched one typo away
+    EDIT_ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'  # Plus the word's own letters
+    INDEX_MIN_CHARS = 1_000_000  # Below this much text a scan is as fast as the postings
+    SEGMENT_CHARS = 1 << 20  # Text per packed segment; bounds what a build holds unpacked
+    RENUMBER_SLACK = 1024  # Removed document numbers tolerated beyond the live count
+    POSTINGS_SHARE = 0.5  # Fraction of the memory budget the postings may take
+
+    def __init__(self, contents: BodyCache = None):
+        self._keys = []  # doc -> key, None once removed
+        self._titles = []  # doc -> lowercased title
+        self._sizes = array.array('I')  # doc -> characters of title and content
+        self._docs = {}  # key -> doc
+        self.contents = contents if contents is not None else BodyCache()  # key -> lowercased content
+        self._chars = 0  # Characters of the live titles and contents
+        self._segments = []  # (trigram codes, start of each one's docs, docs), in document order
+        self._recent = {}  # trigram -> sorted array of docs added since the last segment
+        self._recent_chars = 0
+        self._words = {}  # word -> sorted array of docs
+        self._indexed = 0  # Docs below this number are in the postings
+        self.ready = False  # The postings cover every document
+        self._builder = None  # Thread building the postings
+        self._generation = 0  # Bumped when the postings are dropped, which stops a build under way
+        self.budget = self.contents.budget  # Bytes for the whole index, None: no cap
+        self.over_budget = False  # The postings did not fit the budget; searches scan
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, key) -> bool:
+        return key in self._docs
+
+    @staticmethod
+    def trigrams(text: str) -> set:
+        return set(map(''.join, zip(text, text[1:], text[2:])))
+
+    @classmethod
+    def words(cls, text: str) -> set:
+        return set(cls.WORD_RE.findall(text))
+
+    @staticmethod
+    def _code(gram: str) -> int:
+        """A trigram as one integer; code points take 21 bits."""
+        return (ord(gram[0]) << 42) | (ord(gram[1]) << 21) | ord(gram[2])
+
+    def add(self, key, title: str, content: str) -> None:
+        title, content = title.lower(), content.lower()
+        with self.lock:
+            self._add(key, title, content)
+
+    def _add(self, key, title: str, content: str) -> None:
+        if key in self._docs:
+            self._remove(key)
+        doc = len(self._keys)  # Above every number in use, so appending keeps postings sorted
+        self._keys.append(key)
+        self._titles.append(title)
+        self._sizes.append(len(title) + len(content))
+        self._docs[key] = doc
+        self.contents[key] = content
+        self._chars += self._sizes[doc]
+        if not self.ready:
+            self._maybe_build()  # The build picks this one up too
+            return
+        grams, words = self._postings([(doc, title, content)])
+        for table, new in ((self._recent, grams), (self._words, words)):
+            self._merge(table, new)
+        self._indexed = doc + 1
+        self._recent_chars += self._sizes[doc]
+        if self._recent_chars >= self.SEGMENT_CHARS:
+            self._segments.append(self._pack(self._recent))
+            self._recent, self._recent_chars = {}, 0
+            self._fit_budget()
+
+    def remove(self, key) -> None:
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key) -> None:
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        self._keys[doc] = None  # Its postings stay until a rebuild; lookups skip it
+        self._titles[doc] = ''
+        self._chars -= self._sizes[doc]
+        del self.contents[key]
+        if len(self._keys) > 2 * len(self._docs) + self.RENUMBER_SLACK:
+            self._renumber()
+
+    def _renumber(self) -> None:
+        """Close the gaps removals left in the document numbers and rebuild the postings."""
+        live = [doc for doc, key in enumerate(self._keys) if key is not None]
+        self._keys = [self._keys[doc] for doc in live]
+        self._titles = [self._titles[doc] for doc in live]
+        self._sizes = array.array('I', [self._sizes[doc] for doc in live])
+        self._docs = {key: i for i, key in enumerate(self._keys)}
+        self._drop_postings()
+        self.over_budget = False  # Fewer documents; their postings may fit now
+        self._maybe_build()
+
+    def _drop_postings(self) -> None:
+        self._segments, self._recent, self._recent_chars, self._words = [], {}, 0, {}
+        self._indexed = 0
+        self.ready = False
+        self._builder = None
+        self._generation += 1
+
+    def close(self) -> None:
+        """Stop a build under way; the index is being replaced."""
+        with self.lock:
+            self._drop_postings()
+
+    def _maybe_build(self) -> None:
+        if self._builder is None and not self.over_budget and self._chars >= self.INDEX_MIN_CHARS:
+            self._builder = threading.Thread(target=self._build, args=(self._generation,), daemon=True)
+            self._builder.start()
+
+    def _build(self, generation: int) -> None:
+        """Index SEGMENT_CHARS of documents at a time, taking the lock only to read and install them."""
+        while True:
+            with self.lock:
+                if generation != self._generation:
+                    return
+                if self._indexed == len(self._keys):
+                    self.ready = True
+                    self._builder = None
+                    return
+                batch, chars, end = [], 0, self._indexed
+                while end < len(self._keys) and chars < self.SEGMENT_CHARS:
+                    key = self._keys[end]
+                    if key is not None:
+                        batch.append((end, self._titles[end], self.contents.get(key, promote=False)))
+                        chars += self._sizes[end]
+                    end += 1
+            grams, words = self._postings(batch)
+            segment = self._pack(grams)
+            del grams
+            with self.lock:
+                if generation != self._generation:
+                    return
+                self._segments.append(segment)
+                self._merge(self._words, words)
+                self._indexed = end
+                self._fit_budget()
+
+    def wait_built(self, timeout: float = None) -> bool:
+        """Block until the postings are ready, if a build is under way; True if they are."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                builder = self._builder
+            if builder is None:
+                return self.ready
+            builder.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if builder.is_alive():
+                return False
+
+    @classmethod
+    def _postings(cls, batch: list) -> tuple[dict, dict]:
+        """Trigram and word postings of (doc, title, content) entries in document order."""
+        grams, words = {}, {}
+        for doc, title, content in batch:
+            for table, terms in ((grams, cls.trigrams(title) | cls.trigrams(content)),
+                                 (words, cls.words(title) | cls.words(content))):
+                for term in terms:
+                    docs = table.get(term)
+                    if docs is None:
+                        table[term] = array.array('I', (doc,))
+                    else:
+                        docs.append(doc)
+        return grams, words
+
+    @staticmethod
+    def _merge(table: dict, new: dict) -> None:
+        """Append postings of later documents to `table`."""
+        for term, docs in new.items():
+            old = table.get(term)
+            if old is None:
+                table[term] = docs
+            else:
+                old.extend(docs)
+
+    @classmethod
+    def _pack(cls, grams: dict) -> tuple:
+        """One segment: sorted trigram codes, where each one's docs start, and the docs end to end."""
+        keys = sorted(grams)  # Code point order, which is also the order of their codes
+        postings = [grams[key] for key in keys]
+        docs = array.array('I', itertools.chain.from_iterable(postings))
+        if docs and max(docs) < 1 << 16:
+            docs = array.array('H', docs)  # Libraries of fewer than 65536 prompts take half the space
+        return (array.array('Q', map(cls._code, keys)),
+                array.array('I', itertools.accumulate(map(len, postings), initial=0)), docs)
+
+    def _gram_docs(self, gram: str) -> set:
+        """Docs holding `gram`, removed ones included."""
+        code = self._code(gram)
+        docs = set()
+        for codes, starts, segment_docs in self._segments:
+            i = bisect.bisect_left(codes, code)
+            if i < len(codes) and codes[i] == code:
+                docs.update(segment_docs[starts[i]:starts[i + 1]])
+        docs.update(self._recent.get(gram, ()))
+        return docs
+
+    def touch(self, key) -> None:
+        with self.lock:
+            self.contents.touch(key)
+
+    def set_budget(self, budget: int = None) -> None:
+        with self.lock:
+            self.budget = budget
+            self.over_budget = False
+            self._fit_budget()
+            self._maybe_build()
+
+    def _fit_budget(self) -> None:
+        """Drop the postings if they take too much of the budget, and give the cache the rest."""
+        if self.budget is None:
+            self.contents.set_budget(None)
+            return
+        titles, postings = self._footprint()
+        if postings > self.budget * self.POSTINGS_SHARE:
+            self._drop_postings()
+            self.over_budget = True
+            postings = 0
+        self.contents.set_budget(max(0, self.budget - titles - postings))
+
+    def _footprint(self) -> tuple[int, int]:
+        """Approximate bytes of the per-document lists (titles included) and of the postings."""
+        titles = (sys.getsizeof(self._keys) + sys.getsizeof(self._docs) + sys.getsizeof(self._sizes)
+                  + sum(map(sys.getsizeof, self._titles)))
+        postings = sum(sys.getsizeof(part) for segment in self._segments for part in segment)
+        for table in (self._recent, self._words):
+            postings += sys.getsizeof(table) + sum(map(sys.getsizeof, table)) + sum(map(sys.getsizeof, table.values()))
+        return titles, postings
+
+    def stats(self) -> dict:
+        """Body cache figures, and the approximate size of the titles and postings."""
+        with self.lock:
+            terms = len(self._recent) + len(self._words) + sum(len(segment[0]) for segment in self._segments)
+            return {**self.contents.stats(), 'index_ready': self.ready, 'index_over_budget': self.over_budget,
+                    'index_terms': terms, 'index_bytes': sum(self._footprint())}
+
+    def _keys_of(self, docs) -> set:
+        keys = self._keys
+        return {keys[doc] for doc in docs} - {None}
+
+    def _texts(self, cancel=None):
+        """(key, title, content) of every live prompt, for a scan."""
+        for doc, key in enumerate(self._keys):
+            check_cancelled(cancel, doc)
+            if key is not None:
+                yield key, self._titles[doc], self.contents.get(key, promote=False)
+
+    def search(self, query: str, cancel=None) -> set:
+        """Keys of prompts whose title or content contains the (lowercased) query."""
+        with self.lock:
+            return self._search(query, cancel)
+
+    def _search(self, query: str, cancel=None) -> set:
+        if not self.ready or len(query) < 3:
+            return {key for key, title, content in self._texts(cancel) if query in title or query in content}
+        postings = []
+        for gram in self.trigrams(query):
+            docs = self._gram_docs(gram)
+            if not docs:
+                return set()
+            postings.append(docs)
+        postings.sort(key=len)
+        candidates = postings[0]
+        for docs in postings[1:]:
+            candidates &= docs
+            if not candidates:
+                break
+        if len(query) == 3:
+            return self._keys_of(candidates)
+        matches = set()
+        for i, doc in enumerate(candidates):
+            check_cancelled(cancel, i)
+            key = self._keys[doc]
+            if key is None:
+                continue
+            if query in self._titles[doc]:
+                matches.add(key)
+                continue
+            content = self.contents.get(key, promote=False)  # A candidate that fails stays cold
+            if query in content:
+                matches.add(key)
+                self.contents.touch(key, content)
+        return matches
+
+    @classmethod
+    def word_start_pattern(cls, prefix: str) -> str:
+        """Regex for `prefix` (a non-CJK word) where it starts a token of TOKEN_RE."""
+        prefix = re.escape(prefix)  # The literal comes first so the regex engine can scan for it
+        return f'{prefix}(?<![^\\W_{cls.CJK_RANGES}]{prefix})'
+
+    @classmethod
+    def shared_gram_scores(cls, postings: list, cancel=None) -> dict:
+        """Score keys by the fuzzy query trigrams they share.
+
+        `postings` holds a (keys, keys with it in the title) pair of sets per query trigram,
+        rarest first; a key needs FUZZY_MIN_SHARED of them to score.
+        """
+        scores = {}
+        if not postings:
+            return scores
+        need = max(1, math.ceil(len(postings) * cls.FUZZY_MIN_SHARED))
+        # A key sharing `need` trigrams must hold one of the len(postings) - need + 1 rarest ones
+        candidates = set().union(*(keys for keys, _ in postings[:len(postings) - need + 1]))
+        for i, key in enumerate(candidates):
+            check_cancelled(cancel, i)
+            shared = sum(1 for keys, _ in postings if key in keys)
+            if shared >= need:
+                in_title = sum(1 for _, keys in postings if key in keys)
+                scores[key] = (2 * in_title + shared) / (3 * len(postings))
+        return scores
+
+    @classmethod
+    def correctable_words(cls, query: str) -> list:
+        """Words of the query short enough that one typo can cost them most of their trigrams."""
+        return [word for word in cls.TOKEN_RE.findall(query)
+                if not cls.CJK_RE.match(word) and len(word) in cls.FUZZY_EDIT_LENGTHS]
+
+    @classmethod
+    def edits(cls, word: str) -> set:
+        """Words one deletion, transposition, substitution or insertion away from `word`."""
+        letters = set(cls.EDIT_ALPHABET) | set(word)
+        splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+        variants = {a + b[1:] for a, b in splits if b}
+        variants.update(a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1)
+        variants.update(a + c + b[1:] for a, b in splits if b for c in letters)
+        variants.update(a + c + b for a, b in splits for c in letters)
+        return {variant for variant in variants if len(variant) >= 3} - {word}
+
+    @staticmethod
+    def add_corrections(scores: dict, query: str, word: str, hits: dict) -> None:
+        """Score keys holding a correction of `word`; `hits` maps each to whether its title does."""
+        weight = len(word) / len(query)
+        for key, in_title in hits.items():
+            scores[key] = scores.get(key, 0) + weight * (1 if in_title else 0.5)
+
+    @staticmethod
+    def best(scores: dict, limit: int, boost: dict = None) -> list:
+        boost = boost or {}
+        return heapq.nlargest(limit, scores, key=lambda key: (scores[key], boost.get(key, 0), -key))
+
+    def search_fuzzy(self, query: str, limit: int, cancel=None, boost: dict = None) -> list:
+        """Best `limit` keys for a typo-tolerant query, highest score first; `boost` breaks ties."""
+        with self.lock:
+            return self._search_fuzzy(query, limit, cancel, boost)
+
+    def _search_fuzzy(self, query: str, limit: int, cancel=None, boost: dict = None) -> list:
+        grams = list(self.trigrams(query))
+        if self.ready:
+            postings = []
+            for gram in grams:
+                keys = self._keys_of(self._gram_docs(gram))
+                postings.append((keys, {key for key in keys if gram in self._titles[self._docs[key]]}))
+        else:
+            postings = [(set(), set()) for _ in grams]
+            for key, title, content in self._texts(cancel):
+                for gram, (keys, titled) in zip(grams, postings):
+                    if gram in title:
+                        keys.add(key)
+                        titled.add(key)
+                    elif gram in content:
+                        keys.add(key)
+        postings.sort(key=lambda pair: len(pair[0]))
+        scores = self.shared_gram_scores(postings, cancel)
+        for key in self._search(query, cancel):
+            scores[key] = scores.get(key, 0) + (2 if query in self._titles[self._docs[key]] else 1)
+        for word in self.correctable_words(query):
+            self.add_corrections(scores, query, word, self._corrections(word, cancel))
+        words = self.TOKEN_RE.findall(query)
+        if words and not self.CJK_RE.match(words[-1]):
+            pattern = re.compile(self.word_start_pattern(words[-1]))
+            for key in scores:
+                if pattern.search(self._titles[self._docs[key]]) or pattern.search(self.contents.get(key, promote=False)):
+                    scores[key] += 0.25  # The word being typed starts a word in the prompt
+        return self.best(scores, limit, boost)
+
+    def _corrections(self, word: str, cancel=None) -> dict:
+        """Keys holding a word one typo away from `word`, mapped to whether the title holds one."""
+        hits = {}
+        if self.ready:
+            for variant in self.edits(word):
+                for doc in self._words.get(variant, ()):
+                    key = self._keys[doc]
+                    if key is not None:
+                        hits[key] = hits.get(key, False) or variant in self._titles[doc]
+            return hits
+        edge = f'[^\\W_{self.CJK_RANGES}]'
+        pattern = re.compile(f'(?<!{edge})(?:{"|".join(map(re.escape, self.edits(word)))})(?!{edge})')
+        for key, title, content in self._texts(cancel):
+            found = set(pattern.findall(title)) | set(pattern.findall(content))
+            if found:
+                hits[key] = any(variant in title for variant in found)
+        return hits
+
+class UsageTracker:
+    """Per-prompt use counts and recency, kept in a small side file next to the library.
+
+    record() only updates a dict; the file is written FLUSH_DELAY seconds after the first
+    unsaved use (and on close), so a copy never touches the snapshot or journal. Each prompt's
+    frecency score grows by one per use and halves every HALF_LIFE seconds. Several instances
+    share the file: a flush merges our uses since the last one into the counts on disk under
+    `lock`, the library's lock file, and takes up the other instances' uses in turn.
+    """
+    FLUSH_DELAY = 30.0
+    HALF_LIFE = 7 * 24 * 3600
+
+    def __init__(self, path: Path, lock: FileLock):
+        self.path = path
+        self.lock = lock
+        self._usage = self._read()  # prompt id -> [use count, last use (epoch seconds), score as of last use]
+        self._unsaved = {}  # The same, for uses since the last flush only
+        self._forgotten = set()  # Prompts deleted since the last flush
+        self._dirty = False
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return {int(k): v for k, v in json.load(f).items() if isinstance(v, list) and len(v) == 3}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Usage load error: {e}")
+        return {}
+
+    @classmethod
+    def _combine(cls, entry, other):
+        """Two usage entries of one prompt as one: counts added, scores decayed to the later use."""
+        if entry is None:
+            return list(other)
+        last = max(entry[1], other[1])
+        decayed = lambda e: e[2] * 0.5 ** ((last - e[1]) / cls.HALF_LIFE)
+        return [entry[0] + other[0], last, decayed(entry) + decayed(other)]
+
+    def record(self, prompt_id: int) -> None:
+        use = [1, time.time(), 1.0]
+        with self._lock:
+            for usage in (self._usage, self._unsaved):
+                usage[prompt_id] = self._combine(usage.get(prompt_id), use)
+            self._mark_dirty()
+
+    def forget(self, prompt_id: int) -> None:
+        with self._lock:
+            self._unsaved.pop(prompt_id, None)
+            if self._usage.pop(prompt_id, None) is not None:
+                self._forgotten.add(prompt_id)
+                self._mark_dirty()
+
+    def scores(self) -> dict:
+        """Current frecency score of every used prompt."""
+        now = time.time()
+        with self._lock:
+            return {prompt_id: score * 0.5 ** ((now - last) / self.HALF_LIFE)
+                    for prompt_id, (_, last, score) in self._usage.items()}
+
+    def _mark_dirty(self) -> None:
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.FLUSH_DELAY, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            unsaved, forgotten = self._unsaved, self._forgotten
+            self._unsaved, self._forgotten, self._dirty = {}, set(), False
+        try:
+            with self.lock:  # Not our own lock: record() goes on while another instance holds this one
+                usage = self._read()
+                for prompt_id in forgotten:
+                    usage.pop(prompt_id, None)
+                for prompt_id, entry in unsaved.items():
+                    usage[prompt_id] = self._combine(usage.get(prompt_id), entry)
+                tmp_path = self.path.with_name(self.path.name + '.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(usage, f)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Usage save error: {e}")
+            with self._lock:  # Kept for the next flush
+                for prompt_id, entry in unsaved.items():
+                    self._unsaved[prompt_id] = self._combine(self._unsaved.get(prompt_id), entry)
+                self._forgotten |= forgotten
+                self._mark_dirty()
+            return
+        with self._lock:
+            for prompt_id, entry in self._unsaved.items():  # Uses since we took the unsaved ones
+                usage[prompt_id] = self._combine(usage.get(prompt_id), entry)
+            for prompt_id in self._forgotten:
+                usage.pop(prompt_id, None)
+            self._usage = usage
+
+NDJSON_SUFFIXES = ('.ndjson', '.jsonl')  # One prompt object per line
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+def export_format(file_path: str) -> tuple[str, str]:
+    """(compression, format) for a path: compression '', 'gz' or 'xz'; format 'json' or 'ndjson'."""
+    suffixes = [suffix.lower() for suffix in Path(file_path).suffixes]
+    compression = suffixes.pop()[1:] if suffixes and suffixes[-1] in ('.gz', '.xz') else ''
+    return compression, 'ndjson' if suffixes and suffixes[-1] in NDJSON_SUFFIXES else 'json'
+
+def open_export(file_path: str, compression: str):
+    """Text file for writing an export, compressed as the extension asks."""
+    if compression == 'gz':
+        return gzip.open(file_path, 'wt', encoding='utf-8', compresslevel=6)
+    if compression == 'xz':
+        return lzma.open(file_path, 'wt', encoding='utf-8')
+    return open(file_path, 'w', encoding='utf-8')
+
+def decompressed(raw):
+    """Wrap a binary file in a gzip or xz reader if its magic bytes say it is compressed."""
+    magic = raw.read(len(XZ_MAGIC))
+    raw.seek(0)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if magic.startswith(XZ_MAGIC):
+        return lzma.LZMAFile(raw)
+    return raw
+
+class PromptStreamReader:
+    """Incremental parser for the prompts in an export file.
+
+    Reads the file in chunks and decodes one array element at a time with
+    JSONDecoder.raw_decode, so memory is bounded by the largest single prompt rather than
+    by the file. Other top-level keys (settings) are parsed and discarded. lines() reads the
+    newline-delimited format instead.
+    """
+    CHUNK_SIZE = 256 * 1024
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+    CUT_TOKEN = 10  # A decode error this close to the buffer's end may be a token cut short (-Infinity)
+
+    def __init__(self, f):
+        self._f = f  # Binary file object
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._json = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self.bytes_read = 0
+
+    def _fill(self) -> None:
+        # Read at least as much as is buffered, so a value spanning many chunks is re-decoded
+        # only O(log n) times
+        chunk = self._f.read(max(self.CHUNK_SIZE, len(self._buf) - self._pos))
+        self.bytes_read += len(chunk)
+        self._eof = not chunk
+        self._buf = self._buf[self._pos:] + self._decoder.decode(chunk, final=self._eof)
+        self._pos = 0
+
+    def _peek(self) -> str:
+        while True:
+            self._pos = self.WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf) or self._eof:
+                return self._buf[self._pos:self._pos + 1]
+            self._fill()
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError("invalid_format")
+        self._pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                # Only a value running off the end of the buffer can be completed by reading on
+                cut = len(self._buf) - e.pos < self.CUT_TOKEN or e.msg.startswith('Unterminated string')
+                if self._eof or not cut:
+                    raise ValueError("invalid_format")
+                self._fill()
+                continue
+            if (not self._eof and isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and self._buf[end:end + 1] in ('', '.', 'e', 'E')):
+                self._fill()  # A number cut at the chunk boundary may continue in the next chunk
+                continue
+            self._pos = end
+            return value
+
+    def prompts(self):
+        """Yield each element of the top-level `prompts` array, or the file itself if it is one prompt."""
+        found = False
+        single = {}  # Fields of a file holding a lone prompt object
+        self._expect('{')
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise ValueError("invalid_format")
+            self._expect(':')
+            if key == 'prompts':
+                found = True
+                self._expect('[')
+                if self._peek() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        separator = self._peek()
+                        self._pos += 1
+                        if separator == ']':
+                            break
+                        if separator != ',':
+                            raise ValueError("invalid_format")
+            elif key in ('title', 'content', 'pinned'):
+                single[key] = self._value()
+            else:
+                self._value()
+            separator = self._peek()
+            self._pos += 1
+            if separator == '}':
+                break
+            if separator != ',':
+                raise ValueError("invalid_format")
+        if not found:
+            if 'title' not in single or 'content' not in single:
+                raise ValueError("invalid_format")
+            yield single
+
+    def lines(self):
+        """Yield the prompt on each line of a newline-delimited file, skipping blank lines."""
+        for line in self._f:
+            self.bytes_read += len(line)
+            if line.strip():
+                try:
+                    yield json.loads(line)  # Bytes: json detects UTF-8 and a leading BOM itself
+                except ValueError:
+                    raise ValueError("invalid_format")
+
+TEXT_SUFFIXES = ('.md', '.txt')  # One prompt per file, titled by the file name
+
+def compression_errors() -> tuple:
+    """Exceptions for a corrupt compressed file; a function so gzip and lzma load only on error."""
+    return (EOFError, zlib.error, lzma.LZMAError, gzip.BadGzipFile)
+
+def is_prompt_file(path: Path) -> bool:
+    suffixes = [suffix.lower() for suffix in path.suffixes[-2:]]
+    if suffixes and suffixes[-1] in ('.gz', '.xz'):
+        suffixes.pop()
+    return bool(suffixes) and suffixes[-1] in ('.json',) + NDJSON_SUFFIXES + TEXT_SUFFIXES
+
+def validate_prompt(prompt) -> dict:
+    """Check an imported prompt object; returns it as {title, content, pinned} or raises ValueError."""
+    if not isinstance(prompt, dict) or not isinstance(prompt.get('title'), str) or not isinstance(prompt.get('content'), str):
+        raise ValueError("invalid_format")
+    if len(prompt['content']) > ConfigManager.MAX_PROMPT_SIZE:
+        raise ValueError("prompt_too_large")
+    return {'title': prompt['title'], 'content': prompt['content'], 'pinned': bool(prompt.get('pinned', False))}
+
+def parse_prompt_file(file_path: str) -> tuple:
+    """Read and validate one file of a folder import; runs in a worker process.
+
+    Returns (file_path, [(prompt, digest), ...], None), or (file_path, None, error key) if
+    any prompt in the file is invalid.
+    """
+    try:
+        path = Path(file_path)
+        if path.suffix.lower() in TEXT_SUFFIXES:
+            if path.stat().st_size > ConfigManager.MAX_PROMPT_SIZE * 4:  # More than MAX_PROMPT_SIZE characters can fill in UTF-8
+                raise ValueError("prompt_too_large")
+            prompts = [{'title': path.stem, 'content': path.read_text(encoding='utf-8-sig')}]
+        else:
+            with open(path, 'rb') as raw:
+                reader = PromptStreamReader(decompressed(raw))
+                prompts = []
+                for prompt in reader.lines() if export_format(file_path)[1] == 'ndjson' else reader.prompts():
+                    if reader.bytes_read > ConfigManager.MAX_IMPORT_SIZE:
+                        raise ValueError("file_too_large")
+                    prompts.append(prompt)
+        prompts = [validate_prompt(p) for p in prompts]
+        return file_path, [(p, ConfigManager._digest(p['title'], p['content'])) for p in prompts], None
+    except (UnicodeDecodeError,) + compression_errors():
+        return file_path, None, "invalid_format"
+    except ValueError as e:
+        return file_path, None, str(e)
+    except OSError as e:
+        print(f"Import error for {file_path}: {e}")
+        return file_path, None, "import_failed"
+
+class ImportBatcher:
+    """Stages validated prompts for one import: drops duplicates, enforces the size budget
+    and spools the accepted prompts to a temporary file, so the import holds one prompt in
+    memory rather than the whole file until commit() hands them to ConfigManager._commit_import."""
+    def __init__(self, config, duplicates: str, summary: dict):
+        self.config = config
+        self.duplicates = duplicates
+        self.summary = summary
+        with config._lock:
+            self.budget = config._size_budget()
+        self.staged = tempfile.TemporaryFile()  # One pickled list per IMPORT_BATCH prompts
+        self.batch, self.count, self.merges, self.seen, self.size = [], 0, [], set(), 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.staged.close()
+
+    def add(self, prompt: dict, digest: bytes = None) -> bool:
+        """Stage one prompt; returns True when it completed a batch."""
+        if self.duplicates != 'keep':
+            digest = digest or ConfigManager._digest(prompt['title'], prompt['content'])
+            with self.config._lock:
+                existing = self.config._dedup_index().get(digest)
+            if existing or digest in self.seen:
+                if self.duplicates == 'merge' and prompt['pinned'] and existing:
+                    self.merges.append(existing[0])
+                    self.summary['merged'] += 1
+                else:
+                    self.summary['skipped'] += 1
+                return False
+            self.seen.add(digest)
+        self.size += len(prompt['content'])
+        if self.budget is not None and self.size > self.budget:
+            raise ValueError("library_too_large")
+        self.batch.append({'id': Prompt.new_id(), **prompt})
+        self.count += 1
+        if len(self.batch) < ConfigManager.IMPORT_BATCH:
+            return False
+        pickle.dump(self.batch, self.staged, pickle.HIGHEST_PROTOCOL)
+        self.batch = []
+        return True
+
+    def batches(self):
+        """Read the staged batches back one at a time."""
+        end = self.staged.tell()
+        self.staged.seek(0)
+        while self.staged.tell() < end:
+            yield pickle.load(self.staged)
+        if self.batch:
+            yield self.batch
+
+    def commit(self) -> None:
+        self.summary['added'] = self.count
+        self.config._commit_import(self.batches(), self.merges, self.size)
+
+class ConfigManager:
+    """Configuration manager for prompts and settings."""
+    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB total limit
+    MAX_PROMPT_SIZE = 1 * 1024 * 1024  # 1 MB per prompt
+    MAX_IMPORT_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB per import file (streamed, not loaded at once)
+    IMPORT_BATCH = 500  # Prompts validated and journaled per import batch
+    FOLDER_POOL_MIN = 32  # Folder imports with fewer files parse them in-process
+    FUZZY_LIMIT = 100  # Ranked results returned by a fuzzy search
+    INDEX_SLICE = 0.02  # Seconds the search index build holds the model lock at a time
+    WRITE_DELAY = 0.5  # Seconds the write-behind thread waits to coalesce a burst of mutations
+    PREVIEW_CHARS = 100  # Characters of each body kept resident for the manager list
+    MAX_PINNED = 5  # Pinned prompts shown in the tray menu
+    BLOB_SLACK = 8 * 1024 * 1024  # Garbage tolerated in the body blob before compaction rewrites it
+
+    def __init__(self, config_dir: Path = APPDATA_DIR, on_load_error=None):
+        self.config_path = config_dir / 'prompts.json'
+        self.db_path = config_dir / 'prompts.db'
+        self.on_load_error = on_load_error  # Called on a thread of its own with the exception if loading fails
+        self.settings = {'language': 'en', 'theme': 'dark'}
+        self.prompts = {}  # Prompt id -> Prompt, in library order
+        self.version = 0  # Bumped on every change to the in-memory model; views compare against it
+        self._order = itertools.count()  # Source of Prompt.order, so ordering survives deletes
+        self._pinned = []  # Sorted (order, id) of pinned prompts, maintained on every mutation
+        self._content_size = 0  # Sum of content_length() over self.prompts, for the MAX_FILE_SIZE check
+        self._digests = None  # Dedup index: content digest -> prompt ids, built lazily on first import/add check
+        self._digest_of = {}  # Prompt id -> its digest in _digests, so forgetting one needs no body
+        self._index = None  # SearchIndex, built on the first non-empty search
+        self._unindexed = []  # Prompt ids the index build has yet to add
+        self._titles = None  # (version, title -> first prompt id), rebuilt after a change
+        self._open_txns = {}  # txn -> journal records of an import waiting for its commit record
+        self._local = {}  # (prompt id or 'settings', field) -> our newest journal record setting it
+        self.store = JournalStore(self.config_path, config_dir / 'prompts.journal', config_dir / 'prompts.snap')
+        self.bodies = BlobStore(self.config_path.parent)  # Prompt bodies for the JSON backend
+        self.backend = self.store  # Where prompt records go: the journal itself or a SqliteStore
+        self._lock = threading.RLock()
+        self._compactor = None
+        self.on_save_error = None  # Called from the writer thread with the exception
+        self._resnapshot = False  # A journal write failed; the next compaction must cover it
+        self._compactor_lock = threading.Lock()
+        self._writer = WriteBehind(self.WRITE_DELAY, self._on_write_error, self._maybe_compact)
+        self.usage = UsageTracker(config_dir / 'usage.json', self.store.lock)  # Copy/edit counts for ranking, outside the journal
+        self._ensure_dir()
+        self.load_config()
+
+    def _ensure_dir(self) -> None:
+        """Ensure config directory exists."""
+        self.config_path.parent.mkdir(parents=True, exist_ok=True)
+
+    @perf.timed('load_config')
+    def load_config(self) -> None:
+        with self._lock:
+            self._writer.flush()  # Queued records were made against the model we are replacing
+            self.version += 1
+            try:
+                for _ in range(JournalStore.LOAD_ATTEMPTS):
+                    data, records = self.store.load()
+                    if self.bodies.open(data.get('blob', 'prompts.0.blob')) or not self.store.changed():
+                        break  # Else a compaction retired the blob after we read the snapshot naming it
+                self.settings = data.get('settings', self.settings)
+                self._reset_index()
+                legacy = False  # Snapshot or journal from before prompt ids and the blob file
+                for p in data.get('prompts', []):
+                    if isinstance(p, Prompt):  # From the binary snapshot, validated when it was written
+                        legacy = legacy or p.content is not None
+                        self._append(p)
+                    elif isinstance(p, dict) and 'title' in p and ('content' in p or 'body' in p):
+                        prompt = Prompt.from_dict(p)
+                        if prompt.content_length() <= self.MAX_PROMPT_SIZE:
+                            legacy = legacy or 'id' not in p or 'content' in p
+                            self._append(prompt)
+                self._open_txns = {}
+                self._local = {}  # Everything of ours is on disk now (flushed above)
+                legacy = self._replay(records) or legacy
+                if self.settings.get('storage') == 'sqlite':
+                    self._load_sqlite()
+                else:
+                    if self.backend is not self.store:
+                        self.backend.close()
+                        self.backend = self.store
+                    if legacy:
+                        self.compact()  # Persist the new ids and move bodies into the blob file
+            except Exception as e:
+                print(f"Config load error: {e}")
+                if self.on_load_error:
+                    # Our caller may hold the model lock, which the GUI thread the hook waits on may want
+                    threading.Thread(target=self.on_load_error, args=(e,), daemon=True).start()
+
+    def _replay(self, records: list, merging: bool = False) -> bool:
+        """Apply journal records, holding back an import's batches until its commit record.
+
+        With merging=True the records come from other instances, and fields that one of our
+        own later records sets are left alone. Returns True if any record predates prompt ids.
+        """
+        legacy = False
+        for record in records:
+            legacy = legacy or 'index' in record
+            txn = record.get('txn')
+            if txn is not None and record['op'] != 'commit':
+                self._open_txns.setdefault(txn, []).append(record)
+                continue
+            for pending in self._open_txns.pop(txn, []) if txn is not None else [record]:
+                if merging:
+                    pending = self._without_overridden(pending)
+                    if pending is None:
+                        continue
+                try:
+                    self._apply(pending)
+                except (KeyError, IndexError, TypeError, AttributeError) as e:
+                    print(f"Skipping journal record {pending.get('seq')}: {e}")
+        return legacy
+
+    def _track_local(self, record: dict) -> None:
+        """Remember our newest record per field it sets (see _without_overridden)."""
+        if record['op'] == 'update':
+            for field in record['fields']:
+                self._local[(record['id'], field)] = record
+        elif record['op'] == 'settings':
+            for key in record['settings']:
+                self._local[('settings', key)] = record
+
+    def _without_overridden(self, record: dict):
+        """`record` minus the fields one of our records later in the journal sets, or None.
+
+        Our edits are applied as they are made but numbered when they reach the journal, so a
+        record merged from another instance may predate one we already applied. A fresh load
+        would let ours win; so does the merge. Edits still waiting for the writer come after
+        everything on disk.
+        """
+        op = record['op']
+        if op not in ('update', 'settings') or not self._local:
+            return record
+        key, values = (record.get('id'), record['fields']) if op == 'update' else ('settings', record['settings'])
+        kept = {}
+        for field, value in values.items():
+            local = self._local.get((key, field))
+            if local is None or local.get('seq', math.inf) < record.get('seq', 0):
+                kept[field] = value
+        if len(kept) == len(values):
+            return record
+        return {**record, 'fields' if op == 'update' else 'settings': kept} if kept else None
+
+    def _blob_name(self):
+        return self.bodies.name if self.backend is self.store else None
+
+    def _merge_changes(self) -> bool:
+        """Bring the model up to the generation on disk; True if anything changed.
+
+        Records other instances appended are applied in place. Only a compaction we cannot
+        follow, a different blob file or prompts.json written from outside needs a full load.
+        """
+        generation = self.store.generation()
+        records = self.store.catch_up()
+        if records is None or any(r['op'] == 'snapshot' and r.get('blob') != self._blob_name() for r in records):
+            self.load_config()
+            return True
+        records = [r for r in records if r['op'] != 'snapshot']
+        if records:
+            self._replay(records, merging=True)
+            self.version += 1
+        # Every record numbered before these of ours has been merged; later ones come after them
+        self._local = {k: r for k, r in self._local.items() if r.get('seq', math.inf) > generation}
+        return bool(records)
+
+    def reload_if_changed(self) -> bool:
+        """Merge what other instances (or a hand edit) changed on disk since we last looked.
+
+        A stat() when nothing changed; otherwise reads just the new journal records.
+        """
+        with self._lock:
+            merged = False
+            if self.backend is not self.store and self.backend.changed():
+                merged = self._merge_rows()
+            if self.store.changed():
+                merged = self._merge_changes() or merged
+            return merged
+
+    def _merge_rows(self) -> bool:
+        """Re-read the database rows other connections changed; True if any did."""
+        self._writer.flush()  # Our queued edits commit after theirs, so the rows read back are final
+        rows = self.backend.changed_rows()
+        if rows is None:
+            self.load_config()
+            return True
+        for prompt_id, row in rows:
+            prompt = self.prompts.get(prompt_id)
+            if row is None:
+                if prompt is not None:
+                    self._apply({'op': 'delete', 'id': prompt_id})
+            elif prompt is None:
+                self._append(row)
+            else:
+                self._apply({'op': 'update', 'id': prompt_id, 'fields': {'pinned': row.pinned}})
+                if self._digests is not None:  # The old body is gone from the database; forget it by id
+                    self._forget_digest(prompt)
+                self._content_size += row.length - prompt.content_length()
+                prompt.title, prompt.content, prompt.preview, prompt.length = row.title, None, row.preview, row.length
+                self._text_changed(prompt)
+        if rows:
+            self.version += 1
+        return bool(rows)
+
+    def _load_sqlite(self) -> None:
+        if not isinstance(self.backend, SqliteStore):
+            self.backend = SqliteStore(self.db_path)
+        leftover = list(self.prompts.values())  # Prompts still in prompts.json, e.g. before the first migration
+        if leftover:
+            self.backend.migrate(self._export_dict(p) for p in leftover)
+        self._reset_index()
+        for p in self.backend.load_prompts():
+            self._append(p)
+        if leftover:
+            self.compact()  # Drop the migrated prompts from prompts.json
+
+    def set_storage(self, storage: str) -> None:
+        """Switch the prompt backend between 'json' and 'sqlite', migrating current prompts."""
+        self._wait_for_compaction()
+        with self._lock:
+            if storage == self.settings.get('storage', 'json'):
+                return
+            self._writer.flush()
+            old = self.backend
+            if storage == 'sqlite':
+                self.backend = SqliteStore(self.db_path)
+                self.backend.migrate((self._export_dict(p) for p in self.prompts.values()), replace=True)
+                self._reset_index()
+                for p in self.backend.load_prompts():
+                    self._append(p)  # Bodies now live in the database
+            else:
+                for p in self.prompts.values():
+                    if p.content is None and p.body is None:
+                        p.content = old.get_content(p.id)  # Spilled into the blob by compact()
+                self.backend = self.store
+            self.settings['storage'] = storage
+            self.version += 1
+            self.compact()  # Persist the choice; prompts move into or out of prompts.json
+            if old is not self.store:
+                old.close()
+
+    @perf.timed('save_config')
+    def save_config(self) -> None:
+        """Write a full snapshot now and empty the journal."""
+        self._wait_for_compaction()
+        self.compact()
+
+    def flush(self) -> None:
+        """Block until every mutation made so far is durable."""
+        self._writer.flush()
+
+    @perf.timed('compact')
+    def compact(self) -> None:
+        """Fold the journal, including other instances' records, into a fresh snapshot.
+
+        Holds the lock file from the merge until the new journal is in place; the model lock
+        is released while the snapshot is written.
+        """
+        with self._lock:
+            if self.store.compacting:
+                return
+            self._writer.flush()  # The snapshot's journal_seq must cover every applied mutation
+            self._resnapshot = False
+            try:
+                self.store.begin_compaction()
+            except OSError as e:
+                print(f"Save error: {e}")
+                return
+            try:
+                self._merge_changes()
+                data = {'settings': dict(self.settings), 'prompts': []}
+                if self.backend is self.store:
+                    self._spill_bodies()
+                    data['prompts'] = [p.to_dict() for p in self.prompts.values()]
+                    data['blob'] = self.bodies.name
+                seq, blob = self.store.generation(), self._blob_name()
+            except Exception as e:
+                self.store.abort_compaction()
+                print(f"Save error: {e}")
+                return
+        try:
+            self.store.write_snapshot(data, seq)
+        except Exception as e:
+            self.store.abort_compaction()
+            print(f"Save error: {e}")
+            return
+        with self.store.lock:  # Kept past finish_compaction, until the stale blobs are gone
+            try:
+                self.store.finish_compaction(seq, blob)
+            except Exception as e:
+                print(f"Journal truncate error: {e}")
+            if blob is not None:
+                # The blob a rewrite retired, or a crash left. Only now that the new journal is in
+                # place: an instance loading the old snapshot sees it and loads again
+                self._remove_stale_blobs()
+
+    def _spill(self, prompt: Prompt) -> None:
+        """Move a resident body into the blob file, keeping only its preview in memory."""
+        content, prompt.content = prompt.content, None
+        prompt.body = self.bodies.put(content)
+        prompt.preview = content[:self.PREVIEW_CHARS]
+        prompt.length = len(content)
+
+    def _spill_bodies(self):
+        """Write resident bodies to the blob and make them durable before a snapshot refers to them.
+
+        Rewrites the blob under a new name once garbage outweighs live bodies.
+        """
+        for p in self.prompts.values():
+            if p.content is not None:
+                self._spill(p)
+        live = sum(p.body[1] for p in self.prompts.values())
+        if self.bodies.size - live > max(live, self.BLOB_SLACK):
+            self.bodies.rewrite(self.prompts.values())
+        self.bodies.sync()
+
+    def _remove_stale_blobs(self) -> None:
+        for path in self.config_path.parent.glob('prompts.*.blob'):
+            if path.name != self.bodies.name:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # Still open in another instance (Windows); a later compaction retries
+
+    def _wait_for_compaction(self) -> None:
+        if self._compactor and self._compactor.is_alive():
+            self._compactor.join()
+
+    def close(self) -> None:
+        """Finish background work; fold any outstanding journal records into the snapshot."""
+        self.usage.flush()
+        self._writer.close()
+        self._wait_for_compaction()
+        if self.store.has_records() or self._resnapshot:
+            self.compact()
+        self.store.close()
+        self.bodies.close()
+        if self.backend is not self.store:
+            self.backend.close()
+
+    def _size_budget(self):
+        """Content bytes still allowed by MAX_FILE_SIZE, or None when the backend has no cap."""
+        if self.backend is not self.store:
+            return None  # The size cap protects the JSON file; the database has no such limit
+        return self.MAX_FILE_SIZE - self._content_size
+
+    def _check_total_size(self, added: int) -> None:
+        budget = self._size_budget()
+        if budget is not None and added > budget:
+            raise ValueError("library_too_large")
+
+    def _reset_index(self) -> None:
+        self.prompts = {}
+        self._pinned = []
+        self._content_size = 0
+        self._drop_index()
+
+        self._digests = None
+        self._digest_of = {}
+
+    def _drop_index(self) -> None:
+        if self._index is not None:
+            self._index.close()  # Stops its postings build
+        self._index = None
+        self._unindexed = []
+
+    def _content(self, prompt: Prompt) -> str:
+        """Body of a prompt: resident if edited since the last compaction, else read from disk."""
+        if prompt.content is not None:
+            return prompt.content
+        if prompt.body is not None:
+            return self.bodies.get(*prompt.body)
+        return self.backend.get_content(prompt.id)
+
+    def _export_dict(self, prompt: Prompt) -> dict:
+        return {'id': prompt.id, 'title': prompt.title, 'content': self._content(prompt), 'pinned': prompt.pinned}
+
+    @staticmethod
+    def _digest(title: str, content: str) -> bytes:
+        """Hash of the normalized prompt: case and whitespace in the title, and surrounding
+        whitespace and line endings in the content, do not make two prompts distinct."""
+        normalized = ' '.join(title.split()).casefold() + '\0' + content.strip().replace('\r\n', '\n')
+        return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+    def _dedup_index(self) -> dict:
+        if self._digests is None:
+            self._digests, self._digest_of = {}, {}
+            for p in self.prompts.values():
+                self._remember_digest(p)
+        return self._digests
+
+    def _remember_digest(self, prompt: Prompt) -> None:
+        digest = self._digest(prompt.title, self._content(prompt))
+        self._digests.setdefault(digest, []).append(prompt.id)
+        self._digest_of[prompt.id] = digest
+
+    def _forget_digest(self, prompt: Prompt) -> None:
+        digest = self._digest_of.pop(prompt.id)
+        ids = self._digests[digest]
+        ids.remove(prompt.id)
+        if not ids:
+            del self._digests[digest]
+
+    def _append(self, prompt: Prompt) -> None:
+        prompt.order = next(self._order)
+        self.prompts[prompt.id] = prompt
+        self._content_size += prompt.content_length()
+        if prompt.pinned:
+            self._pinned.append((prompt.order, prompt.id))  # Newest order, so the list stays sorted
+        if self._index is not None:
+            self._index.add(prompt.id, prompt.title, self._content(prompt))
+        if self._digests is not None:
+            self._remember_digest(prompt)
+
+    def _text_changed(self, prompt: Prompt) -> None:
+        """Re-index a prompt whose title or body changed (its old digest is already forgotten)."""
+        if self._digests is not None:
+            self._remember_digest(prompt)
+        if self._index is not None:
+            self._index.remove(prompt.id)
+            self._index.add(prompt.id, prompt.title, self._content(prompt))
+
+    def _record_id(self, record: dict) -> int:
+        if 'id' in record:
+            return record['id']
+        return list(self.prompts)[record['index']]  # Journal written before prompts had ids
+
+    def _apply(self, record: dict) -> None:
+        """Apply one mutation record to the in-memory model (live or during replay)."""
+        op = record['op']
+        if op == 'add':
+            self._append(Prompt.from_dict(record['prompt']))
+        elif op == 'import':
+            for p in record['prompts']:
+                self._append(Prompt.from_dict(p))
+        elif op == 'update':
+            prompt, fields = self.prompts[self._record_id(record)], record['fields']
+            text_changed = 'title' in fields or 'content' in fields
+            if self._digests is not None and text_changed:
+                self._forget_digest(prompt)
+            if 'title' in fields:
+                prompt.title = fields['title']
+            if 'content' in fields:
+                self._content_size += len(fields['content']) - prompt.content_length()
+                prompt.content = fields['content']  # Stays resident until the next compaction
+                prompt.body = None
+            if 'pinned' in fields and bool(fields['pinned']) != prompt.pinned:
+                prompt.pinned = bool(fields['pinned'])
+                if prompt.pinned:
+                    bisect.insort(self._pinned, (prompt.order, prompt.id))
+                else:
+                    self._pinned.remove((prompt.order, prompt.id))
+            if text_changed:
+                self._text_changed(prompt)
+        elif op == 'delete':
+            prompt_id = self._record_id(record)
+            if self._index is not None:
+                self._index.remove(prompt_id)
+            if self._digests is not None:
+                self._forget_digest(self.prompts[prompt_id])
+            prompt = self.prompts.pop(prompt_id)
+            self._content_size -= prompt.content_length()
+            self.usage.forget(prompt_id)
+            if prompt.pinned:
+                self._pinned.remove((prompt.order, prompt.id))
+        elif op == 'settings':
+            self.settings.update(record['settings'])
+
+    def _on_write_error(self, error: Exception) -> None:
+        self._resnapshot = True
+        if self.on_save_error:
+            self.on_save_error(error)
+
+    def _commit(self, record: dict) -> None:
+        """Apply a mutation and queue it for the write-behind thread."""
+        with self._lock:
+            self._apply(record)
+            self.version += 1
+            store = self.store if record['op'] == 'settings' else self.backend
+            if store is self.store:
+                self._track_local(record)
+            self._writer.submit(store, record)
+
+    def _maybe_compact(self) -> None:
+        """Start a background compaction once the journal is large enough (writer thread)."""
+        if not (self.store.needs_compaction() or self._resnapshot):
+            return
+        with self._compactor_lock:
+            if self._compactor and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self.compact, daemon=True)
+            self._compactor.start()
+
+    @perf.timed('search')
+    def search(self, query: str, fuzzy: bool = False, cancel=None) -> list:
+        """Return ids of prompts whose title or content contains query, case-insensitively.
+
+        Matches are ranked by frecency (see UsageTracker), then library order. With fuzzy=True,
+        return up to FUZZY_LIMIT typo-tolerant matches, best first, frecency breaking ties.
+        Raises SearchCancelled if the `cancel` event is set while the search runs.
+        """
+        query = query.lower()
+        with self._lock:
+            if not query:
+                return list(self.prompts)
+            backend = self.backend
+        usage = self.usage.scores()
+        if backend is not self.store:
+            self._writer.flush()  # The database only matches us once our writes land
+            if not fuzzy:
+                hits = backend.search(query)
+                return sorted(hits, key=lambda prompt_id: -usage.get(prompt_id, 0)) if usage else hits
+            hits = backend.search_fuzzy(query, self.FUZZY_LIMIT, cancel, boost=usage)
+            if hits is not None:
+                return hits
+        index = self._search_index(cancel)
+        if fuzzy:
+            hits = index.search_fuzzy(query, self.FUZZY_LIMIT, cancel, boost=usage)
+            with self._lock:
+                return [prompt_id for prompt_id in hits if prompt_id in self.prompts]
+        hits = index.search(query, cancel)
+        with self._lock:  # Drop prompts deleted while the index was searched
+            return sorted((prompt_id for prompt_id in hits if prompt_id in self.prompts),
+                          key=lambda prompt_id: (-usage.get(prompt_id, 0), self.prompts[prompt_id].order))
+
+    def _search_index(self, cancel=None) -> SearchIndex:
+        """The search index, loaded with the prompts' texts on first use a slice at a time.
+
+        Each slice holds the model lock for at most INDEX_SLICE seconds, so edits and reloads
+        go on meanwhile. Raises SearchCancelled if `cancel` is set before every prompt is in.
+        The index then scans the texts until its own thread has built the postings.
+        """
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise SearchCancelled
+            with self._lock:
+                if self._index is None:
+                    self._index = SearchIndex(BodyCache(self._memory_budget(), self.settings.get('body_codec', 'zlib')))
+                    self._unindexed = list(self.prompts)
+                index = self._index
+                deadline = time.perf_counter() + self.INDEX_SLICE
+                while self._unindexed and time.perf_counter() < deadline:
+                    prompt = self.prompts.get(self._unindexed.pop())
+                    if prompt is not None and prompt.id not in index:  # An edit may have indexed it already
+                        index.add(prompt.id, prompt.title, self._content(prompt))
+                if not self._unindexed:
+                    return index
+            time.sleep(0)  # Let a thread waiting for the lock have it
+
+    def wait_for_index(self, timeout: float = None) -> bool:
+        """Load the search index and wait for its postings; False if it scans (a small library)."""
+        return self._search_index().wait_built(timeout)
+
+    def pinned_prompts(self) -> list:
+        """Pinned prompts in library order."""
+        with self._lock:
+            return [self.prompts[prompt_id] for _, prompt_id in self._pinned]
+
+    def pinned_count(self) -> int:
+        return len(self._pinned)
+
+    def find_by_title(self, title: str):
+        """Id of the first prompt with exactly this title, or None."""
+        with self._lock:
+            if self._titles is None or self._titles[0] != self.version:
+                titles = {}
+                for p in self.prompts.values():
+                    titles.setdefault(p.title, p.id)
+                self._titles = (self.version, titles)
+            return self._titles[1].get(title)
+
+    def record_use(self, prompt_id: int) -> None:
+        """Count a copy or edit of the prompt towards its frecency; costs a dict update."""
+        if prompt_id in self.prompts:
+            self.usage.record(prompt_id)
+
+    def most_used(self, limit: int) -> list:
+        """Unpinned prompts with the highest frecency, best first."""
+        scores = self.usage.scores()
+        with self._lock:
+            ranked = [prompt_id for prompt_id in scores if prompt_id in self.prompts and not self.prompts[prompt_id].pinned]
+            return [self.prompts[prompt_id] for prompt_id in heapq.nlargest(limit, ranked, key=scores.get)]
+
+    def find_duplicate(self, title: str, content: str):
+        """Return the id of a prompt identical to this one after normalization, or None."""
+        with self._lock:
+            ids = self._dedup_index().get(self._digest(title, content))
+            return ids[0] if ids else None
+
+    @perf.timed('import_prompts')
+    def import_prompts(self, file_path: str, progress=None, duplicates: str = 'skip') -> tuple[bool, str, dict]:
+        """Import prompts from JSON file with validation.
+
+        Newline-delimited files (.ndjson/.jsonl) hold one prompt per line; gzip and xz files are
+        recognised by their magic bytes and decompressed on the fly. The file is streamed and
+        validated in batches of IMPORT_BATCH; nothing is applied unless every prompt validates.
+        `progress(count, fraction)` is called after each batch on the calling thread, so this
+        can run off the Tk thread.
+
+        `duplicates` decides what happens to prompts already in the library (or repeated within
+        the file): 'skip' drops them, 'merge' drops them but pins the existing prompt if the
+        imported copy is pinned, and 'keep' imports them anyway. The returned summary counts
+        added, skipped and merged prompts.
+        """
+        summary = {'added': 0, 'skipped': 0, 'merged': 0}
+        try:
+            file_size = os.path.getsize(file_path)
+            if file_size > self.MAX_IMPORT_SIZE:
+                raise ValueError("file_too_large")
+            count = 0
+            ndjson = export_format(file_path)[1] == 'ndjson'
+            with ImportBatcher(self, duplicates, summary) as batcher:
+                with open(file_path, 'rb') as raw:
+                    reader = PromptStreamReader(decompressed(raw))
+                    for prompt in reader.lines() if ndjson else reader.prompts():
+                        if reader.bytes_read > self.MAX_IMPORT_SIZE:
+                            raise ValueError("file_too_large")  # Also caps what a compressed file expands to
+                        count += 1
+                        if batcher.add(validate_prompt(prompt)) and progress:
+                            progress(count, min(raw.tell() / max(file_size, 1), 1.0))
+                batcher.commit()
+            if progress:
+                progress(count, 1.0)
+            return True, "import_success", summary
+        except (UnicodeDecodeError,) + compression_errors():
+            return False, "invalid_format", summary  # Includes truncated or corrupt compressed files
+        except ValueError as e:
+            return False, str(e), summary
+        except Exception as e:
+            print(f"Import error: {e}")
+            return False, "import_failed", summary
+
+    @perf.timed('import_folder')
+    def import_folder(self, folder: str, progress=None, duplicates: str = 'skip', workers: int = None) -> tuple[bool, str, dict]:
+        """Import every prompt file under `folder`, parsing and validating them in worker processes.
+
+        Takes .json/.ndjson/.jsonl files (optionally .gz/.xz) and .md/.txt files, which become
+        one prompt titled by the file name. Invalid files are left out and listed in
+        summary['failed'] as (relative path, error key); everything else is committed as one
+        import transaction. `progress(files_done, fraction)` is called on the calling thread.
+        The summary also counts the files imported and the seconds taken.
+        """
+        summary = {'added': 0, 'skipped': 0, 'merged': 0, 'files': 0, 'failed': [], 'seconds': 0.0}
+        start = time.perf_counter()
+        try:
+            paths = [str(p) for p in sorted(Path(folder).rglob('*')) if is_prompt_file(p) and p.is_file()]
+            pool = None
+            if len(paths) < self.FOLDER_POOL_MIN or workers == 1:
+                results = map(parse_prompt_file, paths)
+            else:
+                workers = workers or os.cpu_count() or 1
+                pool = futures.ProcessPoolExecutor(workers)
+                # A few chunks per worker: amortizes the pickling round trips while balancing load
+                results = pool.map(parse_prompt_file, paths, chunksize=max(1, min(64, len(paths) // (workers * 4))))
+            with ImportBatcher(self, duplicates, summary) as batcher:
+                try:
+                    step = max(1, len(paths) // 100)
+                    for done, (path, prompts, error) in enumerate(results, 1):
+                        if error:
+                            summary['failed'].append((os.path.relpath(path, folder), error))
+                        else:
+                            for prompt, digest in prompts:
+                                batcher.add(prompt, digest)
+                        if progress and (done % step == 0 or done == len(paths)):
+                            progress(done, done / len(paths))
+                finally:
+                    if pool:
+                        pool.shutdown(cancel_futures=True)
+                summary['files'] = len(paths) - len(summary['failed'])
+                batcher.commit()
+            summary['seconds'] = time.perf_counter() - start
+            return True, "import_success", summary
+        except ValueError as e:
+            return False, str(e), summary
+        except Exception as e:
+            print(f"Folder import error: {e}")
+            return False, "import_failed", summary
+
+    def _commit_import(self, batches, merges: list, size: int) -> None:
+        """Apply validated import batches as one transaction.
+
+        Each batch becomes its own journal record tagged with a transaction id and a final
+        commit record closes it; replay ignores batches whose commit never made it to disk.
+        Batches are written to the journal as they are read, so one is held at a time besides
+        the model; if a write fails, the prompts already applied are taken out again. The
+        database instead takes every prompt in one SQLite transaction, read batch by batch, and
+        the model keeps only their previews. `merges` holds the ids of existing prompts to pin.
+        """
+        with self._lock:
+            self._check_total_size(size)
+            txn = os.urandom(8).hex()
+            records = [{'op': 'update', 'txn': txn, 'id': prompt_id, 'fields': {'pinned': True}}
+                       for prompt_id in dict.fromkeys(merges) if prompt_id in self.prompts]  # Skip prompts deleted meanwhile
+            self._writer.flush()  # The new prompts land after everything queued before the import
+            journaled = False
+            if self.backend is not self.store:
+                added = []
+                self.backend.migrate(self._import_rows(batches, added))
+                for prompt in added:
+                    self._append(prompt)
+                self.version += 1
+            else:
+                journaled = self._journal_import(batches, txn)
+            if not (records or journaled):
+                return
+            records.append({'op': 'commit', 'txn': txn})
+            for record in records:
+                self._apply(record)
+            self.version += 1
+            self._writer.submit_many(self.backend, records)
+
+    def _journal_import(self, batches, txn: str) -> bool:
+        """Write each batch to the journal and apply it, one at a time; True if there were any."""
+        added = []
+        try:
+            for batch in batches:
+                record = {'op': 'import', 'txn': txn, 'prompts': batch}
+                self.store.append_many([record])
+                self._apply(record)
+                added += [p['id'] for p in batch]
+                del record, batch  # Freed before the next batch is unpickled
+        except Exception:
+            for prompt_id in added:  # Their batches are on disk, but without a commit record replay skips them
+                self._apply({'op': 'delete', 'id': prompt_id})
+            raise
+        return bool(added)
+
+    def _import_rows(self, batches, added: list):
+        """Yield the prompts of `batches`, collecting a body-less Prompt for each in `added`."""
+        for batch in batches:
+            for p in batch:
+                added.append(Prompt(p['id'], p['title'], pinned=p['pinned'], preview=p['content'][:self.PREVIEW_CHARS],
+                                    length=len(p['content'])))
+                yield p
+
+    @perf.timed('export_prompts')
+    def export_prompts(self, file_path: str) -> tuple[bool, str]:
+        """Export prompts to JSON file, reading and writing one prompt at a time.
+
+        The extension picks the format: .ndjson/.jsonl writes one prompt per line (no settings),
+        and a trailing .gz or .xz compresses the stream.
+        """
+        try:
+            with self._lock:
+                settings, prompts = dict(self.settings), list(self.prompts.values())
+            compression, fmt = export_format(file_path)
+            with open_export(file_path, compression) as f:
+                if fmt == 'json':
+                    f.write('{\n  "settings": ' + json.dumps(settings, ensure_ascii=False) + ',\n  "prompts": [')
+                for i, p in enumerate(prompts):
+                    with self._lock:  # Compaction may repoint bodies; read each under the model lock
+                        entry = {'title': p.title, 'content': self._content(p), 'pinned': p.pinned}
+                    if fmt == 'json':
+                        f.write((',\n    ' if i else '\n    ') + json.dumps(entry, ensure_ascii=False))
+                    else:
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                if fmt == 'json':
+                    f.write('\n  ]\n}\n')
+            return True, "export_success"
+        except Exception as e:
+            print(f"Export error: {e}")
+            return False, "export_failed"
+
+    def add_prompt(self, title: str, content: str, pinned: bool = False) -> int:
+        if len(content) > self.MAX_PROMPT_SIZE:
+            raise ValueError("prompt_too_large")
+        self._check_total_size(len(content))
+        prompt_id = Prompt.new_id()
+        self._commit({'op': 'add', 'prompt': {'id': prompt_id, 'title': title, 'content': content, 'pinned': pinned}})
+        return prompt_id
+
+    def update_prompt(self, prompt_id: int, title: str, content: str, pinned: bool = None) -> None:
+        if prompt_id in self.prompts:
+            if len(content) > self.MAX_PROMPT_SIZE:
+                raise ValueError("prompt_too_large")
+            self._check_total_size(len(content) - self.prompts[prompt_id].content_length())
+            fields = {'title': title, 'content': content}
+            if pinned is not None:
+                fields['pinned'] = pinned
+            self._commit({'op': 'update', 'id': prompt_id, 'fields': fields})
+
+    def delete_prompt(self, prompt_id: int) -> None:
+        if prompt_id in self.prompts:
+            self._commit({'op': 'delete', 'id': prompt_id})
+
+    def get_prompt(self, prompt_id: int):
+        """Return the prompt as a dict with its body loaded, or None.
+
+        Counts as a use of the prompt (copy, edit), keeping its searchable body uncompressed.
+        """
+        with self._lock:
+            prompt = self.prompts.get(prompt_id)
+            if prompt and self._index is not None:
+                self._index.touch(prompt_id)
+            return self._export_dict(prompt) if prompt else None
+
+    def _memory_budget(self):
+        budget_mb = self.settings.get('memory_budget_mb', 0)
+        return budget_mb * 1024 * 1024 if budget_mb else None
+
+    def set_memory_budget(self, budget_mb: int, codec: str = None) -> None:
+        """Cap the search index at `budget_mb` MB (0: no cap).
+
+        Titles and postings (memory_stats() reports them as index_bytes) count first; bodies
+        not used lately are kept compressed with `codec` ('zlib' or 'lzma') to fit the rest.
+        Postings over half the budget are dropped and searches scan instead.
+        """
+        settings = {'memory_budget_mb': budget_mb}
+        if codec:
+            settings['body_codec'] = codec
+        self._commit({'op': 'settings', 'settings': settings})
+        with self._lock:
+            if self._index is not None:
+                if codec and codec != self._index.contents.codec:
+                    self._drop_index()  # Rebuilt with the new codec on the next search
+                else:
+                    self._index.set_budget(self._memory_budget())
+
+    def memory_stats(self) -> dict:
+        """Body cache hit/miss and size figures, and the size of the titles and postings."""
+        with self._lock:
+            stats = {'budget_mb': self.settings.get('memory_budget_mb', 0),
+                     'codec': self.settings.get('body_codec', 'zlib'),
+                     'resident_bodies': sum(1 for p in self.prompts.values() if p.content is not None),
+                     'resident_bytes': sum(sys.getsizeof(p.content) for p in self.prompts.values() if p.content is not None)}
+            if self._index is not None:
+                stats.update(self._index.stats())
+            return stats
+
+    def toggle_pin(self, prompt_id: int) -> bool:
+        if prompt_id in self.prompts:
+            pinned = not self.prompts[prompt_id].pinned
+            self._commit({'op': 'update', 'id': prompt_id, 'fields': {'pinned': pinned}})
+            return pinned
+        return False
+
+    def switch_language(self) -> None:
+        self._commit({'op': 'settings', 'settings': {'language': 'en' if self.settings['language'] == 'zh' else 'zh'}})
+
+    def switch_theme(self) -> None:
+        self._commit({'op': 'settings', 'settings': {'theme': 'dark' if self.settings['theme'] == 'light' else 'light'}})
+
+    def set_setting(self, key: str, value) -> None:
+        self._commit({'op': 'settings', 'settings': {key: value}})
+
+class ClipboardService:
+    """One long-lived thread for clipboard work, fed by a deadline heap.
+
+    run_soon() queues a job (loading and copying a large body off the tray thread); copy(),
+    called from such a job, puts text on the clipboard and schedules its auto-clear. A newer
+    copy supersedes the pending clear, and a clear only runs if the clipboard still holds the
+    text we put there, so anything the user copied since is left alone. `clipboard` is
+    anything with pyperclip's copy() and paste().
+    """
+    CLEAR_DELAY = 30.0  # Seconds before copied prompt text is cleared
+
+    def __init__(self, on_cleared, clipboard):
+        self.clipboard = clipboard
+        self.on_cleared = on_cleared  # Called on the clipboard thread after an auto-clear
+        self._heap = []  # (deadline, seq, func, args)
+        self._seq = itertools.count()  # Keeps equal deadlines in submission order
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._owned = None  # Text we last copied, until it is cleared
+        self._generation = 0  # Bumped per copy; a clear for an older copy is stale
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def run_soon(self, func, *args) -> None:
+        self._schedule(0.0, func, args)
+
+    def copy(self, text: str) -> None:
+        """Copy `text` and schedule its clear; only call from a job on the clipboard thread."""
+        self.clipboard.copy(text)
+        self._owned = text
+        self._generation += 1
+        self._schedule(self.CLEAR_DELAY, self._clear, (self._generation,))
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _schedule(self, delay: float, func, args: tuple) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), func, args))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if self._stopped:
+                    return
+                _, _, func, args = heapq.heappop(self._heap)
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Clipboard error: {e}")
+
+    def _clear(self, generation: int) -> None:
+        if generation != self._generation or self._owned is None:
+            return  # A later copy owns the clipboard now and has its own clear
+        owned, self._owned = self._owned, None
+        if self.clipboard.paste() != owned:
+            return  # The user copied something else meanwhile
+        self.clipboard.copy('')
+        self.on_cleared()
+
+class SearchWorker:
+    """Runs searches on one long-lived thread so typing never waits on a query.
+
+    Submitting a query cancels the one in flight; results are handed back to the Tk thread
+    through the app's gui_queue.
+    """
+    def __init__(self, config, gui_queue):
+        self.config = config
+        self.gui_queue = gui_queue
+        self._jobs = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, fuzzy: bool, callback) -> None:
+        self._cancel.set()
+        self._cancel = threading.Event()
+        self._jobs.put((query, fuzzy, self._cancel, callback))
+
+    def stop(self) -> None:
+        self._cancel.set()
+        self._jobs.put(None)
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            query, fuzzy, cancel, callback = job
+            if cancel.is_set():
+                continue  # Superseded while queued
+            try:
+                results = self.config.search(query, fuzzy=fuzzy, cancel=cancel)
+            except SearchCancelled:
+                continue
+            except Exception as e:
+                print(f"Search error: {e}")
+                continue
+            if not cancel.is_set():
+                self.gui_queue.put((callback, (results,), {}))
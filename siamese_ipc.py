@@ -0,0 +1,273 @@
+"""Local request/response API for scripts, served by the running tray app.
+
+The server listens on 127.0.0.1 and answers from the library the app already has in memory,
+so a script gets a prompt or a search without loading prompts.json itself. Requests and
+responses are newline-delimited JSON over one TCP connection that stays open:
+
+    {"id": 1, "op": "search", "query": "email", "limit": 5}
+    {"id": 1, "ok": true, "result": [{"id": ..., "title": ..., "preview": ...}]}
+
+A client may send many requests before reading any response (pipelining); responses come
+back in request order. The first request on a connection must be {"op": "auth", "token": ...}
+with the token from ipc.json, which the server writes on start and removes on stop.
+
+    python siamese_ipc.py search email
+    python siamese_ipc.py get "Weekly report"
+"""
+import hmac
+import json
+import os
+import secrets
+import socket
+import sys
+import threading
+from pathlib import Path
+
+from siamese_core import APPDATA_DIR, perf
+
+IPC_INFO_PATH = APPDATA_DIR / 'ipc.json'  # Port, token and pid of the running server
+
+
+class IpcError(Exception):
+    """A request the server answered with ok: false."""
+
+
+class IpcServer:
+    """Serves get/search/copy requests from a ConfigManager on a localhost TCP port.
+
+    One thread accepts connections and each connection gets its own thread. All complete
+    requests in a received chunk are answered with a single send.
+    """
+    MAX_LINE = 64 * 1024  # Requests are small; anything longer closes the connection
+    SEARCH_LIMIT = 50
+
+    def __init__(self, config, on_copy=None, info_path: Path = IPC_INFO_PATH,
+                 host: str = '127.0.0.1', port: int = 0):
+        self.config = config
+        self.on_copy = on_copy  # Called with a prompt id; the tray app copies and notifies
+        self.info_path = Path(info_path)
+        self.token = secrets.token_hex(16)
+        self._sock = socket.create_server((host, port))
+        self.address = self._sock.getsockname()[:2]
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ops = {'ping': self._ping, 'get': self._get, 'search': self._search, 'copy': self._copy}
+
+    def start(self) -> None:
+        info = {'port': self.address[1], 'token': self.token, 'pid': os.getpid()}
+        tmp = self.info_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(info), encoding='utf-8')
+        os.replace(tmp, self.info_path)
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        try:
+            self.info_path.unlink()
+        except OSError:
+            pass
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return  # Closed by stop()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._connections.add(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        buffer = b''
+        authed = False
+        try:
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    return
+                buffer += chunk
+                *lines, buffer = buffer.split(b'\n')
+                if len(buffer) > self.MAX_LINE:
+                    return
+                replies = []
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    reply, authed = self._handle(line, authed)
+                    replies.append(reply)
+                    if not authed:
+                        break
+                if replies:
+                    conn.sendall(b''.join(replies))
+                if not authed:
+                    return
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def _handle(self, line: bytes, authed: bool) -> tuple:
+        """Answer one request line; returns the encoded response and the new auth state."""
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            request_id = request.get('id')
+            op = request.get('op')
+            if not authed:
+                if op != 'auth' or not hmac.compare_digest(str(request.get('token', '')), self.token):
+                    return self._encode(request_id, error='authentication required'), False
+                return self._encode(request_id, result=True), True
+            handler = self._ops.get(op)
+            if handler is None:
+                raise ValueError(f"unknown op: {op!r}")
+            return self._encode(request_id, result=handler(request)), True
+        except (ValueError, TypeError, LookupError) as e:
+            return self._encode(request_id, error=str(e)), authed
+        except Exception as e:  # A failing handler answers this request, not the whole connection
+            print(f"IPC request error: {e}")
+            return self._encode(request_id, error=str(e)), authed
+
+    @staticmethod
+    def _encode(request_id, result=None, error=None) -> bytes:
+        reply = {'id': request_id, 'ok': error is None}
+        if error is None:
+            reply['result'] = result
+        else:
+            reply['error'] = error
+        return json.dumps(reply, ensure_ascii=False).encode('utf-8') + b'\n'
+
+    def _prompt_id(self, request: dict) -> int:
+        if 'title' in request:
+            prompt_id = self.config.find_by_title(request['title'])
+        else:
+            prompt_id = request.get('prompt_id')
+        if prompt_id is None or prompt_id not in self.config.prompts:
+            raise LookupError('prompt not found')
+        return prompt_id
+
+    def _ping(self, request: dict):
+        return len(self.config.prompts)
+
+    @perf.timed('ipc_get')
+    def _get(self, request: dict):
+        prompt = self.config.get_prompt(self._prompt_id(request))
+        if prompt is None:
+            raise LookupError('prompt not found')
+        return prompt
+
+    @perf.timed('ipc_search')
+    def _search(self, request: dict):
+        query = request.get('query', '')
+        if not isinstance(query, str):
+            raise TypeError("query must be a string")
+        limit = max(0, min(int(request.get('limit', self.SEARCH_LIMIT)), self.SEARCH_LIMIT))  # [:-1] would drop one
+        results = []
+        for prompt_id in self.config.search(query, fuzzy=bool(request.get('fuzzy')))[:limit]:
+            prompt = self.config.prompts.get(prompt_id)
+            if prompt:
+                results.append({'id': prompt.id, 'title': prompt.title, 'preview': prompt.preview_text()})
+        return results
+
+    def _copy(self, request: dict):
+        if self.on_copy is None:
+            raise ValueError("copy is not available")
+        prompt_id = self._prompt_id(request)
+        self.on_copy(prompt_id)
+        return prompt_id
+
+
+class IpcClient:
+    """Keeps one authenticated connection to the server in ipc.json."""
+
+    def __init__(self, info_path: Path = IPC_INFO_PATH, timeout: float = 5.0):
+        try:
+            info = json.loads(Path(info_path).read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            raise ConnectionError(f"Siamese local API is not running: {e}") from e
+        self._sock = socket.create_connection(('127.0.0.1', info['port']), timeout=timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile('rb')
+        self._next_id = 0
+        self.request('auth', token=info['token'])
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def request(self, op: str, **params):
+        return self.pipeline([dict(params, op=op)])[0]
+
+    def pipeline(self, requests: list) -> list:
+        """Send all requests at once, then read their results in order."""
+        first = self._next_id
+        self._next_id += len(requests)
+        self._sock.sendall(b''.join(
+            json.dumps(dict(request, id=first + i), ensure_ascii=False).encode('utf-8') + b'\n'
+            for i, request in enumerate(requests)))
+        results = []
+        for _ in requests:
+            line = self._file.readline()
+            if not line:
+                raise ConnectionError("connection closed by the server")
+            reply = json.loads(line)
+            if not reply.get('ok'):
+                raise IpcError(reply.get('error'))
+            results.append(reply['result'])
+        return results
+
+    def get(self, prompt_id: int = None, title: str = None) -> dict:
+        return self.request('get', **({'title': title} if title is not None else {'prompt_id': prompt_id}))
+
+    def search(self, query: str, fuzzy: bool = False, limit: int = 20) -> list:
+        return self.request('search', query=query, fuzzy=fuzzy, limit=limit)
+
+    def copy(self, prompt_id: int = None, title: str = None) -> int:
+        return self.request('copy', **({'title': title} if title is not None else {'prompt_id': prompt_id}))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] not in ('get', 'search', 'copy'):
+        print("usage: siamese_ipc.py get|search|copy <title or query>")
+        return 2
+    op, text = argv[0], ' '.join(argv[1:])
+    try:
+        with IpcClient() as client:
+            if op == 'search':
+                for hit in client.search(text):
+                    print(f"{hit['id']}\t{hit['title']}")
+            elif op == 'get':
+                print(client.get(title=text)['content'])
+            else:
+                client.copy(title=text)
+    except (ConnectionError, OSError, IpcError) as e:
+        print(f"Local API error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
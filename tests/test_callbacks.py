@@ -0,0 +1,45 @@
+"""Error hooks must not run where they can deadlock against a GUI thread waiting on us."""
+import threading
+import time
+
+from siamese_core import ConfigManager, WriteBehind
+
+
+class FailingStore:
+    def append_many(self, records):
+        raise OSError('disk full')
+
+
+def test_flush_returns_before_the_error_hook_runs():
+    hook_may_finish = threading.Event()
+    writer = WriteBehind(0, on_error=lambda e: hook_may_finish.wait(5), on_written=lambda: None)
+    writer.submit(FailingStore(), {'op': 'add'})
+    start = time.perf_counter()
+    writer.flush()  # A GUI thread flushing while the hook waits on it
+    assert time.perf_counter() - start < 2
+    hook_may_finish.set()
+    writer.close()
+
+
+def test_load_error_hook_runs_outside_the_model_lock(tmp_path, monkeypatch):
+    config = ConfigManager(config_dir=tmp_path)
+    done = threading.Event()
+    got_lock = []
+
+    def needs_lock():
+        got_lock.append(config._lock.acquire(timeout=5))
+        if got_lock[-1]:
+            config._lock.release()
+
+    def hook(error):
+        waiter = threading.Thread(target=needs_lock)  # Like GuiDispatcher.put waiting on the Tk thread
+        waiter.start()
+        waiter.join()
+        done.set()
+
+    config.on_load_error = hook
+    monkeypatch.setattr(config.store, 'load', lambda: 1 / 0)
+    with config._lock:  # As when reload_if_changed falls back to a full load
+        config.load_config()
+    assert done.wait(10) and got_lock == [True]
+    config.close()
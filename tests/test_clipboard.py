@@ -0,0 +1,82 @@
+"""Clipboard scheduler: jobs in deadline order on one thread, and clears only of our own text."""
+import threading
+import time
+
+import pytest
+
+from siamese_core import ClipboardService
+
+
+class FakeClipboard:
+    def __init__(self):
+        self.text = ''
+        self.copies = []
+
+    def copy(self, text):
+        self.text = text
+        self.copies.append(text)
+
+    def paste(self):
+        return self.text
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(ClipboardService, 'CLEAR_DELAY', 0.2)
+    cleared = threading.Event()
+    clipboard = FakeClipboard()
+    service = ClipboardService(cleared.set, clipboard)
+    yield service, clipboard, cleared
+    service.stop()
+
+
+def run(service, func, *args):
+    """Run a job on the clipboard thread and wait for it."""
+    done = threading.Event()
+    service.run_soon(lambda: (func(*args), done.set()))
+    assert done.wait(5)
+
+
+def test_jobs_run_by_deadline_on_one_thread(service):
+    service, _, _ = service
+    order, threads = [], set()
+    done = threading.Event()
+    job = lambda name: (order.append(name), threads.add(threading.get_ident()))
+    service._schedule(0.06, lambda: (job('late'), done.set()), ())
+    service._schedule(0.03, job, ('middle',))
+    service.run_soon(job, 'now')
+    assert done.wait(5)
+    assert order == ['now', 'middle', 'late'] and len(threads) == 1
+
+
+def test_copied_text_is_cleared_after_the_delay(service):
+    service, clipboard, cleared = service
+    run(service, service.copy, 'secret')
+    assert clipboard.text == 'secret'
+    assert cleared.wait(5) and clipboard.text == ''
+
+
+def test_text_the_user_copied_since_is_left_alone(service):
+    service, clipboard, cleared = service
+    run(service, service.copy, 'secret')
+    clipboard.text = 'copied by the user'
+    time.sleep(0.4)
+    assert clipboard.text == 'copied by the user' and not cleared.is_set()
+
+
+def test_a_newer_copy_supersedes_the_pending_clear(service):
+    service, clipboard, cleared = service
+    run(service, service.copy, 'first')
+    time.sleep(0.1)
+    run(service, service.copy, 'second')
+    time.sleep(0.15)  # Past the first copy's deadline, before the second's
+    assert clipboard.text == 'second' and not cleared.is_set()
+    assert cleared.wait(5) and clipboard.copies == ['first', 'second', '']
+
+
+def test_a_failing_job_does_not_stop_the_thread(service):
+    service, _, _ = service
+    service.run_soon(lambda: 1 / 0)
+    ran = threading.Event()
+    service.run_soon(ran.set)
+    assert ran.wait(5)
@@ -0,0 +1,177 @@
+"""Streaming import: parsing across chunk boundaries, early failure, bounded staging and export round trips."""
+import gzip
+import io
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from siamese_core import ConfigManager, JournalStore, PromptStreamReader
+
+
+def export(prompts) -> bytes:
+    return json.dumps({'settings': {'theme': 'dark'}, 'prompts': prompts}).encode('utf-8')
+
+
+@pytest.mark.parametrize('chunk', [1, 2, 3, 7, 64])
+def test_values_cut_at_any_chunk_boundary(monkeypatch, chunk):
+    monkeypatch.setattr(PromptStreamReader, 'CHUNK_SIZE', chunk)
+    prompts = [{'title': 'é\\u "x"', 'content': 'b' * 50, 'pinned': True, 'extra': [1.5e3, -2, None, False]}] * 3
+    assert list(PromptStreamReader(io.BytesIO(export(prompts))).prompts()) == prompts
+
+
+def test_malformed_value_fails_without_reading_on(monkeypatch):
+    monkeypatch.setattr(PromptStreamReader, 'CHUNK_SIZE', 1024)
+    data = b'{"prompts": [{"title": "a", "content": "b"}, {"title": } ' + b' ' * (1 << 20) + b']}'
+    reader = PromptStreamReader(io.BytesIO(data))
+    with pytest.raises(ValueError, match='invalid_format'):
+        list(reader.prompts())
+    assert reader.bytes_read < 64 * 1024
+
+
+def test_import_fills_sqlite_with_previews_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigManager, 'IMPORT_BATCH', 7)
+    path = tmp_path / 'export.json'
+    path.write_bytes(export([{'title': f't{i}', 'content': f'body {i} ' * 40} for i in range(50)]))
+    config = ConfigManager(config_dir=tmp_path / 'library')
+    config.set_storage('sqlite')
+    ok, message, summary = config.import_prompts(str(path))
+    assert (ok, message, summary['added']) == (True, 'import_success', 50)
+    assert all(p.content is None for p in config.prompts.values())
+    assert config.search('body 49') == [list(config.prompts)[-1]]
+    config.close()
+    reloaded = ConfigManager(config_dir=tmp_path / 'library')
+    assert [p.title for p in reloaded.prompts.values()] == [f't{i}' for i in range(50)]
+    reloaded.close()
+
+
+def test_json_import_journals_one_batch_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigManager, 'IMPORT_BATCH', 7)
+    path = tmp_path / 'export.json'
+    path.write_bytes(export([{'title': f't{i}', 'content': f'body {i}'} for i in range(50)]))
+    config = ConfigManager(config_dir=tmp_path / 'library')
+    writes = []
+    append_many = JournalStore.append_many
+    monkeypatch.setattr(JournalStore, 'append_many', lambda self, records: writes.append(
+        [len(r.get('prompts', ())) for r in records]) or append_many(self, records))
+    assert config.import_prompts(str(path))[:2] == (True, 'import_success')
+    config.flush()
+    assert writes[:8] == [[7]] * 7 + [[1]]  # Each batch on its own, then the commit record
+    config.close()
+    reloaded = ConfigManager(config_dir=tmp_path / 'library')
+    assert [p.title for p in reloaded.prompts.values()] == [f't{i}' for i in range(50)]
+    reloaded.close()
+
+
+def test_failed_batch_write_leaves_nothing_imported(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigManager, 'IMPORT_BATCH', 7)
+    path = tmp_path / 'export.json'
+    path.write_bytes(export([{'title': f't{i}', 'content': f'body {i}'} for i in range(50)]))
+    config = ConfigManager(config_dir=tmp_path / 'library')
+    kept = config.add_prompt('kept', 'body')
+    config.flush()
+    writes = []
+    append_many = JournalStore.append_many
+
+    def fail_third(self, records):
+        writes.append(records)
+        if len(writes) == 3:
+            raise OSError('disk full')
+        append_many(self, records)
+    monkeypatch.setattr(JournalStore, 'append_many', fail_third)
+    ok, _, _ = config.import_prompts(str(path))
+    assert not ok and list(config.prompts) == [kept]
+    assert config.search('body') == [kept]
+    monkeypatch.undo()
+    config.close()
+    reloaded = ConfigManager(config_dir=tmp_path / 'library')
+    assert list(reloaded.prompts) == [kept]  # The two batches on disk have no commit record
+    reloaded.close()
+
+
+def test_import_over_the_library_cap_is_not_a_file_size_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigManager, 'MAX_FILE_SIZE', 1000)
+    path = tmp_path / 'export.json'
+    path.write_bytes(export([{'title': f't{i}', 'content': 'x' * 100} for i in range(20)]))
+    config = ConfigManager(config_dir=tmp_path / 'library')
+    assert config.import_prompts(str(path))[:2] == (False, 'library_too_large')
+    assert not config.prompts
+    with pytest.raises(ValueError, match='library_too_large'):
+        config.add_prompt('big', 'x' * 2000)
+    config.close()
+
+
+def test_core_import_defers_storage_and_compression_modules():
+    deferred = ('sqlite3', 'lzma', 'gzip', 'pickle', 'tempfile', 'concurrent.futures')
+    loaded = subprocess.run([sys.executable, '-c', 'import sys, siamese_core; print(*sorted(sys.modules))'],
+                            capture_output=True, text=True, check=True, cwd=str(Path(__file__).parent.parent))
+    assert not set(deferred) & set(loaded.stdout.split())
+
+
+def test_corrupt_gzip_is_an_invalid_file(tmp_path):
+    path = tmp_path / 'prompts.json.gz'
+    path.write_bytes(gzip.compress(export([{'title': 't', 'content': 'c'}]))[:-12])
+    config = ConfigManager(config_dir=tmp_path / 'library')
+    assert config.import_prompts(str(path))[:2] == (False, 'invalid_format')
+    config.close()
+
+
+@pytest.mark.parametrize('name', ['out.json', 'out.json.gz', 'out.json.xz', 'out.ndjson', 'out.jsonl.gz'])
+def test_export_round_trips_through_import(tmp_path, name):
+    source = ConfigManager(config_dir=tmp_path / 'source')
+    source.add_prompt('plain', 'body')
+    source.add_prompt('unicode \u00e9\u4e2d', 'line one\nline "two"', pinned=True)
+    source.add_prompt('empty', '')
+    path = tmp_path / name
+    assert source.export_prompts(str(path)) == (True, 'export_success')
+    copy = ConfigManager(config_dir=tmp_path / 'copy')
+    ok, _, summary = copy.import_prompts(str(path))
+    assert ok and summary['added'] == 3
+    rows = lambda config: [(p['title'], p['content'], p['pinned'])
+                           for p in map(config.get_prompt, list(config.prompts))]
+    assert rows(copy) == rows(source)
+    source.close()
+    copy.close()
+
+
+def prompt_folder(root: Path) -> Path:
+    folder = root / 'prompts'
+    (folder / 'nested').mkdir(parents=True)
+    (folder / 'good.json').write_bytes(export([{'title': 'from json', 'content': 'a'}, {'title': 'pinned', 'content': 'b', 'pinned': True}]))
+    (folder / 'nested' / 'note.md').write_text('markdown body', encoding='utf-8')
+    (folder / 'lines.jsonl.gz').write_bytes(gzip.compress(b'{"title": "from ndjson", "content": "c"}\n'))
+    (folder / 'broken.json').write_text('{"prompts": [{"title": "x"', encoding='utf-8')
+    (folder / 'nested' / 'bad.ndjson').write_text('{"title": 1, "content": "c"}\n', encoding='utf-8')
+    (folder / 'latin1.txt').write_bytes('caf\xe9'.encode('latin-1'))
+    (folder / 'ignored.png').write_bytes(b'\x89PNG')
+    return folder
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_folder_import_reports_each_bad_file(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(ConfigManager, 'FOLDER_POOL_MIN', 0)  # Use the process pool unless workers=1
+    folder = prompt_folder(tmp_path)
+    config = ConfigManager(config_dir=tmp_path / 'library')
+    progress = []
+    ok, message, summary = config.import_folder(str(folder), progress=lambda *args: progress.append(args), workers=workers)
+    assert (ok, message) == (True, 'import_success')
+    assert sorted(summary['failed']) == [('broken.json', 'invalid_format'), ('latin1.txt', 'invalid_format'),
+                                         (str(Path('nested', 'bad.ndjson')), 'invalid_format')]
+    assert (summary['files'], summary['added']) == (3, 4)
+    assert sorted(p.title for p in config.prompts.values()) == ['from json', 'from ndjson', 'note', 'pinned']
+    assert progress[-1] == (6, 1.0)
+    config.close()
+
+
+def test_folder_import_of_an_oversized_file_is_reported_not_raised(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigManager, 'MAX_PROMPT_SIZE', 10)
+    folder = tmp_path / 'prompts'
+    folder.mkdir()
+    (folder / 'big.txt').write_text('x' * 100, encoding='utf-8')
+    (folder / 'small.txt').write_text('ok', encoding='utf-8')
+    config = ConfigManager(config_dir=tmp_path / 'library')
+    ok, _, summary = config.import_folder(str(folder), workers=1)
+    assert ok and summary['failed'] == [('big.txt', 'prompt_too_large')] and summary['added'] == 1
+    config.close()
@@ -0,0 +1,73 @@
+"""Local API: authentication, pipelined requests and error replies over one connection."""
+import json
+import socket
+
+import pytest
+
+from siamese_core import ConfigManager
+from siamese_ipc import IpcClient, IpcError, IpcServer
+
+
+@pytest.fixture
+def served(tmp_path):
+    config = ConfigManager(config_dir=tmp_path / 'library')
+    ids = [config.add_prompt(f'Prompt {i}', f'email body {i}') for i in range(5)]
+    copied = []
+
+    def on_copy(prompt_id):
+        if prompt_id == ids[4]:
+            raise RuntimeError('clipboard busy')
+        copied.append(prompt_id)
+    server = IpcServer(config, on_copy=on_copy, info_path=tmp_path / 'ipc.json')
+    server.start()
+    yield server, ids, copied
+    server.stop()
+    config.close()
+
+
+def raw_exchange(server, lines: list, replies: int) -> list:
+    with socket.create_connection(server.address, timeout=5) as sock:
+        sock.sendall(b''.join(json.dumps(line).encode('utf-8') + b'\n' for line in lines))
+        stream = sock.makefile('rb')
+        return [json.loads(line) for line in iter(stream.readline, b'')][:replies]
+
+
+def test_requests_before_auth_are_refused_and_the_connection_closed(served):
+    server, ids, _ = served
+    replies = raw_exchange(server, [{'id': 1, 'op': 'get', 'prompt_id': ids[0]},
+                                    {'id': 2, 'op': 'auth', 'token': server.token}], 2)
+    assert replies == [{'id': 1, 'ok': False, 'error': 'authentication required'}]
+    wrong = raw_exchange(server, [{'id': 1, 'op': 'auth', 'token': 'x' * 32}], 1)
+    assert wrong[0]['ok'] is False
+
+
+def test_pipelined_replies_come_back_in_order(served):
+    server, ids, copied = served
+    with IpcClient(server.info_path) as client:
+        results = client.pipeline([{'op': 'get', 'prompt_id': prompt_id} for prompt_id in ids]
+                                  + [{'op': 'search', 'query': 'body 3'}, {'op': 'copy', 'title': 'Prompt 1'},
+                                     {'op': 'ping'}])
+    assert [r['title'] for r in results[:5]] == [f'Prompt {i}' for i in range(5)]
+    assert [hit['id'] for hit in results[5]] == [ids[3]]
+    assert results[6:] == [ids[1], 5] and copied == [ids[1]]
+
+
+@pytest.mark.parametrize('request_, error', [
+    ({'op': 'nope'}, "unknown op: 'nope'"),
+    ({'op': 'get', 'title': 'missing'}, 'prompt not found'),
+    ({'op': 'search', 'query': 3}, 'query must be a string'),
+    ({'op': 'copy', 'title': 'Prompt 4'}, 'clipboard busy'),  # The handler itself failed
+])
+def test_errors_answer_the_request_and_keep_the_connection(served, request_, error):
+    server, ids, _ = served
+    with IpcClient(server.info_path) as client:
+        with pytest.raises(IpcError, match=error):
+            client.request(**request_)
+        assert client.request('ping') == 5
+
+
+def test_negative_limit_returns_no_results(served):
+    server, _, _ = served
+    with IpcClient(server.info_path) as client:
+        assert client.search('email', limit=-1) == []
+        assert len(client.search('email', limit=500)) == 5
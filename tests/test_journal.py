@@ -0,0 +1,239 @@
+"""Journal replay, torn writes, the lock file, write-behind batching and merging edits between instances."""
+import json
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from siamese_core import ConfigManager, FileLock, WriteBehind
+
+
+def content(config, prompt_id):
+    return config.get_prompt(prompt_id)['content']
+
+
+def test_replay_restores_unsaved_edits(tmp_path):
+    config = ConfigManager(config_dir=tmp_path)
+    kept = config.add_prompt('kept', 'one')
+    gone = config.add_prompt('gone', 'two')
+    config.update_prompt(kept, 'kept', 'edited', pinned=True)
+    config.delete_prompt(gone)
+    config.flush()  # Journaled but never compacted, as after a crash
+    reloaded = ConfigManager(config_dir=tmp_path)
+    assert list(reloaded.prompts) == [kept]
+    assert reloaded.get_prompt(kept) == {'id': kept, 'title': 'kept', 'content': 'edited', 'pinned': True}
+
+
+def test_torn_tail_is_ignored_then_truncated(tmp_path):
+    config = ConfigManager(config_dir=tmp_path)
+    first = config.add_prompt('first', 'body')
+    config.flush()
+    with open(tmp_path / 'prompts.journal', 'ab') as f:
+        f.write(b'{"seq": 99, "op": "add", "prompt": {"id": 1, "tit')  # Crash mid-append
+    reloaded = ConfigManager(config_dir=tmp_path)
+    assert list(reloaded.prompts) == [first]
+    second = reloaded.add_prompt('second', 'body')
+    reloaded.flush()
+    lines = (tmp_path / 'prompts.journal').read_bytes().splitlines(keepends=True)
+    assert all(line.endswith(b'\n') for line in lines)
+    assert [json.loads(line)['seq'] for line in lines] == [1, 2]
+    assert list(ConfigManager(config_dir=tmp_path).prompts) == [first, second]
+
+
+def test_generation_increases_across_instances(tmp_path):
+    a = ConfigManager(config_dir=tmp_path)
+    b = ConfigManager(config_dir=tmp_path)
+    a.add_prompt('a', 'x')
+    a.flush()
+    b.add_prompt('b', 'y')
+    b.flush()
+    a.add_prompt('c', 'z')
+    a.flush()
+    seqs = [json.loads(line)['seq'] for line in (tmp_path / 'prompts.journal').read_bytes().splitlines()]
+    assert seqs == [1, 2, 3]
+    assert a.reload_if_changed()
+    assert [p.title for p in a.prompts.values()] == ['a', 'c', 'b']  # Merged, not reloaded
+    assert not a.reload_if_changed()
+
+
+def test_concurrent_edits_follow_journal_order(tmp_path):
+    a = ConfigManager(config_dir=tmp_path)
+    prompt_id = a.add_prompt('shared', 'original')
+    a.flush()
+    b = ConfigManager(config_dir=tmp_path)
+    a.update_prompt(prompt_id, 'shared', 'from A')
+    a.flush()
+    b.update_prompt(prompt_id, 'shared', 'from B')
+    b.flush()  # Reads A's record first, so B's edit is the later one
+    a.reload_if_changed()
+    b.reload_if_changed()
+    assert content(a, prompt_id) == content(b, prompt_id) == 'from B'
+    assert content(ConfigManager(config_dir=tmp_path), prompt_id) == 'from B'
+    b.compact()
+    a.reload_if_changed()
+    assert content(a, prompt_id) == 'from B'
+    assert content(ConfigManager(config_dir=tmp_path), prompt_id) == 'from B'
+
+
+def test_pending_edit_wins_over_merged_record(tmp_path):
+    a = ConfigManager(config_dir=tmp_path)
+    prompt_id = a.add_prompt('shared', 'original')
+    a.flush()
+    b = ConfigManager(config_dir=tmp_path)
+    a.update_prompt(prompt_id, 'shared', 'from A')
+    a.flush()
+    b.update_prompt(prompt_id, 'shared', 'from B')  # Still queued for the writer
+    b.reload_if_changed()
+    assert content(b, prompt_id) == 'from B'
+    b.flush()
+    assert content(ConfigManager(config_dir=tmp_path), prompt_id) == 'from B'
+
+
+def test_merge_keeps_other_fields(tmp_path):
+    a = ConfigManager(config_dir=tmp_path)
+    prompt_id = a.add_prompt('shared', 'original')
+    a.flush()
+    b = ConfigManager(config_dir=tmp_path)
+    a.toggle_pin(prompt_id)
+    a.flush()
+    b.update_prompt(prompt_id, 'renamed', 'from B')
+    b.flush()
+    for config in (a, b, ConfigManager(config_dir=tmp_path)):
+        config.reload_if_changed()
+        assert config.get_prompt(prompt_id) == {'id': prompt_id, 'title': 'renamed', 'content': 'from B', 'pinned': True}
+
+
+def test_merge_follows_foreign_compaction(tmp_path):
+    a = ConfigManager(config_dir=tmp_path)
+    b = ConfigManager(config_dir=tmp_path)
+    first = b.add_prompt('first', 'x')
+    b.flush()
+    assert a.reload_if_changed()
+    b.add_prompt('second', 'y')
+    b.save_config()  # Folds 'second' in; the journal restarts with a marker
+    version = a.version
+    assert a.reload_if_changed()
+    assert [p.title for p in a.prompts.values()] == ['first', 'second']
+    assert a.version > version
+    a.update_prompt(first, 'first', 'edited')
+    a.flush()
+    b.reload_if_changed()
+    assert content(b, first) == 'edited'
+
+
+def hold_lock(path, ready, release):
+    with FileLock(path):
+        ready.set()
+        release.wait(10)
+
+
+def test_file_lock_excludes_other_processes(tmp_path):
+    path = tmp_path / 'prompts.lock'
+    ready, release = multiprocessing.Event(), multiprocessing.Event()
+    holder = multiprocessing.Process(target=hold_lock, args=(path, ready, release))
+    holder.start()
+    try:
+        assert ready.wait(10)
+        threading.Timer(0.2, release.set).start()
+        lock = FileLock(path)
+        start = time.perf_counter()
+        with lock:
+            with lock:  # Reentrant within a process
+                waited = time.perf_counter() - start
+        lock.close()
+        assert waited >= 0.2
+    finally:
+        release.set()
+        holder.join()
+
+
+def test_size_total_follows_edits_and_merges(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigManager, 'MAX_FILE_SIZE', 100)
+    a = ConfigManager(config_dir=tmp_path)
+    b = ConfigManager(config_dir=tmp_path)
+
+    def total(config):
+        return sum(p.content_length() for p in config.prompts.values())
+
+    first = a.add_prompt('first', 'x' * 40)
+    second = a.add_prompt('second', 'y' * 30)
+    a.update_prompt(first, 'first', 'x' * 10)
+    a.delete_prompt(second)
+    a.flush()
+    b.reload_if_changed()
+    b.update_prompt(first, 'first', 'z' * 60)
+    b.add_prompt('third', 'w' * 20)
+    b.save_config()  # Spills bodies to the blob; lengths must carry over
+    a.reload_if_changed()
+    for config in (a, b, ConfigManager(config_dir=tmp_path)):
+        assert config._content_size == total(config) == 80
+    a.add_prompt('fits', 'v' * 20)
+    with pytest.raises(ValueError, match='library_too_large'):
+        a.add_prompt('over', 'v')
+
+
+def test_prompts_from_before_ids_get_stable_ones(tmp_path):
+    legacy = [{'title': 'a', 'content': 'x', 'pinned': True}, {'title': 'b', 'content': 'y'}]
+    (tmp_path / 'prompts.json').write_text(json.dumps({'settings': {}, 'prompts': legacy}), encoding='utf-8')
+    a, b = ConfigManager(config_dir=tmp_path), ConfigManager(config_dir=tmp_path)
+    ids = list(a.prompts)
+    assert list(b.prompts) == ids and len(set(ids)) == 2  # Assigned once and written back by the first load
+    a.update_prompt(ids[1], 'b2', 'y2')
+    a.delete_prompt(ids[0])
+    a.flush()
+    assert b.reload_if_changed()
+    assert list(b.prompts) == [ids[1]] and b.get_prompt(ids[1])['title'] == 'b2'  # Addressed by id, not position
+    assert not hasattr(b.prompts[ids[1]], '__dict__')
+    a.close()
+    b.close()
+    reloaded = ConfigManager(config_dir=tmp_path)
+    assert list(reloaded.prompts) == [ids[1]]
+    reloaded.close()
+
+
+def test_pinned_index_follows_edits_and_merges(tmp_path):
+    a = ConfigManager(config_dir=tmp_path)
+    ids = [a.add_prompt(f'p{i}', 'body', pinned=i % 2 == 0) for i in range(6)]  # p0, p2 and p4 pinned
+    a.flush()
+    b = ConfigManager(config_dir=tmp_path)
+    assert a.toggle_pin(ids[5]) and not a.toggle_pin(ids[0])
+    a.delete_prompt(ids[2])
+    a.update_prompt(ids[4], 'p4 renamed', 'body')
+    a.flush()
+    expected = [ids[4], ids[5]]  # Library order, whatever order they were pinned in
+    assert [p.id for p in a.pinned_prompts()] == expected and a.pinned_count() == 2
+    assert b.reload_if_changed()
+    assert [p.id for p in b.pinned_prompts()] == expected
+    b.update_prompt(ids[1], 'p1', 'body', pinned=True)
+    b.flush()
+    a.reload_if_changed()
+    assert [p.id for p in a.pinned_prompts()] == [ids[1], ids[4], ids[5]]
+    a.record_use(ids[3])
+    a.record_use(ids[1])
+    assert [p.id for p in a.most_used(5)] == [ids[3]]  # Pinned prompts are already in the tray
+    a.close()
+    b.close()
+
+
+class RecordingStore:
+    def __init__(self):
+        self.calls = []
+
+    def append_many(self, records):
+        self.calls.append(list(records))
+
+
+def test_write_behind_coalesces_a_burst_and_flush_is_a_barrier():
+    writer = WriteBehind(0.2, on_error=print, on_written=lambda: None)
+    first, second = RecordingStore(), RecordingStore()
+    for i in range(50):
+        writer.submit(first, {'op': 'edit', 'n': i})
+    writer.submit_many(second, [{'op': 'add'}, {'op': 'delete'}])
+    assert writer.pending() and not first.calls
+    start = time.perf_counter()
+    writer.flush()  # Does not sit out the rest of the delay
+    assert time.perf_counter() - start < 0.15 and not writer.pending()
+    assert [len(call) for call in first.calls] == [50] and [r['n'] for r in first.calls[0]] == list(range(50))
+    assert second.calls == [[{'op': 'add'}, {'op': 'delete'}]]
+    writer.close()
@@ -0,0 +1,226 @@
+"""Several instances writing one library at once, on both storage backends.
+
+Each worker adds, edits and deletes its own prompts while merging the others' changes, with
+compaction and blob rewrites forced often. Afterwards every worker's final view of its own
+prompts must match a fresh load, and every body must be intact.
+
+    python tests/test_multiprocess.py --workers 4 --prompts 300   # a longer run
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from siamese_core import ConfigManager, FileLock, JournalStore, UsageTracker
+
+
+def work(directory: str, tag: str, count: int) -> None:
+    JournalStore.COMPACT_RECORDS = 30
+    ConfigManager.BLOB_SLACK = 0  # Rewrite the blob whenever it holds any garbage
+    config = ConfigManager(config_dir=Path(directory))
+    rng = random.Random(tag)
+    for i in range(count):
+        config.add_prompt(f'{tag}{i}', f'body {tag} {i} ' * 20)
+        mine = [p.id for p in config.prompts.values() if p.title.startswith(tag)]
+        if i % 2 == 0:
+            prompt_id = rng.choice(mine)
+            config.update_prompt(prompt_id, config.prompts[prompt_id].title, f'body edited {tag} ' * 30)
+        if i % 11 == 0 and len(mine) > 1:
+            config.delete_prompt(mine[0])
+        if i % 9 == 0:
+            config.reload_if_changed()
+        if i % 4 == 0:
+            config.flush()
+    config.close()
+    titles = sorted(p.title for p in config.prompts.values() if p.title.startswith(tag))
+    (Path(directory) / f'{tag}.out').write_text(json.dumps(titles))
+
+
+def run(directory: Path, workers: int, count: int, storage: str = 'json') -> None:
+    config = ConfigManager(config_dir=directory)
+    config.set_storage(storage)
+    config.close()
+    tags = [chr(ord('A') + i) for i in range(workers)]
+    processes = [multiprocessing.Process(target=work, args=(str(directory), tag, count)) for tag in tags]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0] * workers
+    fresh = ConfigManager(config_dir=directory)
+    for tag in tags:
+        expected = json.loads((directory / f'{tag}.out').read_text())
+        assert sorted(p.title for p in fresh.prompts.values() if p.title.startswith(tag)) == expected
+    assert all(fresh.get_prompt(prompt_id)['content'].startswith('body') for prompt_id in fresh.prompts)
+    fresh.close()
+
+
+@pytest.mark.parametrize('storage', ['json', 'sqlite'])
+def test_instances_agree(tmp_path, storage):
+    run(tmp_path, workers=4, count=120, storage=storage)
+
+
+def test_sqlite_merges_changed_rows_without_reloading(tmp_path, monkeypatch):
+    a = ConfigManager(config_dir=tmp_path)
+    a.set_storage('sqlite')
+    kept = a.add_prompt('kept', 'alpha body')
+    gone = a.add_prompt('gone', 'beta body')
+    a.flush()
+    assert a.search('alpha') == [kept]
+    b = ConfigManager(config_dir=tmp_path)
+    b.update_prompt(kept, 'kept', 'gamma body', pinned=True)
+    b.delete_prompt(gone)
+    added = b.add_prompt('added', 'delta body')
+    b.flush()
+    monkeypatch.setattr(a, 'load_config', lambda: pytest.fail('reloaded instead of merging'))
+    assert a.reload_if_changed()
+    assert list(a.prompts) == [kept, added]
+    assert a.get_prompt(kept) == {'id': kept, 'title': 'kept', 'content': 'gamma body', 'pinned': True}
+    assert a.search('gamma', fuzzy=True)[:1] == [kept] and a.search('alpha', fuzzy=True) == []
+    assert a._index is None  # FTS answered every search
+    assert a._content_size == sum(p.content_length() for p in a.prompts.values())
+    assert not a.reload_if_changed()
+    a.close()
+    b.close()
+
+
+def test_sqlite_merge_keeps_duplicate_detection_current(tmp_path):
+    a = ConfigManager(config_dir=tmp_path)
+    a.set_storage('sqlite')
+    edited = a.add_prompt('edited', 'alpha body')
+    a.flush()
+    assert a.find_duplicate('edited', 'alpha body') == edited  # Builds the dedup index
+    b = ConfigManager(config_dir=tmp_path)
+    b.update_prompt(edited, 'edited', 'gamma body')
+    b.flush()
+    assert a.reload_if_changed()
+    assert a.find_duplicate('edited', 'alpha body') is None
+    assert a.find_duplicate('edited', 'gamma body') == edited
+    assert a._digest_of == {edited: a._digest('edited', 'gamma body')}
+    a.close()
+    b.close()
+
+
+def test_sqlite_reloads_when_change_log_was_pruned(tmp_path, monkeypatch):
+    a = ConfigManager(config_dir=tmp_path)
+    a.set_storage('sqlite')
+    a.flush()
+    b = ConfigManager(config_dir=tmp_path)
+    monkeypatch.setattr(type(b.backend), 'CHANGE_LOG_ROWS', 2)
+    ids = [b.add_prompt(f'p{i}', 'x') for i in range(10)]
+    b.flush()
+    assert a.reload_if_changed()
+    assert list(a.prompts) == ids
+    a.close()
+    b.close()
+
+
+
+def test_usage_counts_of_instances_add_up(tmp_path):
+    lock = FileLock(tmp_path / 'prompts.lock')
+    a, b = UsageTracker(tmp_path / 'usage.json', lock), UsageTracker(tmp_path / 'usage.json', lock)
+    a.record(1)
+    a.record(1)
+    a.record(3)
+    b.record(1)
+    b.record(2)
+    a.flush()
+    b.flush()  # Used to overwrite a's counts with its own
+    b.forget(3)
+    b.flush()
+    a.record(2)
+    a.flush()
+    counts = {prompt_id: entry[0] for prompt_id, entry in UsageTracker(tmp_path / 'usage.json', lock)._usage.items()}
+    assert counts == {1: 3, 2: 2}
+    assert set(a.scores()) == {1, 2} and a.scores()[1] == pytest.approx(3, rel=1e-3)
+
+
+def test_bodies_spill_to_the_blob_and_are_read_by_other_instances(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigManager, 'BLOB_SLACK', 0)
+    a = ConfigManager(config_dir=tmp_path)
+    ids = [a.add_prompt(f'p{i}', f'тело {i} ✓ ' * 200) for i in range(6)]
+    a.save_config()
+    assert all(p.content is None and p.body is not None for p in a.prompts.values())
+    snapshot = json.loads((tmp_path / 'prompts.json').read_text(encoding='utf-8'))
+    assert not any('content' in prompt for prompt in snapshot['prompts'])  # Previews and blob offsets only
+    b = ConfigManager(config_dir=tmp_path)
+    assert all(p.content is None for p in b.prompts.values())
+    assert b.get_prompt(ids[3])['content'] == 'тело 3 ✓ ' * 200
+    b.update_prompt(ids[3], 'p3', 'edited by b')
+    b.save_config()  # Appended to the same blob
+    assert b.bodies.name == 'prompts.0.blob'
+    assert a.reload_if_changed()
+    assert a.get_prompt(ids[3])['content'] == 'edited by b'
+    assert a.get_prompt(ids[4])['content'] == 'тело 4 ✓ ' * 200
+    for prompt_id in ids[:5]:
+        a.delete_prompt(prompt_id)
+    a.save_config()  # Garbage outweighs the one live body: rewritten
+    assert a.bodies.name == 'prompts.1.blob'
+    assert (tmp_path / 'prompts.1.blob').stat().st_size == len(('тело 5 ✓ ' * 200).encode('utf-8'))
+    assert b.reload_if_changed() and b.bodies.name == 'prompts.1.blob'
+    assert list(b.prompts) == [ids[5]] and b.get_prompt(ids[5])['content'] == 'тело 5 ✓ ' * 200
+    a.close()
+    b.close()
+    c = ConfigManager(config_dir=tmp_path)
+    assert c.get_prompt(ids[5])['content'] == 'тело 5 ✓ ' * 200
+    c.close()
+
+
+def test_blob_retired_by_another_instance_stays_readable(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigManager, 'BLOB_SLACK', 0)
+    a = ConfigManager(config_dir=tmp_path)
+    ids = [a.add_prompt(f'p{i}', f'body {i} ' * 50) for i in range(3)]
+    a.save_config()  # Bodies now live in prompts.0.blob
+    b = ConfigManager(config_dir=tmp_path)  # Loaded, but has not read a body yet
+    a.delete_prompt(ids[0])
+    a.delete_prompt(ids[1])
+    a.save_config()  # Mostly garbage: rewritten as prompts.1.blob and the old one removed
+    assert a.bodies.name == 'prompts.1.blob'
+    assert b.get_prompt(ids[2])['content'] == 'body 2 ' * 50
+    assert b.get_prompt(ids[0])['content'] == 'body 0 ' * 50  # Not merged yet
+    assert b.reload_if_changed()
+    assert list(b.prompts) == [ids[2]] and b.get_prompt(ids[2])['content'] == 'body 2 ' * 50
+    if sys.platform != 'win32':  # Windows keeps the file while b had it open; a later compaction removes it
+        assert sorted(path.name for path in tmp_path.glob('prompts.*.blob')) == ['prompts.1.blob']
+    a.close()
+    b.close()
+
+
+def test_load_that_raced_a_blob_rewrite_loads_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigManager, 'BLOB_SLACK', 0)
+    a = ConfigManager(config_dir=tmp_path)
+    ids = [a.add_prompt(f'p{i}', f'body {i} ' * 50) for i in range(3)]
+    a.save_config()
+    load = JournalStore.load
+
+    def load_then_compact(store):
+        loaded = load(store)
+        if store is not a.store and not a.store.has_records() and len(a.prompts) == 3:
+            a.delete_prompt(ids[0])
+            a.delete_prompt(ids[1])
+            a.save_config()  # Retires the blob the snapshot we just read names
+        return loaded
+
+    monkeypatch.setattr(JournalStore, 'load', load_then_compact)
+    b = ConfigManager(config_dir=tmp_path)
+    assert list(b.prompts) == [ids[2]] and b.bodies.name == 'prompts.1.blob'
+    assert b.get_prompt(ids[2])['content'] == 'body 2 ' * 50
+    a.close()
+    b.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--prompts', type=int, default=300)
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        run(Path(tmp), args.workers, args.prompts, args.storage)
+    print('consistent')
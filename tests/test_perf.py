@@ -0,0 +1,46 @@
+"""Perf counters and the session profiler behind SIAMESE_PERF and SIAMESE_PROFILE."""
+import pstats
+import sys
+import threading
+
+import pytest
+
+from siamese_core import PerfStats, SessionProfiler
+
+
+def test_disabled_stats_leave_functions_undecorated():
+    stats = PerfStats('')
+    func = lambda: 1
+    assert stats.timed('x')(func) is func
+    stats.record('x', 1.0)
+    stats.add('bytes', 10)
+    assert stats.snapshot() == {'series': {}, 'counters': {}}
+
+
+def test_percentiles_and_counters():
+    stats = PerfStats('1')
+    for i in range(1, 101):
+        stats.record('save', i / 1000)
+    stats.add('bytes', 5)
+    stats.add('bytes', 7)
+    snapshot = stats.snapshot()
+    assert snapshot['series']['save'] == {'count': 100, 'p50': 0.051, 'p95': 0.096, 'max': 0.1, 'unit': 's'}
+    assert snapshot['counters'] == {'bytes': 12}
+    assert 'save' in stats.report()
+
+
+def worker_only_function():
+    return sum(i * i for i in range(1000))
+
+
+@pytest.mark.skipif(sys.version_info >= (3, 12), reason='one cProfile profiler at a time')
+def test_profile_merges_worker_threads(tmp_path):
+    profiler = SessionProfiler()
+    profiler.enable()
+    thread = threading.Thread(target=worker_only_function)
+    thread.start()
+    thread.join()
+    profiler.dump(str(tmp_path / 'session.prof'))
+    functions = {name for _, _, name in pstats.Stats(str(tmp_path / 'session.prof')).stats}
+    assert {'worker_only_function', 'join'} <= functions  # The worker's calls and the main thread's
+    assert threading._profile_hook is None  # Threads started later are left alone
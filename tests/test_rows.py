@@ -0,0 +1,80 @@
+"""Prompt list: Treeview rows are diffed into place instead of rebuilt (Windows-only GUI module)."""
+import random
+
+import pytest
+
+pytest.importorskip('winreg')
+pytest.importorskip('pystray')
+from Siamese import PromptManagerWindow  # noqa: E402
+
+
+class FakeTree:
+    """Just the ttk.Treeview calls _apply_rows makes, counted."""
+    def __init__(self):
+        self.iids, self.items, self.calls = [], {}, []
+        self.selected = ()
+
+    def delete(self, *iids):
+        self.calls.append('delete')
+        self.iids = [iid for iid in self.iids if iid not in iids]
+
+    def move(self, iid, parent, pos):
+        self.calls.append('move')
+        self.iids.remove(iid)
+        self.iids.insert(pos, iid)
+
+    def insert(self, parent, pos, iid, values, tags):
+        self.calls.append('insert')
+        self.iids.insert(pos, iid)
+        self.items[iid] = (values, tags)
+
+    def item(self, iid, values, tags):
+        self.calls.append('item')
+        self.items[iid] = (values, tags)
+
+    def selection(self):
+        return self.selected
+
+    def selection_set(self, iid):
+        self.selected = (iid,)
+
+
+def window():
+    view = object.__new__(PromptManagerWindow)
+    view.tree, view._cells, view._order, view._selected = FakeTree(), {}, [], None
+    return view
+
+
+def rows(ids, edited=()):
+    return [(str(i), (f'title {i}' + (' edited' if i in edited else ''), '', ''), ('evenrow',)) for i in ids]
+
+
+def shown(view):
+    return [(iid, *view.tree.items[iid]) for iid in view.tree.iids]
+
+
+def test_random_updates_end_in_the_desired_rows():
+    view, rng = window(), random.Random(6)
+    for _ in range(200):
+        desired = rows(rng.sample(range(40), rng.randrange(30)), edited=set(rng.sample(range(40), 5)))
+        view._apply_rows(desired)
+        assert shown(view) == desired and view._order == [iid for iid, _, _ in desired]
+
+
+def test_small_changes_touch_only_the_changed_rows():
+    view = window()
+    view._apply_rows(rows(range(100)))
+    view.tree.calls.clear()
+    view._apply_rows(rows([i for i in range(100) if i != 50], edited={7}))
+    assert sorted(view.tree.calls) == ['delete', 'item']
+    view.tree.calls.clear()
+    view._apply_rows(rows([99] + list(range(99)), edited={7}))  # 99 to the top, 50 back
+    assert sorted(view.tree.calls) == ['insert', 'move']
+
+
+def test_selection_survives_the_row_being_rebuilt():
+    view = window()
+    view._apply_rows(rows(range(5)))
+    view._selected = '3'
+    view._apply_rows(rows(range(5)))
+    assert view.tree.selected == ('3',)
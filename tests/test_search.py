@@ -0,0 +1,167 @@
+"""The search index against a linear scan, and the SQLite backend against the index."""
+import random
+import threading
+import time
+
+import pytest
+
+from siamese_core import BodyCache, ConfigManager, SearchCancelled, SearchIndex
+
+WORDS = ['alpha', 'Beta', 'gamma', 'review', 'Code', '数据模型', 'title', 'ab', 'x', 'Über', 'naïve']
+QUERIES = ['a', 'x', 'ab', 'ü', '数', '数据', '据模型', 'view', 'revi', 'a b', 'ta g', 'edited', 'zz', 'e ']
+
+
+def library(seed: int = 1, size: int = 300) -> dict:
+    rng = random.Random(seed)
+    return {key: (' '.join(rng.choices(WORDS, k=rng.randint(1, 3))), ' '.join(rng.choices(WORDS, k=rng.randint(0, 30))))
+            for key in range(1, size + 1)}
+
+
+def scan(prompts: dict, query: str) -> set:
+    return {key for key, (title, content) in prompts.items() if query in title.lower() or query in content.lower()}
+
+
+def indexed(prompts: dict, postings: bool, budget: int = None) -> SearchIndex:
+    index = SearchIndex(BodyCache(budget))
+    index.INDEX_MIN_CHARS = 0 if postings else float('inf')
+    index.SEGMENT_CHARS = 2000  # Several segments, and later adds filling new ones
+    for key, (title, content) in prompts.items():
+        index.add(key, title, content)
+    assert index.wait_built() == postings
+    return index
+
+
+@pytest.mark.parametrize('postings', [False, True])
+def test_index_matches_linear_scan_through_edits(monkeypatch, postings):
+    monkeypatch.setattr(SearchIndex, 'RENUMBER_SLACK', 0)
+    prompts = library()
+    index = indexed(prompts, postings, budget=140_000)  # Postings fit; many bodies compressed
+    for key in list(prompts)[::3]:
+        index.remove(key)
+        del prompts[key]
+    for key in list(prompts)[::4]:
+        title, content = prompts[key]
+        prompts[key] = (title, content + ' edited')
+        index.add(key, *prompts[key])  # Replaces the old entry
+    for query in QUERIES:
+        assert index.search(query) == scan(prompts, query), query
+    for key in list(prompts)[::2]:  # Enough removals to renumber the documents and rebuild the postings
+        index.remove(key)
+        del prompts[key]
+    assert len(index._keys) < 2 * len(prompts)
+    assert index.wait_built() == postings
+    for query in QUERIES:
+        assert index.search(query) == scan(prompts, query), query
+
+
+def test_postings_over_budget_are_dropped_for_a_scan():
+    prompts = library()
+    index = indexed(prompts, True)
+    titles, postings = index._footprint()
+    index.set_budget(titles + postings)  # Postings over half of it
+    assert not index.ready and index.over_budget and index.wait_built() is False
+    assert index.contents.budget == postings  # What the titles leave of the budget
+    for query in QUERIES:
+        assert index.search(query) == scan(prompts, query), query
+    index.set_budget(None)
+    assert index.wait_built() and index.contents.budget is None
+    assert not index.stats()['index_over_budget'] and index.stats()['index_bytes'] > titles
+
+
+def test_fuzzy_ranks_the_same_by_scan_and_postings():
+    prompts = library(seed=2)
+    scanned, posted = indexed(prompts, False), indexed(prompts, True)
+    for query in QUERIES + ['reveiw', 'gama', 'alpa bet', 'dode', 'titel', 'bta', 'uber', 'naive']:
+        assert scanned.search_fuzzy(query, 20) == posted.search_fuzzy(query, 20), query
+
+
+@pytest.mark.parametrize('query', QUERIES + ['reveiw', 'gama', 'alpa bet', 'dode', 'titel', 'bta'])
+def test_sqlite_search_matches_index(tmp_path, query):
+    config = ConfigManager(config_dir=tmp_path)
+    config.set_storage('sqlite')
+    for title, content in library(size=120).values():
+        config.add_prompt(title, content)
+    index = SearchIndex()
+    for prompt in config.prompts.values():
+        index.add(prompt.id, prompt.title, config.get_prompt(prompt.id)['content'])
+    assert config.search(query) == sorted(index.search(query), key=lambda key: config.prompts[key].order)
+    assert config.search(query, fuzzy=True) == index.search_fuzzy(query, config.FUZZY_LIMIT)
+    assert config._index is None
+    config.close()
+
+
+CASE_TEXTS = [('İstanbul notları', 'ΟΔΟΣ ΣΟΦΌΣ'), ('Ελληνικά', 'κείμενα για τον Λόγο'),
+              ('Crème BRÛLÉE', 'Straße und STRASSE'), ('ᏣᎳᎩ', 'Cherokee syllabary'), ('plain', 'odos istanbul')]
+CASE_QUERIES = ['i̇stan', 'stanbul', 'İstanbul', 'ist', 'οδος', 'οδοσ', 'σοφός', 'σοφοσ', 'ελλην', 'ελληνικα',
+                'λόγο', 'brûlée', 'brulee', 'rème', 'straße', 'strasse', 'ꮳꮃꭹ', 'ᏣᎳᎩ']
+
+
+def test_sqlite_and_index_agree_on_case(tmp_path):
+    """FTS case folding differs from str.lower on these; the SQLite backend must not."""
+    json_config, sqlite_config = ConfigManager(config_dir=tmp_path / 'json'), ConfigManager(config_dir=tmp_path / 'db')
+    sqlite_config.set_storage('sqlite')
+    for config in (json_config, sqlite_config):
+        for title, content in CASE_TEXTS:
+            config.add_prompt(title, content)
+    titles = lambda config, hits: [config.prompts[prompt_id].title for prompt_id in hits]
+    for query in CASE_QUERIES:
+        assert titles(sqlite_config, sqlite_config.search(query)) == titles(json_config, json_config.search(query)), query
+    assert titles(sqlite_config, sqlite_config.search('i̇stan')) == ['İstanbul notları']
+    assert sqlite_config.search('οδοσ') == []  # FTS folds ς to σ; str.lower keeps the final sigma
+    json_config.close()
+    sqlite_config.close()
+
+
+def test_sqlite_index_from_before_lowercasing_is_redone(tmp_path):
+    config = ConfigManager(config_dir=tmp_path)
+    config.set_storage('sqlite')
+    prompt_id = config.add_prompt('İstanbul notları', 'body')
+    config.flush()
+    conn = config.backend.conn
+    old_schema = config.backend.FTS_SCHEMA.replace('lower_text(', '(').format(tokenizer='trigram')
+    conn.executescript('DROP TRIGGER prompts_ai; DROP TRIGGER prompts_ad; DROP TRIGGER prompts_au; ' + old_schema
+                       + "INSERT INTO prompts_fts(prompts_fts) VALUES ('rebuild');")  # As an earlier version left it
+    assert config.search('i̇stan') == []
+    config.close()
+    config = ConfigManager(config_dir=tmp_path)
+    assert config.search('i̇stan') == [prompt_id]
+    config.update_prompt(prompt_id, 'Ankara', 'body')
+    assert config.search('i̇stan') == [] and config.search('ankara') == [prompt_id]
+    config.close()
+
+
+@pytest.mark.parametrize('storage', ['json', 'sqlite'])
+@pytest.mark.parametrize('typo, title', [('reveiw', 'Code review checklist'), ('titel', 'Title 1'),
+                                         ('revew', 'Code review checklist'), ('chekclist', 'Code review checklist')])
+def test_fuzzy_finds_short_words_one_typo_away(tmp_path, storage, typo, title):
+    config = ConfigManager(config_dir=tmp_path)
+    config.set_storage(storage)
+    for other in ('Meeting notes', 'Translate to French', 'Titles and reviews'):
+        config.add_prompt(other, 'Nothing to see here')
+    wanted = config.add_prompt(title, 'Body text')
+    assert config.search(typo, fuzzy=True)[0] == wanted
+    config.close()
+
+
+def test_index_builds_in_slices_around_edits(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigManager, 'INDEX_SLICE', 0.002)  # Loading the texts is quick; keep slices well under it
+    config = ConfigManager(config_dir=tmp_path)
+    ids = [config.add_prompt(f'p{i}', f'needle {i} ' + 'filler text ' * 200) for i in range(4000)]
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(SearchCancelled):
+        config.search('needle', cancel=cancel)
+    thread = threading.Thread(target=config.search, args=('needle',))
+    start = time.perf_counter()
+    thread.start()
+    waits = []
+    for prompt_id in ids[::2]:  # Edits while the index is being built
+        before = time.perf_counter()
+        config.delete_prompt(prompt_id)
+        waits.append(time.perf_counter() - before)
+    late = config.add_prompt('late', 'needle late')
+    thread.join()
+    build = time.perf_counter() - start
+    assert max(waits) < build / 4  # Never waited out the whole build
+    assert set(config.search('needle')) == set(ids[1::2]) | {late}
+    config.close()
@@ -0,0 +1,79 @@
+"""The binary snapshot: used when it matches prompts.json, ignored in favour of the JSON otherwise."""
+import json
+import struct
+import zlib
+
+import pytest
+
+from siamese_core import BinarySnapshot, ConfigManager
+
+
+def library(tmp_path):
+    config = ConfigManager(config_dir=tmp_path)
+    ids = [config.add_prompt(f'título {i}', f'body {i} ' * 40, pinned=i == 1) for i in range(5)]
+    config.save_config()
+    config.close()
+    return ids
+
+
+def load(tmp_path, monkeypatch):
+    """A fresh instance, and whether its load took its prompts from the binary copy."""
+    used = []
+    read = BinarySnapshot.read
+    monkeypatch.setattr(BinarySnapshot, 'read', lambda self: used.append(read(self)) or used[-1])
+    config = ConfigManager(config_dir=tmp_path)
+    return config, used[0] is not None
+
+
+def contents(config):
+    return [config.get_prompt(prompt_id) for prompt_id in config.prompts]
+
+
+def test_matching_copy_is_used(tmp_path, monkeypatch):
+    ids = library(tmp_path)
+    config, binary = load(tmp_path, monkeypatch)
+    assert binary and list(config.prompts) == ids
+    assert config.get_prompt(ids[1]) == {'id': ids[1], 'title': 'título 1', 'content': 'body 1 ' * 40, 'pinned': True}
+
+
+def rewrite_header(path, **changes):
+    """Change header fields and recompute the checksum, as a writer bug would."""
+    raw = path.read_bytes()
+    names = ('magic', 'version', 'reserved', 'json_size', 'json_mtime', 'count', 'length')
+    fields = dict(zip(names, BinarySnapshot.FIELDS.unpack_from(raw)))
+    fields.update(changes)
+    packed = BinarySnapshot.FIELDS.pack(*fields.values())
+    payload = raw[BinarySnapshot.HEADER.size:]
+    path.write_bytes(packed + struct.pack('<I', zlib.crc32(payload, zlib.crc32(packed))) + payload)
+
+
+@pytest.mark.parametrize('damage', ['payload byte', 'header count', 'truncated', 'empty', 'bad record count'])
+def test_damaged_copy_falls_back_to_json(tmp_path, monkeypatch, damage):
+    ids = library(tmp_path)
+    path = tmp_path / 'prompts.snap'
+    raw = bytearray(path.read_bytes())
+    if damage == 'payload byte':
+        raw[-3] ^= 0xFF
+    elif damage == 'header count':
+        raw[BinarySnapshot.FIELDS.size - 12] ^= 0x01  # Covered by the checksum too
+    elif damage == 'truncated':
+        raw = raw[:len(raw) // 2]
+    elif damage == 'empty':
+        raw = b''
+    path.write_bytes(bytes(raw))
+    if damage == 'bad record count':
+        rewrite_header(path, count=len(ids) + 1)
+    config, binary = load(tmp_path, monkeypatch)
+    assert not binary
+    assert list(config.prompts) == ids
+    assert [p['content'] for p in contents(config)] == [f'body {i} ' * 40 for i in range(5)]
+
+
+def test_copy_older_than_json_is_ignored(tmp_path, monkeypatch):
+    ids = library(tmp_path)
+    data = json.loads((tmp_path / 'prompts.json').read_text(encoding='utf-8'))
+    data['prompts'] = data['prompts'][:2]  # Edited by hand, without the app
+    (tmp_path / 'prompts.json').write_text(json.dumps(data), encoding='utf-8')
+    config, binary = load(tmp_path, monkeypatch)
+    assert not binary
+    assert list(config.prompts) == ids[:2]